@@ -0,0 +1,100 @@
+# =============================================================================
+# Compares building the stop level TXC objects directly from the parsed xml tree
+# (TXCObjectBuilder) against the previous path of xml -> xmltodict nested dicts ->
+# dacite.from_dict, on a synthetic TXC file.
+#
+# Reports the time taken to build the object graph, the peak python memory while
+# building it and the memory retained by the finished objects. Memory is measured
+# with tracemalloc, so it covers python objects only (not the lxml tree itself,
+# which both paths need for the service level fields).
+#
+# The previous path needs xmltodict and dacite, which the package no longer
+# depends on: pip install xmltodict dacite
+#
+# usage: python benchmarks/benchmark_object_builder.py [vehicle_journeys] [stops]
+# =============================================================================
+import gc
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'BODSDataExtractor'))
+
+import lxml.etree as ET
+import xmltodict
+from dacite import from_dict
+
+# take the dataclasses from txc_builder, so both paths build the same classes however the package is imported
+from txc_builder import TXCObjectBuilder, JourneyPatternSections, VehicleJourneys, Service, StopPoints
+from synthetic_txc import synthetic_txc
+
+
+def build_with_xmltodict_and_dacite(xml_bytes):
+    """The previous stop level path: parse to dicts, then type check into the dataclasses"""
+
+    xml_json = xmltodict.parse(
+        xml_bytes,
+        process_namespaces=False,
+        attr_prefix='_',
+        force_list=(
+            'JourneyPatternSection',
+            'JourneyPatternTimingLink',
+            'VehicleJourney',
+            'VehicleJourneyTimingLink',
+            'JourneyPattern'))['TransXChange']
+
+    services_json = xml_json['Services']['Service']
+    if isinstance(services_json['Lines']['Line'], dict):
+        services_json['Lines']['Line'] = [services_json['Lines']['Line']]
+
+    return [
+        from_dict(data_class=JourneyPatternSections, data=xml_json['JourneyPatternSections']),
+        from_dict(data_class=VehicleJourneys, data=xml_json['VehicleJourneys']),
+        from_dict(data_class=Service, data=services_json),
+        from_dict(data_class=StopPoints, data=xml_json['StopPoints']),
+    ]
+
+
+def build_with_builder(root):
+    """The direct path: populate the dataclasses from the tree already parsed for the service level fields"""
+
+    builder = TXCObjectBuilder(root.nsmap.get(None))
+    sections = {ET.QName(section).localname: section for section in root if isinstance(section.tag, str)}
+
+    return [
+        builder.build_journey_pattern_sections(sections['JourneyPatternSections']),
+        builder.build_vehicle_journeys(sections['VehicleJourneys']),
+        builder.build_service(sections['Services']),
+        builder.build_stop_points(sections['StopPoints']),
+    ]
+
+
+def measure(label, build, argument):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    objects = build(argument)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'{label:<28}{elapsed:>10.2f} s{peak / 1e6:>14.1f} MB{retained / 1e6:>16.1f} MB')
+    return objects
+
+
+if __name__ == "__main__":
+    vehicle_journeys = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    stops = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+
+    xml_bytes = synthetic_txc(vehicle_journeys=vehicle_journeys, stops=stops)
+    root = ET.parse(io.BytesIO(xml_bytes)).getroot()
+
+    print(f'Synthetic TXC file: {len(xml_bytes) / 1e6:.1f} MB, {vehicle_journeys:,} vehicle journeys, {stops} stops\n')
+    print(f'{"path":<28}{"build time":>12}{"peak memory":>17}{"retained memory":>19}')
+
+    previous = measure('xmltodict + dacite', build_with_xmltodict_and_dacite, xml_bytes)
+    direct = measure('TXCObjectBuilder', build_with_builder, root)
+
+    print(f'\nObject graphs identical: {previous == direct}')
@@ -0,0 +1,86 @@
+# =============================================================================
+# Compares the two ways of making the extracted records of many xml files into
+# the extract's dataframe: a one row dataframe per file (pd.DataFrame(record).T),
+# concatenated per dataset and again across datasets, against appending each
+# record to a RecordBuilder per dataset and making one dataframe at the end.
+#
+# The records are those extract_xml gives for a few synthetic TXC files,
+# repeated to make up the number of files asked for, so only the cost of
+# accumulating them is measured (not parsing).
+#
+# usage: python benchmarks/benchmark_records.py [files] [datasets]
+# =============================================================================
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'BODSDataExtractor'))
+
+import pandas as pd
+
+from extractor import extract_xml, xml_columns
+from records import RecordBuilder
+from synthetic_txc import synthetic_txc
+
+
+def per_file_dataframes(datasets, columns):
+    """The previous path: a transposed one row dataframe per file, concatenated per dataset, then across datasets"""
+
+    extracted = []
+    for records in datasets:
+        output = []
+        for record in records:
+            output_df = pd.DataFrame(record).T
+            output_df.columns = columns
+            output.append(output_df)
+        extracted.append(pd.concat(output))
+
+    return pd.concat(extracted)
+
+
+def record_builders(datasets, columns):
+    """The columnar path: a RecordBuilder per dataset, extended into one for the extract, made into a dataframe once"""
+
+    extracted = []
+    for records in datasets:
+        builder = RecordBuilder(columns)
+        for record in records:
+            builder.append(record)
+        extracted.append(builder)
+
+    xml_records = RecordBuilder(columns)
+    for builder in extracted:
+        xml_records.extend(builder)
+
+    return xml_records.to_frame()
+
+
+def measure(label, build, datasets, columns):
+    start = time.perf_counter()
+    xml_table = build(datasets, columns)
+    elapsed = time.perf_counter() - start
+
+    print(f'{label:<24}{elapsed:>10.2f} s')
+    return xml_table
+
+
+if __name__ == "__main__":
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    dataset_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    samples = [extract_xml('https://example.com/dataset/', io.BytesIO(synthetic_txc(vehicle_journeys=10, seed=seed,
+                                                                                     service_code=f'PB000000{seed}:1')))
+               for seed in range(1, 6)]
+    columns = xml_columns()
+
+    records = [samples[i % len(samples)] for i in range(files)]
+    datasets = [records[i::dataset_count] for i in range(dataset_count)]
+
+    print(f'{files:,} xml files in {dataset_count:,} datasets\n')
+    print(f'{"path":<24}{"time":>12}')
+
+    previous = measure('dataframe per file', per_file_dataframes, datasets, columns)
+    columnar = measure('RecordBuilder', record_builders, datasets, columns)
+
+    print(f'\nDataframes identical: {previous.reset_index(drop=True).equals(columnar)}')
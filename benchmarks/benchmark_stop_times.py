@@ -0,0 +1,60 @@
+# =============================================================================
+# Compares the memory of the collated (wide) timetables of a service against
+# its long format trips, stop times and stops tables (see StopTimes), and the
+# time to build the timetables with and without the long format tables, for a
+# synthetic TXC file.
+#
+# usage: python benchmarks/benchmark_stop_times.py [vehicle_journeys] [stops]
+# =============================================================================
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'BODSDataExtractor'))
+
+from extractor import TimetableExtractor, xmlDataExtractor
+from synthetic_txc import synthetic_txc
+from timetable_builder import build_timetables
+
+
+def memory_mb(tables):
+    """The memory of some dataframes, including the strings they hold, in MB"""
+
+    return sum(table.memory_usage(deep=True).sum() for table in tables) / 1e6
+
+
+def measure(timetable_args, stop_times):
+    start = time.perf_counter()
+    outbound, inbound, long, error = build_timetables(timetable_args, stop_times)
+    elapsed = time.perf_counter() - start
+
+    if error is not None:
+        raise RuntimeError(error)
+
+    return elapsed, (outbound, inbound), long
+
+
+if __name__ == "__main__":
+    vehicle_journeys = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    stops = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+
+    xml = synthetic_txc(vehicle_journeys=vehicle_journeys, stops=stops)
+    _, (jps_objects, vj_objects, service_object, stop_objects) = \
+        xmlDataExtractor(io.BytesIO(xml)).extract_txc_data(stop_level=True)
+    indices = TimetableExtractor.map_indicies(None, service_object, stop_objects, jps_objects)
+    timetable_args = (service_object, stop_objects, vj_objects, jps_objects, *indices)
+
+    # built once first, so that neither is timed with the caches of the first build still empty
+    measure(timetable_args, False)
+    wide_time, wide, _ = measure(timetable_args, False)
+    long_time, _, long = measure(timetable_args, True)
+    trips, stop_times, _ = long
+
+    print(f'Synthetic TXC file: {vehicle_journeys:,} vehicle journeys, {stops:,} stops, '
+          f'{len(stop_times):,} stop times\n')
+    print(f'{"output":<24}{"build time":>12}{"memory":>14}')
+    print(f'{"wide timetables":<24}{wide_time:>10.2f} s{memory_mb(wide):>11.1f} MB')
+    print(f'{"wide and long tables":<24}{long_time:>10.2f} s{memory_mb(long):>11.1f} MB (long tables only)')
+
+    print(f'\nVehicle journeys in both: {len(trips) == sum(len(table.columns) - 5 for table in wide)}')
@@ -0,0 +1,92 @@
+# =============================================================================
+# Compares the peak memory of extracting a very large TXC file by parsing it
+# whole (xmlDataExtractor) against streaming it with iterparse
+# (StreamingXmlDataExtractor), on a synthetic TXC file written to disk.
+#
+# Each extractor is run in its own process, and the peak resident memory of the
+# process (as reported by the OS, so including the lxml tree) is reported, less
+# the memory taken once the modules are imported. By default only the service
+# level fields are extracted, as the stop level objects of a file this size
+# would take far more memory than either tree.
+#
+# usage: python benchmarks/benchmark_streaming.py [size_mb] [stop_level]
+#   e.g. python benchmarks/benchmark_streaming.py 500
+# =============================================================================
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'BODSDataExtractor'))
+
+from synthetic_txc import write_synthetic_txc, synthetic_txc
+
+
+def peak_memory_mb():
+    """The peak resident memory of this process so far, in MB (ru_maxrss is in KB on Linux, bytes on macOS)"""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+def write_file_of_size(path, size_mb):
+    """Writes a synthetic TXC file of about size_mb MB, returning its number of vehicle journeys"""
+
+    # the size of a vehicle journey, from a small file
+    per_vehicle_journey = (len(synthetic_txc(vehicle_journeys=2_000)) - len(synthetic_txc(vehicle_journeys=1_000))) / 1_000
+    vehicle_journeys = max(1, int(size_mb * 1e6 / per_vehicle_journey))
+
+    with open(path, 'wb') as file:
+        write_synthetic_txc(file, vehicle_journeys=vehicle_journeys)
+
+    return vehicle_journeys
+
+
+def measure(mode, path, stop_level):
+    """Extracts a file with one extractor (run in a child process), printing the time taken, the peak memory while
+    extracting and a summary of the service level info to check the extractors agree"""
+
+    from extractor import xmlDataExtractor, StreamingXmlDataExtractor
+
+    imported = peak_memory_mb()
+
+    start = time.perf_counter()
+    extractor_class = StreamingXmlDataExtractor if mode == 'streaming' else xmlDataExtractor
+    service_level_info, stop_level_info = extractor_class(path).extract_txc_data(stop_level=stop_level)
+    elapsed = time.perf_counter() - start
+
+    vehicle_journeys = len(stop_level_info[1].VehicleJourney) if stop_level else '-'
+
+    print(f'{mode:<14}{elapsed:>10.1f} s{peak_memory_mb() - imported:>14.1f} MB{str(vehicle_journeys):>18}')
+    # the admin areas come from a set, so are in an arbitrary order
+    print(repr(service_level_info[:-1] + [sorted(service_level_info[-1])]), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--measure':
+        measure(sys.argv[2], sys.argv[3], sys.argv[4] == 'True')
+        sys.exit()
+
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 500
+    stop_level = len(sys.argv) > 2 and sys.argv[2].lower() in ('1', 'true', 'stop_level')
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'synthetic.xml')
+        vehicle_journeys = write_file_of_size(path, size_mb)
+
+        print(f'Synthetic TXC file: {os.path.getsize(path) / 1e6:.1f} MB, {vehicle_journeys:,} vehicle journeys, '
+              f'stop level: {stop_level}\n')
+        print(f'{"extractor":<14}{"time":>12}{"peak memory":>17}{"vehicle journeys":>18}')
+
+        summaries = []
+        for mode in ['tree', 'streaming']:
+            result = subprocess.run([sys.executable, __file__, '--measure', mode, path, str(stop_level)],
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            print(result.stdout, end='')
+            if result.returncode != 0:
+                print(f'{mode} failed:\n{result.stderr}')
+            summaries.append(result.stderr.strip().splitlines()[-1:] if result.stderr else None)
+
+        print(f'\nService level info identical: {summaries[0] == summaries[1]}')
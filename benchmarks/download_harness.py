@@ -0,0 +1,209 @@
+# =============================================================================
+# Test harness for the dataset downloader. Serves synthetic TXC datasets (single
+# xml files and zips) from a local HTTP server, with faults injected:
+#
+#   - flaky datasets return 503 for their first requests, then succeed
+#   - broken datasets drop the connection for their first requests, then succeed
+#   - missing datasets always return 404
+#   - failing datasets always return 500
+#   - slow datasets wait before responding
+#   - unsupported datasets are a file type that cannot be extracted
+#
+# Each dataset is downloaded and extracted with TimetableExtractor.download_extract_txc,
+# and the harness checks that every recoverable dataset was extracted, that the
+# unrecoverable ones failed without stopping the rest, and that the server never
+# saw more concurrent requests than the downloader's max_in_flight. The datasets
+# are then extracted again end to end (analytical_timetable_data), checking that
+# the service line extract has the recovered datasets and the others are reported.
+#
+# usage: python benchmarks/download_harness.py [datasets] [max_in_flight]
+# =============================================================================
+import io
+import os
+import socket
+import sys
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'BODSDataExtractor'))
+
+from extractor import TimetableExtractor
+from downloader import DatasetDownloader
+from synthetic_txc import synthetic_txc
+
+
+class FakeBODS:
+    """The datasets served, the faults to inject for each and counts of what was requested"""
+
+    def __init__(self, datasets):
+        self.datasets = {}
+        self.faults = {}
+        self.requests = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+        kinds = ['ok', 'flaky', 'broken', 'ok', 'missing', 'slow', 'zip', 'failing', 'unsupported']
+
+        for i in range(datasets):
+            kind = kinds[i % len(kinds)]
+            xml = synthetic_txc(vehicle_journeys=20, stops=10, service_code=f'PB0000001:{i}')
+
+            if kind == 'zip':
+                content = io.BytesIO()
+                with zipfile.ZipFile(content, 'w') as zip_file:
+                    zip_file.writestr(f'dataset_{i}_a.xml', xml)
+                    zip_file.writestr(f'dataset_{i}_b.xml', xml)
+                self.datasets[i] = (f'dataset_{i}.zip', content.getvalue())
+            elif kind == 'unsupported':
+                self.datasets[i] = (f'dataset_{i}.txt', b'not a dataset')
+            else:
+                self.datasets[i] = (f'dataset_{i}.xml', xml)
+
+            self.faults[i] = kind
+            self.requests[i] = 0
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                dataset = int(self.path.strip('/').split('/')[-1])
+
+                with fake.lock:
+                    fake.requests[dataset] += 1
+                    attempt = fake.requests[dataset]
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+
+                try:
+                    self.respond(dataset, attempt)
+                finally:
+                    with fake.lock:
+                        fake.in_flight -= 1
+
+            def respond(self, dataset, attempt):
+                fault = fake.faults[dataset]
+
+                if fault == 'missing':
+                    return self.send_error(404)
+                if fault == 'failing' or (fault == 'flaky' and attempt <= 2):
+                    return self.send_error(503)
+                if fault == 'broken' and attempt <= 2:
+                    # close the connection without responding
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                if fault == 'slow':
+                    time.sleep(0.5)
+
+                filename, content = fake.datasets[dataset]
+                self.send_response(200)
+                self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class HarnessExtractor(TimetableExtractor):
+    """A TimetableExtractor for the datasets served, with their metadata given rather than fetched from the API, so
+    that it is set up as it would be for a real extract"""
+
+    def __init__(self, metadata, **kwargs):
+        self.harness_metadata = metadata
+        super().__init__(api_key=None, **kwargs)
+
+    def pull_timetable_data(self):
+        self.metadata = self.harness_metadata.copy()
+
+
+def dataset_metadata(urls):
+    """The metadata of each dataset url, with the columns the extract takes from the API"""
+
+    return pd.DataFrame({'url': urls, 'id': range(len(urls)), 'operator_name': 'Operator', 'description': 'd',
+                         'comment': 'c', 'status': 'published', 'dq_score': '100%', 'dq_rag': 'green',
+                         'bods_compliance': True, 'filetype': 'xml'})
+
+
+def serve(datasets):
+    """Serves a new set of datasets, returning the fake, the server and the url of each dataset"""
+
+    fake = FakeBODS(datasets)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), fake.handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f'http://127.0.0.1:{server.server_address[1]}/timetable/dataset/{i}' for i in range(datasets)]
+
+    return fake, server, urls
+
+
+def run(datasets=40, max_in_flight=4):
+    fake, server, urls = serve(datasets)
+
+    # an extractor without calling the API (and without extracting yet), to use its download and extraction of each
+    # dataset
+    extractor = HarnessExtractor(dataset_metadata(urls), downloader=DatasetDownloader(
+        max_in_flight=max_in_flight, timeout=(2, 5), retries=3, backoff=0.05))
+
+    start = time.perf_counter()
+    results = list(extractor.downloader.map(extractor.download_extract_txc, urls, threaded=True))
+    elapsed = time.perf_counter() - start
+
+    server.shutdown()
+
+    failed = {i for i, (_, _, error) in enumerate(results) if error is not None}
+    expected_failures = {i for i, kind in fake.faults.items() if kind in ('missing', 'failing')}
+    # unsupported datasets are skipped, without an error
+    rows = sum(len(txc_records) for _, txc_records, error in results if error is None and txc_records is not None)
+
+    print(f'{datasets} datasets downloaded in {elapsed:.2f} s, {sum(fake.requests.values())} requests, '
+          f'{rows} service lines extracted')
+    print(f'most concurrent requests seen by the server: {fake.max_in_flight} (max_in_flight {max_in_flight})')
+    print(f'failed datasets: {sorted(failed)}')
+
+    assert failed == expected_failures, f'expected {sorted(expected_failures)} to fail'
+    assert rows == sum(2 if kind == 'zip' else 1 for i, kind in fake.faults.items()
+                       if i not in failed and kind != 'unsupported'), \
+        'every xml file of the recovered datasets is extracted'
+    assert fake.max_in_flight <= max_in_flight
+    assert all(fake.requests[i] == 1 for i, kind in fake.faults.items() if kind == 'missing'), '404s are not retried'
+    assert all(fake.requests[i] == 4 for i, kind in fake.faults.items() if kind == 'failing'), '5xx are retried'
+
+    extract_end_to_end(datasets, max_in_flight)
+
+    print('All checks passed')
+
+
+def extract_end_to_end(datasets, max_in_flight):
+    """Extracts the datasets (served afresh, so their faults start again) through analytical_timetable_data, checking
+    that those which could not be extracted are left out of the service line extract and reported"""
+
+    fake, server, urls = serve(datasets)
+    TimetableExtractor.error_list = []
+
+    extractor = HarnessExtractor(dataset_metadata(urls), downloader=DatasetDownloader(
+        max_in_flight=max_in_flight, timeout=(2, 5), retries=3, backoff=0.05))
+    extractor.analytical_timetable_data()
+
+    server.shutdown()
+
+    extracted = {url for url, kind in zip(urls, fake.faults.values()) if kind not in ('missing', 'failing', 'unsupported')}
+    extract_urls = set(extractor.service_line_extract_with_stop_level_json['URL'])
+
+    print(f'end to end: {len(extract_urls)} of {datasets} datasets in the service line extract, '
+          f'{len(set(TimetableExtractor.error_list))} reported as errors')
+
+    assert extract_urls == extracted, 'only the recovered datasets are in the service line extract'
+    assert set(TimetableExtractor.error_list) == set(urls) - extracted, 'the other datasets are reported'
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 40, int(sys.argv[2]) if len(sys.argv) > 2 else 4)
@@ -0,0 +1,109 @@
+#This file generates synthetic TransXChange files of a chosen size, for benchmarking extraction
+#without needing an API key or network access
+import io
+import random
+
+TXC_NAMESPACE = 'http://www.transxchange.org.uk/'
+
+DAYS_OF_WEEK = [
+    ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
+    ['Saturday'],
+    ['Sunday'],
+]
+
+
+def write_synthetic_txc(file, vehicle_journeys=1_000, stops=40, journey_patterns=4, service_code='PB0000001:1',
+                        seed=0):
+    '''
+    Writes a synthetic TXC file to a binary file object, one vehicle journey at a time so that
+    files far larger than memory can be generated. Half of the journey patterns run outbound
+    along the stops and half inbound, each skipping a different stop, and every vehicle journey
+    has a timing link per journey pattern timing link.
+    '''
+
+    rnd = random.Random(seed)
+    stop_refs = [f'{["010", "450", "320"][i % 3]}0SYN{i:05d}' for i in range(stops)]
+
+    def write(text):
+        file.write(text.encode('utf-8'))
+
+    write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    write(f'<TransXChange xmlns="{TXC_NAMESPACE}" xml:lang="en" FileName="synthetic.xml" SchemaVersion="2.4" '
+          f'RevisionNumber="1">\n')
+
+    write('<StopPoints>\n')
+    for i, stop_ref in enumerate(stop_refs):
+        write(f'<AnnotatedStopPointRef><StopPointRef>{stop_ref}</StopPointRef><CommonName>Stop {i}</CommonName>'
+              f'<Location><Longitude>-1.{i:05d}</Longitude><Latitude>53.{i:05d}</Latitude></Location>'
+              f'</AnnotatedStopPointRef>\n')
+    write('</StopPoints>\n')
+
+    patterns = []
+    for p in range(journey_patterns):
+        direction = 'outbound' if p % 2 == 0 else 'inbound'
+        sequence = [s for s in range(stops) if s != (p * 3) % stops or p < 2]
+        if direction == 'inbound':
+            sequence.reverse()
+        patterns.append((f'JP{p + 1}', direction, sequence))
+
+    write('<JourneyPatternSections>\n')
+    pattern_links = {}
+    for jp_id, direction, sequence in patterns:
+        links = []
+        write(f'<JourneyPatternSection id="JPS_{jp_id}">\n')
+        for position, (from_stop, to_stop) in enumerate(zip(sequence[:-1], sequence[1:]), start=1):
+            link_id = f'JPTL_{jp_id}_{position}'
+            links.append(link_id)
+            write(f'<JourneyPatternTimingLink id="{link_id}">'
+                  f'<From SequenceNumber="{position}"><Activity>pickUp</Activity>'
+                  f'<StopPointRef>{stop_refs[from_stop]}</StopPointRef><TimingStatus>otherPoint</TimingStatus></From>'
+                  f'<To SequenceNumber="{position + 1}"><StopPointRef>{stop_refs[to_stop]}</StopPointRef>'
+                  f'<TimingStatus>otherPoint</TimingStatus></To>'
+                  f'<RouteLinkRef>RL1</RouteLinkRef><RunTime>PT{rnd.randint(1, 4)}M</RunTime>'
+                  f'</JourneyPatternTimingLink>\n')
+        write('</JourneyPatternSection>\n')
+        pattern_links[jp_id] = links
+    write('</JourneyPatternSections>\n')
+
+    write('<Operators><Operator id="O1"><NationalOperatorCode>SYNT</NationalOperatorCode><OperatorCode>SYN</OperatorCode>'
+          '<OperatorShortName>Synthetic Buses</OperatorShortName><LicenceNumber>PB0000001</LicenceNumber>'
+          '<TradingName>Synthetic</TradingName></Operator></Operators>\n')
+
+    write(f'<Services><Service><ServiceCode>{service_code}</ServiceCode><Lines><Line id="L1"><LineName>1</LineName>'
+          '<OutboundDescription><Description>Outbound</Description></OutboundDescription>'
+          '<InboundDescription><Description>Inbound</Description></InboundDescription></Line></Lines>'
+          '<OperatingPeriod><StartDate>2023-01-01</StartDate></OperatingPeriod>'
+          '<RegisteredOperatorRef>O1</RegisteredOperatorRef><PublicUse>true</PublicUse>'
+          '<StandardService><Origin>Start</Origin><Destination>End</Destination>')
+    for jp_id, direction, _ in patterns:
+        write(f'<JourneyPattern id="{jp_id}"><DestinationDisplay>End</DestinationDisplay><Direction>{direction}'
+              f'</Direction><RouteRef>R1</RouteRef><JourneyPatternSectionRefs>JPS_{jp_id}'
+              f'</JourneyPatternSectionRefs></JourneyPattern>')
+    write('</StandardService></Service></Services>\n')
+
+    write('<VehicleJourneys>\n')
+    for v in range(vehicle_journeys):
+        jp_id = patterns[v % len(patterns)][0]
+        minutes = (5 * 60 + v * 7) % (24 * 60)
+        days = ''.join(f'<{day}/>' for day in DAYS_OF_WEEK[v % len(DAYS_OF_WEEK)])
+        timing_links = ''.join(
+            f'<VehicleJourneyTimingLink><JourneyPatternTimingLinkRef>{link_id}</JourneyPatternTimingLinkRef>'
+            f'<RunTime>PT{rnd.randint(1, 4)}M</RunTime></VehicleJourneyTimingLink>'
+            for link_id in pattern_links[jp_id])
+        write(f'<VehicleJourney><OperatorRef>O1</OperatorRef>'
+              f'<Operational><TicketMachine><JourneyCode>{v}</JourneyCode></TicketMachine></Operational>'
+              f'<OperatingProfile><RegularDayType><DaysOfWeek>{days}</DaysOfWeek></RegularDayType></OperatingProfile>'
+              f'<VehicleJourneyCode>VJ{v}</VehicleJourneyCode><ServiceRef>{service_code}</ServiceRef>'
+              f'<LineRef>SYNT:{service_code}:L1</LineRef><JourneyPatternRef>{jp_id}</JourneyPatternRef>'
+              f'<DepartureTime>{minutes // 60:02d}:{minutes % 60:02d}:00</DepartureTime>{timing_links}'
+              f'</VehicleJourney>\n')
+    write('</VehicleJourneys>\n')
+    write('</TransXChange>\n')
+
+
+def synthetic_txc(**kwargs):
+    """Returns a synthetic TXC file as bytes (see write_synthetic_txc for arguments)"""
+
+    file = io.BytesIO()
+    write_synthetic_txc(file, **kwargs)
+    return file.getvalue()
@@ -0,0 +1,180 @@
+#This file contains the reconciliation of services in the OTC database with services published on BODS by admin
+#area, computed once per extract and shared by the by-area reports and their MI
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+LA_LOOKUP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ATCO_code_to_LA_lookup.csv')
+
+ADMIN_AREA_NAME = 'Admin Area Name associated with ATCO Code'
+
+# the columns a service is reported by, with the bods line names of each joined together
+SERVICE_COLUMNS = ['service_code', 'LineName_otc', 'op_name_otc', 'OperatorName_bods', 'atco_code', 'in_otc', 'in_bods',
+                   'auth_description_otc', ADMIN_AREA_NAME]
+
+REPORT_COLUMNS = ['service_code', 'LineName_otc', 'LineName_bods', 'op_name_otc', 'OperatorName_bods', 'atco_code',
+                  'in_otc', 'in_bods', 'auth_description_otc', ADMIN_AREA_NAME]
+
+
+class AreaLookup:
+    '''
+    The lookup between local authorities (as named in the OTC database), admin areas and ATCO
+    codes, indexed for mapping ATCO codes to admin area names and authorities to ATCO codes.
+    '''
+
+    def __init__(self, table):
+        self.table = table
+
+        # an ATCO code may be listed for more than one authority, but always with the same admin area name
+        self.admin_area_names = table.drop_duplicates('ATCO Code').set_index('ATCO Code')[ADMIN_AREA_NAME]
+
+        self.authority_atco_codes = table[['Auth_Description', 'ATCO Code']].drop_duplicates()
+
+
+@lru_cache(maxsize=None)
+def area_lookup():
+    """The ATCO code to local authority lookup shipped with the package, read once"""
+
+    return AreaLookup(pd.read_csv(LA_LOOKUP_PATH, dtype={'ATCO Code': str}, encoding='utf-8-sig'))
+
+
+class AreaReconciliation:
+    '''
+    Every service code in the OTC database and/or published on BODS, by the admin areas it has
+    stops within (for BODS) or is registered with (for OTC), with whether it is in each.
+
+    This is computed once, on first use, and the reports and MI read from it, so it reflects
+    the OTC database and extract it was created with.
+    '''
+
+    def __init__(self, otc_db, service_line_extract):
+        self.otc_db = otc_db
+        self.service_line_extract = service_line_extract
+        self.lookup = area_lookup()
+        self.views = {}
+
+    def is_for(self, otc_db, service_line_extract):
+        """Whether this reconciliation is of the given OTC database and extract"""
+
+        return self.otc_db is otc_db and self.service_line_extract is service_line_extract
+
+    def services(self, just_otc=False):
+        """Every service by admin area, or just those in the OTC database"""
+
+        key = 'services_just_otc' if just_otc else 'services'
+
+        if key not in self.views:
+            services = self.grouped_services()
+
+            if just_otc:
+                services = services[services['in_otc'] == 1].reset_index(drop=True)
+
+            # the services not published on BODS have no bods line names
+            services = services[REPORT_COLUMNS].copy()
+            services['LineName_bods'] = services['LineName_bods'].where(services['LineName_bods'] != 'xxxxx', None)
+
+            self.views[key] = services
+
+        return self.views[key].copy()
+
+    def mi(self, just_otc=False):
+        """The number of services in each admin area, and the fraction of them in OTC and in BODS"""
+
+        key = 'mi_just_otc' if just_otc else 'mi'
+
+        if key not in self.views:
+            service_atco_mi = self.services(just_otc).groupby('atco_code').agg({'service_code': 'count',
+                                                                                ADMIN_AREA_NAME: 'first',
+                                                                                'in_otc': 'mean',
+                                                                                'in_bods': 'mean'})
+
+            service_atco_mi.rename(columns={'service_code': 'count_services'}, inplace=True)
+
+            # round fractions to 2 decimals
+            self.views[key] = service_atco_mi.round(2)
+
+        return self.views[key].copy()
+
+    def grouped_services(self):
+        """The outer join of OTC and BODS services by admin area, with a row for each service and its BODS line
+        names joined together"""
+
+        if 'grouped' in self.views:
+            return self.views['grouped']
+
+        # OTC services, with categoricals as objects so that grouping only gives the combinations present, and the
+        # ATCO codes of their authority
+        otc = self.otc_db[['service_code', 'service_number', 'op_name', 'auth_description']].astype(object)
+        otc_la_merge = otc.drop_duplicates().merge(self.lookup.authority_atco_codes, how='left',
+                                                   right_on='Auth_Description', left_on='auth_description')
+        otc_la_merge = otc_la_merge.drop_duplicates()
+
+        # BODS services, with the admin area name of each la_code
+        bods_la_merge = self.service_line_extract[['ServiceCode', 'LineName', 'la_code', 'OperatorName']]
+        bods_la_merge = bods_la_merge.drop_duplicates()
+        bods_la_merge[ADMIN_AREA_NAME] = bods_la_merge['la_code'].map(self.lookup.admin_area_names)
+        bods_la_merge['ATCO Code'] = bods_la_merge['la_code'].where(
+            bods_la_merge['la_code'].isin(self.lookup.admin_area_names.index))
+
+        # add cols to distinguish if in otc and if in bods
+        otc_la_merge['in'] = 1
+        bods_la_merge['in'] = 1
+
+        # ensure linename col is consistent across bods and otc
+        otc_la_merge.rename(columns={'service_number': 'LineName'}, inplace=True)
+
+        # merge OTC service level data with BODS service level data
+        services = otc_la_merge[
+            ['service_code', 'LineName', 'op_name', 'ATCO Code', 'in', 'auth_description']].add_suffix('_otc').merge(
+            bods_la_merge.add_suffix('_bods'), how='outer', right_on=['ServiceCode_bods', 'ATCO Code_bods'],
+            left_on=['service_code_otc', 'ATCO Code_otc']).drop_duplicates()
+
+        # coalesce service code and atco code cols
+        services['service_code'] = services['service_code_otc'].combine_first(services['ServiceCode_bods'])
+        services['atco_code'] = services['ATCO Code_otc'].combine_first(services['ATCO Code_bods'])
+
+        # keep only necessary cols, and add admin area name
+        services = services[['service_code', 'LineName_otc', 'LineName_bods', 'op_name_otc', 'OperatorName_bods',
+                             'atco_code', 'in_otc', 'in_bods', 'auth_description_otc']]
+        services[ADMIN_AREA_NAME] = services['atco_code'].map(self.lookup.admin_area_names)
+        services = services.drop_duplicates()
+
+        # replace nans with 0s (necessary for mi reporting calculations)
+        services['in_otc'] = services['in_otc'].fillna(0)
+        services['in_bods'] = services['in_bods'].fillna(0)
+
+        # replace nulls with string so they are joined as well
+        services['LineName_bods'] = services['LineName_bods'].fillna('xxxxx')
+
+        self.views['grouped'] = join_line_names(services)
+
+        return self.views['grouped']
+
+
+def join_line_names(services):
+    '''
+    Groups services by SERVICE_COLUMNS (in sorted order, keeping nulls), with the bods line names of
+    each group joined by commas in the order they appear. Equivalent to a groupby joining the line
+    names, but joins every group in one pass over the sorted names rather than calling join per group.
+    '''
+
+    groups = services.groupby(SERVICE_COLUMNS, sort=True, dropna=False).ngroup().to_numpy()
+
+    if len(groups) == 0:
+        return pd.DataFrame(columns=SERVICE_COLUMNS + ['LineName_bods'])
+
+    # a stable sort keeps the line names of each group in the order they appear
+    order = np.argsort(groups, kind='stable')
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+
+    line_names = services['LineName_bods'].to_numpy(dtype=object)[order] + ','
+    joined = np.add.reduceat(line_names, starts)
+
+    grouped = services.iloc[order[starts]][SERVICE_COLUMNS].reset_index(drop=True)
+    grouped['LineName_bods'] = [line_names[:-1] for line_names in joined]
+
+    return grouped
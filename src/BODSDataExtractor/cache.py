@@ -0,0 +1,277 @@
+#This file contains an on disk cache of downloaded datasets, so that datasets which have not changed since
+#they were last downloaded are read from disk rather than downloaded again
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+# response headers kept with each cached dataset, for the cached response to be read as the original was
+CACHED_HEADERS = ['Content-Disposition', 'Content-Type', 'ETag', 'Last-Modified']
+
+
+class DatasetCache:
+    '''
+    Caches downloaded datasets on disk, for use by a DatasetDownloader.
+
+    Each dataset url is cached with the version of the dataset it was downloaded at (e.g. its id
+    and modified timestamp from the metadata). A dataset requested at the same version is read
+    from disk without a request. Otherwise the request is made conditional on the cached copy's
+    ETag or Last-Modified headers, so the server can reply that it has not changed rather than
+    send it again.
+
+    Content is stored once per distinct payload, named by its sha256 hash, and gzip compressed
+    (apart from zip files, which are already compressed). Once the stored content exceeds
+    max_bytes, the least recently used datasets are removed.
+
+    Arguments:
+        directory: folder to keep the cache in, created if it does not exist
+        max_bytes: the most bytes of (compressed) content to keep
+    '''
+
+    def __init__(self, directory, max_bytes=20_000_000_000):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.bytes_saved = 0
+
+        os.makedirs(os.path.join(self.directory, 'content'), exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(self.directory, 'index.sqlite'), check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS datasets (
+                               url TEXT PRIMARY KEY,
+                               version TEXT,
+                               sha256 TEXT,
+                               size INTEGER,
+                               stored_size INTEGER,
+                               compressed INTEGER,
+                               response_url TEXT,
+                               headers TEXT,
+                               last_used REAL)''')
+        self.db.commit()
+
+    def stats(self):
+        """Counts of cache hits (including datasets revalidated with the server), misses and bytes not downloaded"""
+
+        return {'hits': self.hits, 'misses': self.misses, 'revalidated': self.revalidated,
+                'bytes_saved': self.bytes_saved}
+
+    def entry(self, url):
+        with self.lock:
+            row = self.db.execute('SELECT version, sha256, size, compressed, response_url, headers FROM datasets '
+                                  'WHERE url = ?', (url,)).fetchone()
+
+        if row is None or not os.path.exists(self.content_path(row[1])):
+            return None
+
+        version, sha256, size, compressed, response_url, headers = row
+        headers = CaseInsensitiveDict(line.split(': ', 1) for line in headers.split('\n') if line)
+
+        return {'version': version, 'sha256': sha256, 'size': size, 'compressed': compressed,
+                'response_url': response_url, 'headers': headers}
+
+    def content_path(self, sha256):
+        return os.path.join(self.directory, 'content', sha256)
+
+    def get(self, url, version, downloader, **kwargs):
+        '''
+        Returns the response for a url, from the cache if it holds the url at this version or the
+        server confirms it is unchanged, otherwise downloaded (with downloader.request) and cached.
+        If stream=True is given, the content is not read into memory: it is downloaded in chunks
+        into the cache, and the response returned reads it from the cache file.
+        '''
+
+        stream = kwargs.get('stream', False)
+        entry = self.entry(url)
+
+        if entry is not None and version is not None and entry['version'] == version:
+            return self.hit(url, entry, stream)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+
+        if entry is not None:
+            if 'ETag' in entry['headers']:
+                headers['If-None-Match'] = entry['headers']['ETag']
+            if 'Last-Modified' in entry['headers']:
+                headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+
+        response = downloader.request(url, headers=headers, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            with self.lock:
+                self.revalidated += 1
+            self.touch(url, version)
+            return self.hit(url, entry, stream)
+
+        with self.lock:
+            self.misses += 1
+
+        if response.status_code == 200:
+            entry = self.store(url, version, response)
+
+            if stream:
+                # the content has been streamed into the cache, so is read from there
+                response.close()
+                response = self.cached_response(entry, stream=True)
+
+            self.evict()
+
+        return response
+
+    def hit(self, url, entry, stream=False):
+        """Returns a response with the cached content of a dataset"""
+
+        response = self.cached_response(entry, stream)
+
+        with self.lock:
+            self.hits += 1
+            self.bytes_saved += entry['size']
+
+        self.touch(url)
+
+        return response
+
+    def cached_response(self, entry, stream=False):
+        """A response with the cached content of a dataset, read from the cache file as it is used if stream"""
+
+        response = requests.Response()
+        path = self.content_path(entry['sha256'])
+
+        if stream:
+            response.raw = gzip.open(path, 'rb') if entry['compressed'] else open(path, 'rb')
+        else:
+            with open(path, 'rb') as file:
+                response._content = gzip.decompress(file.read()) if entry['compressed'] else file.read()
+
+        response.status_code = 200
+        response.url = entry['response_url']
+        response.headers = entry['headers']
+
+        return response
+
+    def touch(self, url, version=None):
+        with self.lock:
+            if version is None:
+                self.db.execute('UPDATE datasets SET last_used = ? WHERE url = ?', (time.time(), url))
+            else:
+                self.db.execute('UPDATE datasets SET last_used = ?, version = ? WHERE url = ?',
+                                (time.time(), version, url))
+            self.db.commit()
+
+    def store(self, url, version, response, chunk_size=1024 * 1024):
+        """Caches the content of a successful response, reading it in chunks (so a streamed response is never
+        held in memory). Returns the entry cached"""
+
+        sha256 = hashlib.sha256()
+        size = 0
+        compressed = True
+        writer = None
+        temporary_path = os.path.join(self.directory, 'content', f'.{os.getpid()}.{threading.get_ident()}.tmp')
+
+        try:
+            with open(temporary_path, 'wb') as file:
+                for chunk in response.iter_content(chunk_size):
+                    if writer is None:
+                        # zip files are already compressed
+                        compressed = not chunk.startswith(b'PK')
+                        writer = gzip.GzipFile(fileobj=file, mode='wb', compresslevel=6) if compressed else file
+
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    writer.write(chunk)
+
+                if writer is None:
+                    writer = gzip.GzipFile(fileobj=file, mode='wb', compresslevel=6)
+                if writer is not file:
+                    writer.close()
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+        sha256 = sha256.hexdigest()
+        path = self.content_path(sha256)
+
+        if os.path.exists(path):
+            os.remove(temporary_path)
+        else:
+            os.replace(temporary_path, path)
+
+        headers = CaseInsensitiveDict((name, response.headers[name]) for name in CACHED_HEADERS
+                                      if name in response.headers)
+
+        with self.lock:
+            previous = self.db.execute('SELECT sha256 FROM datasets WHERE url = ?', (url,)).fetchone()
+            self.db.execute('INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (url, version, sha256, size, os.path.getsize(path), int(compressed),
+                             response.url, '\n'.join(f'{name}: {value}' for name, value in headers.items()),
+                             time.time()))
+            self.db.commit()
+
+            # remove the content of the dataset's previous version, unless another dataset shares it
+            if previous is not None and previous[0] != sha256:
+                self.remove_unused_content(previous[0])
+
+        return {'version': version, 'sha256': sha256, 'size': size, 'compressed': compressed,
+                'response_url': response.url, 'headers': headers}
+
+    def remove_unused_content(self, sha256):
+        if self.db.execute('SELECT 1 FROM datasets WHERE sha256 = ?', (sha256,)).fetchone() is None:
+            try:
+                os.remove(self.content_path(sha256))
+            except OSError:
+                pass
+
+    def size(self):
+        """Bytes of content stored, counting content shared by several datasets once"""
+
+        with self.lock:
+            return self.db.execute('SELECT COALESCE(SUM(stored_size), 0) FROM '
+                                   '(SELECT DISTINCT sha256, stored_size FROM datasets)').fetchone()[0]
+
+    def evict(self):
+        """Removes the least recently used datasets until the content stored is within max_bytes"""
+
+        if self.size() <= self.max_bytes:
+            return
+
+        with self.lock:
+            rows = self.db.execute('SELECT url, sha256 FROM datasets ORDER BY last_used').fetchall()
+            stored_sizes = dict(self.db.execute('SELECT sha256, stored_size FROM datasets').fetchall())
+            references = dict(self.db.execute('SELECT sha256, COUNT(*) FROM datasets GROUP BY sha256').fetchall())
+            total = sum(stored_sizes.values())
+
+            for url, sha256 in rows:
+                if total <= self.max_bytes:
+                    break
+
+                self.db.execute('DELETE FROM datasets WHERE url = ?', (url,))
+                references[sha256] -= 1
+
+                # content is only removed once no dataset uses it
+                if references[sha256] == 0:
+                    total -= stored_sizes[sha256]
+                    try:
+                        os.remove(self.content_path(sha256))
+                    except OSError:
+                        pass
+
+            self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            for (sha256,) in self.db.execute('SELECT DISTINCT sha256 FROM datasets').fetchall():
+                try:
+                    os.remove(self.content_path(sha256))
+                except OSError:
+                    pass
+            self.db.execute('DELETE FROM datasets')
+            self.db.commit()
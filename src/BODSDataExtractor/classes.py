@@ -2,9 +2,11 @@ from dataclasses import dataclass
 from typing import List, Dict, Optional, Union
 
 # set default value to null in optional values - dacite does this automatically
+# __slots__ keep each object compact, as there can be many thousands of timing links per file
 
 @dataclass
 class Route:
+    __slots__ = ('id', 'description', 'route_section_ref')
     id: str
     description: str
     route_section_ref: str
@@ -12,6 +14,7 @@ class Route:
 
 @dataclass
 class RouteSection:
+    __slots__ = ('id', 'route_link_id', 'from_stop_point_ref', 'to_stop_point_ref')
     id: str
     route_link_id: str
     from_stop_point_ref: str
@@ -20,12 +23,14 @@ class RouteSection:
 
 @dataclass
 class Location:
+    __slots__ = ('Longitude', 'Latitude')
     Longitude: str
     Latitude: str
 
 
 @dataclass
 class AnnotatedStopPointRef:
+    __slots__ = ('StopPointRef', 'CommonName', 'Location')
     StopPointRef: str
     CommonName: str
     Location: Optional[Location]
@@ -33,21 +38,25 @@ class AnnotatedStopPointRef:
 
 @dataclass
 class StopPoints:
+    __slots__ = ('AnnotatedStopPointRef',)
     AnnotatedStopPointRef: List[AnnotatedStopPointRef]
 
 
 @dataclass
 class TicketMachine:
+    __slots__ = ('JourneyCode',)
     JourneyCode: str
 
 
 @dataclass
 class Operational:
+    __slots__ = ('TicketMachine',)
     TicketMachine: Optional[TicketMachine]
 
 
 @dataclass
 class OutboundDescription:
+    __slots__ = ('Description', 'Origin', 'Destination')
     Description: Optional[str]
     Origin: Optional[str]
     Destination: Optional[str]
@@ -55,62 +64,78 @@ class OutboundDescription:
 
 @dataclass
 class InboundDescription:
+    __slots__ = ('Description',)
     Description: Optional[str]
 
 
 @dataclass
 class OperatingPeriod:
+    __slots__ = ('StartDate',)
     StartDate: str
 
 
 @dataclass
 class RegularDayType:
+    __slots__ = ('DaysOfWeek', 'HolidaysOnly')
     DaysOfWeek: Optional[Dict]
     HolidaysOnly: Optional[Dict]
 
 
 @dataclass
 class WorkingDays:
+    __slots__ = ('ServicedOrganisationRef',)
     ServicedOrganisationRef: Optional[str]
 
 
 @dataclass
 class ServicedOrganisationDayType:
+    __slots__ = ('DaysOfOperation',)
     DaysOfOperation: Optional[WorkingDays]
 
 
 @dataclass
 class BankHolidayOperation:
+    __slots__ = ('DaysOfNonOperation', 'DaysOfOperation')
     DaysOfNonOperation: Optional[Dict]
     DaysOfOperation: Optional[Dict]
 
 
 @dataclass
 class From:
+    __slots__ = ('Activity', 'StopPointRef', 'TimingStatus', '_SequenceNumber')
     Activity: Optional[str]
     StopPointRef: Optional[str]
     TimingStatus: Optional[str]
-    _SequenceNumber: Optional[str] = 0
+    _SequenceNumber: Optional[str]
 
     @property
     def sequence_number(self):
+        # slotted dataclasses cannot take a default, so fall back to it here when the attribute is missing
+        if self._SequenceNumber is None:
+            return 0
         return self._SequenceNumber
 
 
 
 @dataclass
 class To:
+    __slots__ = ('StopPointRef', 'TimingStatus', '_SequenceNumber')
     StopPointRef: Optional[str]
     TimingStatus: Optional[str]
-    _SequenceNumber: Optional[str] = 1
+    _SequenceNumber: Optional[str]
 
     @property
     def sequence_number(self):
+        # slotted dataclasses cannot take a default, so fall back to it here when the attribute is missing
+        if self._SequenceNumber is None:
+            return 1
         return self._SequenceNumber
 
 
 @dataclass
 class OperatingProfile:
+    __slots__ = ('RegularDayType', 'BankHolidayOperation', 'PublicUse', 'DaysOfNonOperation', 'RegisteredOperatorRef',
+                 'ServicedOrganisationDayType')
     RegularDayType: Optional[RegularDayType]
     BankHolidayOperation: Optional[BankHolidayOperation]
     PublicUse: Optional[str]
@@ -121,6 +146,7 @@ class OperatingProfile:
 
 @dataclass
 class VehicleJourneyTimingLink:
+    __slots__ = ('DutyCrewCode', 'JourneyPatternTimingLinkRef', 'RunTime', 'From', 'To')
     DutyCrewCode: Optional[str]
     JourneyPatternTimingLinkRef: Optional[str]
     RunTime: Optional[str]
@@ -130,12 +156,14 @@ class VehicleJourneyTimingLink:
 
 @dataclass
 class VehicleJourneyTimingLinks:
-
+    __slots__ = ('VehicleJourneyTimingLink',)
     VehicleJourneyTimingLink: List[VehicleJourneyTimingLink]
 
 
 @dataclass
 class VehicleJourney:
+    __slots__ = ('OperatorRef', 'Operational', 'VehicleJourneyCode', 'ServiceRef', 'LineRef', 'JourneyPatternRef',
+                 'DepartureTime', 'OperatingProfile', 'DepartureDayShift', 'VehicleJourneyTimingLink')
     OperatorRef: Optional[str]
     Operational: Optional[Operational]
     VehicleJourneyCode: str
@@ -150,11 +178,13 @@ class VehicleJourney:
 
 @dataclass
 class VehicleJourneys:
+    __slots__ = ('VehicleJourney',)
     VehicleJourney: List[VehicleJourney]
 
 
 @dataclass
 class JourneyPattern:
+    __slots__ = ('DestinationDisplay', 'OperatorRef', 'Direction', 'RouteRef', 'JourneyPatternSectionRefs', '_id')
     DestinationDisplay: str
     OperatorRef: Optional[str]
     Direction: str
@@ -169,6 +199,7 @@ class JourneyPattern:
 
 @dataclass
 class StandardService:
+    __slots__ = ('Origin', 'Destination', 'UseAllPoints', 'JourneyPattern')
     Origin: str
     Destination: str
     UseAllPoints: Optional[str]
@@ -178,6 +209,7 @@ class StandardService:
 
 @dataclass
 class Line:
+    __slots__ = ('_id', 'LineName', 'OutboundDescription', 'InboundDescription')
     _id: Optional[str]
     LineName: str
     OutboundDescription: Optional[OutboundDescription]
@@ -191,10 +223,13 @@ class Line:
 
 @dataclass
 class Lines:
+    __slots__ = ('Line',)
     Line: List[Line]
 
 @dataclass
 class Service:
+    __slots__ = ('ServiceCode', 'Lines', 'OperatingPeriod', 'OperatingProfile', 'TicketMachineServiceCode',
+                 'RegisteredOperatorRef', 'PublicUse', 'StandardService')
     ServiceCode: str
     Lines: Lines
     OperatingPeriod: OperatingPeriod
@@ -208,6 +243,7 @@ class Service:
 
 @dataclass
 class JourneyPatternTimingLink:
+    __slots__ = ('_id', 'From', 'To', 'RouteLinkRef', 'RunTime')
     _id: str
     From: From
     To: To
@@ -221,6 +257,7 @@ class JourneyPatternTimingLink:
 
 @dataclass
 class JourneyPatternSection:
+    __slots__ = ('_id', 'JourneyPatternTimingLink')
     _id: str
     JourneyPatternTimingLink: List[JourneyPatternTimingLink]
 
@@ -231,4 +268,5 @@ class JourneyPatternSection:
 
 @dataclass
 class JourneyPatternSections:
+    __slots__ = ('JourneyPatternSection',)
     JourneyPatternSection: List[JourneyPatternSection]
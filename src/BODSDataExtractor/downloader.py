@@ -0,0 +1,152 @@
+#This file contains the downloader used to fetch datasets, which shares a pool of connections between a
+#bounded number of concurrent downloads and retries requests that fail with server or connection errors
+import concurrent.futures
+import random
+import tempfile
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# responses worth retrying, as the server may succeed if asked again
+RETRY_STATUS_CODES = {429} | set(range(500, 600))
+
+
+class DatasetDownloader:
+    '''
+    Downloads datasets through a single requests session, so connections are pooled and reused.
+
+    Arguments:
+        max_in_flight: the most requests to have in progress at once, when downloading concurrently
+        timeout: seconds to wait to connect, and then between bytes of the response, as accepted by requests
+        retries: how many times to retry a request that fails with a server or connection error
+        backoff: seconds to wait before the first retry. This doubles with each retry (up to max_backoff),
+                 and a random amount of it is waited so that retries from concurrent downloads are spread out
+        max_backoff: the most seconds to wait before any one retry
+        cache: optional DatasetCache, to reuse datasets downloaded previously
+    '''
+
+    def __init__(self, max_in_flight=8, timeout=(10, 120), retries=4, backoff=1.0, max_backoff=60.0, cache=None):
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache = cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_in_flight, pool_maxsize=max_in_flight)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, version=None, **kwargs):
+        """GETs a url, from the cache if there is one and it holds the url at this version (e.g. the dataset's
+        modified timestamp) or the server confirms the cached copy is unchanged"""
+
+        if self.cache is not None:
+            return self.cache.get(url, version, self, **kwargs)
+
+        return self.request(url, **kwargs)
+
+    def get_file(self, url, version=None, chunk_size=1024 * 1024, **kwargs):
+        '''
+        GETs a url as get does, but streams the content into a temporary file in chunks rather
+        than holding it in memory, retrying if the connection fails part way through. Returns the
+        response (without its content) and the file, positioned at its start, which is deleted
+        when closed.
+        '''
+
+        file = tempfile.TemporaryFile()
+
+        for attempt in range(self.retries + 1):
+            response = None
+
+            try:
+                response = self.get(url, version=version, stream=True, **kwargs)
+                for chunk in response.iter_content(chunk_size):
+                    file.write(chunk)
+
+            # the connection failed while reading the content (failed requests are already retried by request)
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError) as e:
+                if response is None and not isinstance(e, requests.exceptions.ChunkedEncodingError):
+                    file.close()
+                    raise
+                error = e
+            except BaseException:
+                file.close()
+                raise
+            else:
+                file.seek(0)
+                return response, file
+            finally:
+                if response is not None:
+                    response.close()
+
+            file.seek(0)
+            file.truncate()
+            if attempt < self.retries:
+                time.sleep(self.backoff_delay(attempt))
+
+        file.close()
+        raise error
+
+    def request(self, url, **kwargs):
+        """GETs a url, retrying server and connection errors. Raises the last error if every attempt fails,
+        or an HTTPError straight away for other unsuccessful responses"""
+
+        for attempt in range(self.retries + 1):
+            retry_after = None
+
+            try:
+                response = self.session.get(url, timeout=self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response
+
+                error = requests.exceptions.HTTPError(f'{response.status_code} Server Error for url: {url}',
+                                                      response=response)
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+
+            if attempt < self.retries:
+                time.sleep(self.backoff_delay(attempt, retry_after))
+
+        raise error
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Seconds to wait before retrying, after the given (zero based) attempt"""
+
+        # honour the server's request to wait, if given in seconds
+        if retry_after is not None and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def map(self, function, urls, threaded=True):
+        '''
+        Calls function on each url, with up to max_in_flight calls at once if threaded. Yields
+        (url, result, error) for each url in the order given, where error is the exception the
+        call raised (and result None), so that one failed url does not stop the others.
+        '''
+
+        if not threaded or self.max_in_flight <= 1:
+            for url in urls:
+                yield self.call(function, url)
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            yield from executor.map(lambda url: self.call(function, url), urls)
+
+    @staticmethod
+    def call(function, url):
+        try:
+            return url, function(url), None
+        except Exception as e:
+            return url, None, e
+
+    def close(self):
+        self.session.close()
@@ -1,5 +1,6 @@
 import requests
 import zipfile
+import zlib
 import io
 import os
 from bods_client.client import BODSClient
@@ -8,24 +9,54 @@ from bods_client.models.base import APIError as BodsApiError
 from bods_client.models.timetables import TimetableResponse
 import lxml.etree as ET
 import itertools
-from itertools import zip_longest
+from collections import OrderedDict
 from pathlib import Path
 from sys import platform
 import re
 import concurrent.futures
+import multiprocessing
 
 try:
     import BODSDataExtractor.otc_db_download as otc_db_download
+    import BODSDataExtractor.timetable_builder as timetable_builder
+    from BODSDataExtractor.downloader import DatasetDownloader
+    from BODSDataExtractor.pipeline import DatasetPipeline
+    from BODSDataExtractor.incremental import ExtractStore
+    from BODSDataExtractor.parquet_store import ParquetStore
+    from BODSDataExtractor.naptan_store import NaptanStore
+    from BODSDataExtractor.stop_level_store import StopLevelStore, STOP_LEVEL_COLUMNS
+    from BODSDataExtractor.service_filter import ServiceFilter, filter_values
+    from BODSDataExtractor.area_reconciliation import AreaReconciliation
+    from BODSDataExtractor.otc_reconciliation import OTCReconciliation
+    from BODSDataExtractor.service_codes import classify_service_codes, REGISTERED, UNREGISTERED
+    from BODSDataExtractor.publishing_mi import publishing_mi
+    from BODSDataExtractor.records import RecordBuilder, StageTimer, XML_COLUMNS
+    from BODSDataExtractor.txc_builder import TXCObjectBuilder
+    from BODSDataExtractor.timetable_builder import TimetableBuilder, build_timetables, timetable_operating_days, \
+        organise_timetable, combine_stop_times
 except:
     import otc_db_download
+    import timetable_builder
+    from downloader import DatasetDownloader
+    from pipeline import DatasetPipeline
+    from incremental import ExtractStore
+    from parquet_store import ParquetStore
+    from naptan_store import NaptanStore
+    from stop_level_store import StopLevelStore, STOP_LEVEL_COLUMNS
+    from service_filter import ServiceFilter, filter_values
+    from area_reconciliation import AreaReconciliation
+    from otc_reconciliation import OTCReconciliation
+    from service_codes import classify_service_codes, REGISTERED, UNREGISTERED
+    from publishing_mi import publishing_mi
+    from records import RecordBuilder, StageTimer, XML_COLUMNS
+    from txc_builder import TXCObjectBuilder
+    from timetable_builder import TimetableBuilder, build_timetables, timetable_operating_days, organise_timetable, \
+        combine_stop_times
 from datetime import date
-from collections import Counter
-import importlib.resources
 from shapely.geometry import Point
 from geopandas import GeoDataFrame
 import pandas as pd
-from dacite import from_dict
-import xmltodict
+import numpy as np
 import datetime
 from classes import *
 
@@ -33,9 +64,21 @@ from classes import *
 class TimetableExtractor:
     error_list = []
 
+    # the version (id, modified timestamp and revision) of each dataset url, for the dataset cache and incremental refresh
+    dataset_versions = {}
+
+    # the columns of the service line extract not kept in the stop level extract
+    stop_level_dropped_columns = ['dq_score', 'OperatorShortName', 'Status', 'NOC', 'PublicUse', 'TradingName',
+                                  'SchemaVersion', 'OperatorName', 'LicenceNumber', 'Origin', 'OperatorCode',
+                                  'Destination', 'dq_rag', 'Description', 'Comment', 'FileType', 'bods_compliance',
+                                  'OperatingPeriodEndDate', 'la_code']
+
     def __init__(self, api_key, limit=10_000, offset=0, nocs=None, status='published',
                  search=None, bods_compliant=True, atco_code=None, service_line_level=False,
-                 stop_level=False, threaded=False):
+                 stop_level=False, threaded=False, workers=None, downloader=None, parse_workers=None,
+                 incremental_dir=None, naptan_store=None, stop_level_dir=None, lazy_stop_level=False,
+                 timetable_cache_size=64, service_codes=None, line_names=None, streaming_threshold=100_000_000,
+                 stop_times=False):
         self.api_key = api_key
         self.limit = limit
         self.offset = offset
@@ -47,19 +90,58 @@ class TimetableExtractor:
         self.service_line_level = service_line_level
         self.stop_level = stop_level
         self.threaded = threaded
+        self.workers = workers
+        self.parse_workers = parse_workers
+
+        # if given, the extracted data of each dataset is kept here, and only new or changed datasets are extracted
+        self.incremental_dir = incremental_dir
+
+        # a DatasetDownloader can be given to configure concurrent downloads, timeouts and retries
+        self.downloader = downloader if downloader is not None else DatasetDownloader()
+
+        # if given, stops without a location in their TXC file are given their location from this NaptanStore
+        self.naptan_store = naptan_store
+
+        # the stop level objects of each file, kept in memory or (if a folder is given) spilled to disk
+        self.stop_level_store = StopLevelStore(stop_level_dir)
+
+        # in lazy mode, only the (compressed) xml of each file is kept, and its timetables are generated the first time
+        # they are asked for, keeping those of the timetable_cache_size files most recently asked for
+        self.lazy_stop_level = lazy_stop_level
+        self.timetable_cache_size = timetable_cache_size
+        self.timetable_cache = OrderedDict()
+
+        # if given, only the services with these service codes and/or line names are extracted, and other files are
+        # skipped as soon as their services have been read (a single string being one service code or line name)
+        self.service_codes = filter_values(service_codes)
+        self.line_names = filter_values(line_names)
+        self.service_filter = None
+        if service_codes is not None or line_names is not None:
+            self.service_filter = ServiceFilter(service_codes, line_names)
+
+        # xml files larger than this many bytes are streamed (see StreamingXmlDataExtractor) rather than parsed whole
+        self.streaming_threshold = streaming_threshold
+
+        # if True, the timetables are also given in long format, as typed trips, stop times and stops tables (see
+        # StopTimes), of the timetables most recently generated
+        self.build_stop_times = stop_times
+        self.trips = None
+        self.stop_times = None
+        self.stops = None
 
         self.pull_timetable_data()
 
         if self.metadata is None:
             return  # early return if no results to process
 
-        self.otc_db = otc_db_download.fetch_otc_db()
-
         if service_line_level or stop_level:
             self.analytical_timetable_data()
             self.analytical_timetable_data_analysis()
 
-        if stop_level:
+        if stop_level and lazy_stop_level:
+            self.stop_level_extract = self.service_line_extract_with_stop_level_json.drop(
+                columns=self.stop_level_dropped_columns)
+        elif stop_level:
             self.generate_timetable()
 
     def create_metadata_df(self, timetable_api_response):
@@ -178,34 +260,35 @@ class TimetableExtractor:
 
     def download_extract_txc(self, url):
         """Download the txc data from a dataset url (can be zip or single xml) and
-        extracts the data into a Pandas dataframe."""
-        response = requests.get(url)
-        try:
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            raise e
-        filetype = self._dataset_filetype(response.headers)
-
-        if filetype == '.zip':
-            print(f'Fetching zip file from {url}...')
-            txc_df = self._extract_zip(response)
-        elif filetype == '.xml':
-            print(f'Fetching xml file from {url}...')
-            xml = io.BytesIO(response.content)
-            txc_df = self._extract_xml(response.url, xml)
-        else:
-            print(f'Invalid dataset file found: "{filetype}", skipping...')
-            return
+        extracts the data of each xml file into a RecordBuilder. The dataset is streamed to a
+        temporary file rather than held in memory, and parsed from there."""
+        response, dataset_file = self.downloader.get_file(url, version=self.dataset_versions.get(url))
+
+        with dataset_file:
+            filetype = self._dataset_filetype(response.headers)
+
+            if filetype == '.zip':
+                print(f'Fetching zip file from {url}...')
+                txc_records = self._extract_zip(response, dataset_file)
+            elif filetype == '.xml':
+                print(f'Fetching xml file from {url}...')
+                record = self._extract_xml(response.url, dataset_file)
+                txc_records = self.xml_records([] if record is None else [record])
+            else:
+                print(f'Invalid dataset file found: "{filetype}", skipping...')
+                return
 
-        return txc_df
+        return txc_records
 
-    def _extract_zip(self, response):
-        """Download a ZIP file and extract the relevant contents
-        of each xml file into a dataframe.
+    def _extract_zip(self, response, dataset_file):
+        """Extract the relevant contents of each xml file in a downloaded ZIP file
+        into a RecordBuilder. Each xml file is read from the zip on disk as it is parsed,
+        so only one is open at a time.
         """
-        output = []
+        output = self.xml_records()
+        extracted = failed = False
 
-        with zipfile.ZipFile(io.BytesIO(response.content)) as thezip:
+        with zipfile.ZipFile(dataset_file) as thezip:
             for zipinfo in thezip.infolist():
                 extension = zipinfo.filename.split('.')[-1]
                 if extension != 'xml':
@@ -214,64 +297,136 @@ class TimetableExtractor:
 
                 with thezip.open(zipinfo) as thefile:
                     try:
-                        xml_output = self._extract_xml(response.url, thefile)
-                        output.append(xml_output)
-                    except:  # TODO really should be catching specific errors
+                        xml_output = self._extract_xml(response.url, thefile, zipinfo.file_size)
+                        extracted = True
+                        if xml_output is not None:
+                            output.append(xml_output)
+                    except XML_FILE_ERRORS as e:
+                        print(f'*****Error extracting {zipinfo.filename} from {response.url}: {e!r}*****')
                         TimetableExtractor.error_list.append(response.url)
+                        failed = True
 
-        return pd.concat(output)
+        # a dataset none of whose files have the services asked for is extracted, with no records, but one whose files
+        # all failed is not
+        if failed and not extracted:
+            return None
 
-    def _extract_xml(self, url, xml):
-        xml_output = [url]
-        xml_data_extractor = xmlDataExtractor(xml)
-        xml_output.extend(xml_data_extractor.extract_service_level_info())
+        return output
 
-        # if stop level data is requested, then need the additional columns that contain jsons of the stop level info
-        if self.stop_level:
-            # =============================================================================
-            #               also read in xml as a text string
-            #               this is required for extracting sections of the xml for further stop level extraction, not just elements or attribs
-            # =============================================================================
-            xml.seek(0)
-            xml_text = xml.read()
-            xml_json = xmltodict.parse(
-                xml_text,
-                process_namespaces=False,
-                attr_prefix='_',
-                force_list=(
-                    'JourneyPatternSection',
-                    'JourneyPatternTimingLink',
-                    'VehicleJourney',
-                    'VehicleJourneyTimingLink',
-                    'JourneyPattern'))
-
-            journey_pattern_json = xml_json['TransXChange']['JourneyPatternSections']  # ['JourneyPatternSection']
-            xml_output.append(journey_pattern_json)
-
-            vehicle_journey_json = xml_json['TransXChange']['VehicleJourneys']  # ['VehicleJourney']
-            xml_output.append(vehicle_journey_json)
-
-            services_json = xml_json['TransXChange']['Services']['Service']
-            xml_output.append(services_json)
-
-            stops_json = xml_json['TransXChange']['StopPoints']
-            xml_output.append(stops_json)
-
-        output_df = pd.DataFrame(xml_output).T
+    def download_txc_files(self, url):
+        """Download a dataset (can be zip or single xml) and yield the content of each xml file within it, for the
+        pipeline to extract. The dataset is streamed to a temporary file, and each xml file read from it only when
+        the pipeline is ready for it, so that a large zip is never held in memory"""
+        response, dataset_file = self.downloader.get_file(url, version=self.dataset_versions.get(url))
 
-        if self.stop_level:
-            output_df.columns = ['URL', 'FileName', 'NOC', 'TradingName', 'LicenceNumber', 'OperatorShortName',
-                                 'OperatorCode', 'ServiceCode', 'LineName', 'PublicUse', 'OperatingDays', 'Origin',
-                                 'Destination', 'OperatingPeriodStartDate', 'OperatingPeriodEndDate', 'SchemaVersion',
-                                 'RevisionNumber', 'la_code', 'journey_pattern_json', 'vehicle_journey_json',
-                                 'services_json', 'stops_json']
-        else:
-            output_df.columns = ['URL', 'FileName', 'NOC', 'TradingName', 'LicenceNumber', 'OperatorShortName',
-                                 'OperatorCode', 'ServiceCode', 'LineName', 'PublicUse', 'OperatingDays', 'Origin',
-                                 'Destination', 'OperatingPeriodStartDate', 'OperatingPeriodEndDate', 'SchemaVersion',
-                                 'RevisionNumber', 'la_code']
+        with dataset_file:
+            filetype = self._dataset_filetype(response.headers)
+
+            if filetype == '.zip':
+                print(f'Fetching zip file from {url}...')
+
+                with zipfile.ZipFile(dataset_file) as thezip:
+                    for zipinfo in thezip.infolist():
+                        extension = zipinfo.filename.split('.')[-1]
+                        if extension != 'xml':
+                            print(f'Found "{extension}" file in zip folder, passing...')
+                            continue
+
+                        yield (response.url, thezip.read(zipinfo), self.stop_level_extraction(), self.service_filter,
+                               self.streaming_threshold)
+
+            elif filetype == '.xml':
+                print(f'Fetching xml file from {url}...')
+                yield (response.url, dataset_file.read(), self.stop_level_extraction(), self.service_filter,
+                       self.streaming_threshold)
+
+            else:
+                print(f'Invalid dataset file found: "{filetype}", skipping...')
+
+    def pipelined_download_extract_txc(self, urls):
+        """Downloads datasets and extracts their xml files in overlapping stages (see DatasetPipeline), with the xml
+        files extracted in parse_workers processes if set. Returns a dict of each dataset url to the records of its
+        xml files, in order"""
 
-        return output_df
+        pipeline = DatasetPipeline(self.downloader, self.download_txc_files, extract_txc_file,
+                                   parse_workers=self.parse_workers)
+        extracted_datasets = {}
+
+        for dataset_url, results, error in pipeline.run(urls):
+            if error is not None:
+                print(f'*****Error downloading dataset {dataset_url}: {error}*****')
+                TimetableExtractor.error_list.append(dataset_url)
+                continue
+
+            extracted_xmls = self.xml_records()
+            extracted = failed = False
+            for result in results:
+                if isinstance(result, Exception) and not isinstance(result, XML_FILE_ERRORS):
+                    raise result
+                elif isinstance(result, Exception):
+                    print(f'*****Error extracting xml file from {dataset_url}: {result!r}*****')
+                    TimetableExtractor.error_list.append(dataset_url)
+                    failed = True
+                    continue
+
+                extracted = True
+                if result is not None:
+                    extracted_xmls.append(result)
+
+            # as _extract_zip, datasets without the services asked for are kept (with no records) so their version is
+            # recorded, unless every file failed
+            if extracted or not failed:
+                extracted_datasets[dataset_url] = extracted_xmls
+
+        return extracted_datasets
+
+    def download_extract_datasets(self, urls):
+        """Downloads and extracts each dataset url, concurrently if threaded. Returns a dict of each dataset url to
+        the records of its xml files, in order, leaving out datasets that failed (a dataset that fails does not stop the
+        others)"""
+
+        if self.threaded:
+            # downloading and extracting overlap, with datasets downloaded concurrently
+            return self.pipelined_download_extract_txc(urls)
+
+        extracted_datasets = {}
+        for dataset_url, txc_records, error in self.downloader.map(self.download_extract_txc, urls, threaded=False):
+            if error is not None:
+                print(f'*****Error downloading dataset {dataset_url}: {error}*****')
+                TimetableExtractor.error_list.append(dataset_url)
+            elif txc_records is not None:
+                extracted_datasets[dataset_url] = txc_records
+
+        return extracted_datasets
+
+    def _extract_xml(self, url, xml, size=None):
+        return extract_xml(url, xml, self.stop_level_extraction(), self.service_filter, self.streaming_threshold, size)
+
+    def xml_records(self, records=()):
+        """A RecordBuilder for the records extract_xml gives for each xml file, with the given records added"""
+
+        xml_records = RecordBuilder(xml_columns(self.stop_level_extraction()))
+
+        for record in records:
+            xml_records.append(record)
+
+        return xml_records
+
+    def extraction_settings(self):
+        """The settings that change what is extracted from each xml file, for the incremental store to check that the
+        datasets it holds were extracted with them"""
+
+        return {'stop_level': self.stop_level_extraction(), 'service_codes': self.service_codes,
+                'line_names': self.line_names}
+
+    def stop_level_extraction(self):
+        """What is extracted from each xml file for the stop level: its objects, its compressed xml (LAZY) if
+        lazy_stop_level, or nothing"""
+
+        if self.stop_level and self.lazy_stop_level:
+            return LAZY
+
+        return self.stop_level
 
     def fetch_xml_filenames(self):
 
@@ -315,20 +470,67 @@ class TimetableExtractor:
         ]
         rename_mapper = {orig: txc for orig, txc in zip(orig_cols, txc_cols)}
 
-        if self.threaded:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                results = executor.map(self.download_extract_txc, self.metadata["url"].to_list())
-                xml_table = pd.concat([df for df in results])
+        if {'id', 'modified'}.issubset(self.metadata.columns):
+            version_columns = [column for column in ['id', 'modified', 'revision'] if column in self.metadata.columns]
+            self.dataset_versions = {row[0]: '_'.join(str(value) for value in row[1:]) for row in
+                                     self.metadata[['url'] + version_columns].itertuples(index=False)}
+
+        dataset_urls = self.metadata["url"].to_list()
+
+        # how long each stage takes, reported at the end
+        timer = StageTimer()
+
+        if self.incremental_dir is not None:
+            # only extract the datasets that are new or have changed since the last run
+            extract_store = ExtractStore(self.incremental_dir, self.extraction_settings())
+            extracted_datasets = self.download_extract_datasets(extract_store.changed(dataset_urls,
+                                                                                      self.dataset_versions))
+            extracted_datasets = extract_store.update(self.metadata, self.dataset_versions, extracted_datasets)
         else:
-            extracted_xmls = []
-            for dataset_url in self.metadata["url"]:
-                extracted_xmls.append(self.download_extract_txc(dataset_url))
-            xml_table = pd.concat(extracted_xmls)
+            extracted_datasets = self.download_extract_datasets(dataset_urls)
+
+        timer.done('download and extract')
 
+        # the records of every dataset are made into a single dataframe, in the order of the metadata
+        xml_records = self.xml_records()
+        for url in dataset_urls:
+            if url in extracted_datasets:
+                xml_records.extend(extracted_datasets[url])
+
+        xml_table = xml_records.to_frame()
+
+        # datasets that failed (to download, or every one of their files) are reported, and left out below
+        for url in dataset_urls:
+            if url not in extracted_datasets:
+                print(f'*****Dataset {url} could not be extracted, leaving it out*****')
+                if url not in TimetableExtractor.error_list:
+                    TimetableExtractor.error_list.append(url)
+
+        del xml_records, extracted_datasets
+
+        if self.stop_level:
+            # the stop level objects (or compressed xml) of each file are moved to the store, leaving a handle to them
+            # in its row
+            stop_level_columns = ['stop_level_xml'] if self.lazy_stop_level else STOP_LEVEL_COLUMNS
+            handles = self.stop_level_store.add(xml_table[stop_level_columns].itertuples(index=False, name=None))
+            xml_table = xml_table.drop(columns=stop_level_columns)
+            xml_table['stop_level_handle'] = np.array(handles, dtype=np.int64)
+
+        timer.done('build dataframe')
+
+        if self.downloader.cache is not None:
+            cache_stats = self.downloader.cache.stats()
+            print(f"Dataset cache: {cache_stats['hits']:,} hits ({cache_stats['revalidated']:,} revalidated), "
+                  f"{cache_stats['misses']:,} misses, {cache_stats['bytes_saved'] / 1e6:,.1f} MB not downloaded")
+
+        # datasets without any records are left out, rather than given a row of missing values that cannot be
+        # exploded: those that failed, and when filtering by service code or line name, those without any of the
+        # services asked for
         self.service_line_extract_with_stop_level_json = (
-            self.metadata.filter(orig_cols, axis=1)
+            self.metadata[self.metadata['url'].isin(xml_table['URL'])]
+            .filter(orig_cols, axis=1)
             .rename(columns=rename_mapper)
-            .merge(xml_table, how="outer", on="URL")
+            .merge(xml_table, how="outer" if self.service_filter is None else "inner", on="URL")
         )
 
         # explode rows that are always just 1 value to get attributes out of lists
@@ -362,6 +564,8 @@ class TimetableExtractor:
             .astype("float")
         )
 
+        timer.done('merge and explode')
+
         print(f'The following URLs failed: {TimetableExtractor.error_list}')
 
         # =============================================================================
@@ -374,8 +578,22 @@ class TimetableExtractor:
             self.service_line_extract_with_stop_level_json = self.service_line_extract_with_stop_level_json[
                 self.service_line_extract_with_stop_level_json['la_code'].isin(self.atco_code)]
 
+        # likewise, files with the services or lines asked for may also have others
+        if self.service_codes is not None:
+            self.service_line_extract_with_stop_level_json = self.service_line_extract_with_stop_level_json[
+                self.service_line_extract_with_stop_level_json['ServiceCode'].isin(self.service_codes)]
+
+        if self.line_names is not None:
+            self.service_line_extract_with_stop_level_json = self.service_line_extract_with_stop_level_json[
+                self.service_line_extract_with_stop_level_json['LineName'].isin(self.line_names)]
+
+        timer.done('filter')
+
+        self.stage_timings = timer.timings
+        timer.report('Service line stage timings')
+
     def analytical_timetable_data_analysis(self):
-        """Returns a copy of the service line level data suitable for analysis. Omits the columns with jsons
+        """Returns a copy of the service line level data suitable for analysis. Omits the columns with objects
         of the final stop level data required for further processing and stop level analysis, for
         performance and storage sake. Also omits la_code column, as if user is not interested in
         local authorities of services then this adds unnecessary duplication (one service line can be in
@@ -387,7 +605,7 @@ class TimetableExtractor:
 
         if self.stop_level:
             self.service_line_extract = self.service_line_extract_with_stop_level_json.drop(
-                ["journey_pattern_json", "vehicle_journey_json", "services_json", "stops_json"], axis=1
+                ["stop_level_handle"], axis=1
             )
 
         self.service_line_extract = self.service_line_extract.drop_duplicates()
@@ -407,13 +625,28 @@ class TimetableExtractor:
         ] = 'No End Date'
 
     def xplode(self, df, cols_to_explode):
-        """Explode out lists in dataframes.
-        Taken from https://stackoverflow.com/a/61390677"""
-        rest = {*df} - {*cols_to_explode}
-        zipped = zip(zip(*map(df.get, rest)), zip(*map(df.get, cols_to_explode)))
-        tups = [tup + exploded for tup, pre in zipped for exploded in zip_longest(*pre)]
+        """Explode out lists in dataframes. Each row becomes a row for each position of its lists (with None
+        where the lists of a row are shorter than the longest, and no rows if they are all empty).
+        The other columns are repeated by position, keeping their dtypes, and each list column is
+        flattened in one pass, rather than building a tuple of every value of every row."""
+        rest = [column for column in df.columns if column not in cols_to_explode]
+        lists = [df[column].to_numpy(dtype=object) for column in cols_to_explode]
+        lengths = [np.fromiter(map(len, values), dtype=np.int64, count=len(values)) for values in lists]
+        rows = np.maximum.reduce(lengths)
+
+        exploded = df.iloc[np.repeat(np.arange(len(df)), rows), [df.columns.get_loc(column) for column in rest]]
+        exploded.reset_index(drop=True, inplace=True)
+
+        for column, values, length in zip(cols_to_explode, lists, lengths):
+            if (length == rows).all():
+                flattened = list(itertools.chain.from_iterable(values))
+            else:
+                flattened = list(itertools.chain.from_iterable(
+                    itertools.islice(itertools.chain(row_values, itertools.repeat(None)), row_length)
+                    for row_values, row_length in zip(values, rows)))
+            exploded[column] = pd.Series(flattened, dtype=None if flattened else object)
 
-        return pd.DataFrame(tups, columns=[*rest, *cols_to_explode])
+        return exploded
 
     # =============================================================================
     #       FUNCTIONS FOR EXTRACTING STOP LEVEL DATA
@@ -422,24 +655,38 @@ class TimetableExtractor:
     def fetch_naptan_data(self):
 
         '''
-        Access NAPTAN API to fetch lat and long coordinates for all relevant stops.
-        Edited to fetch of all stops to avoid bugs. This could be improved in future.
+        Fetch lat and long coordinates for all stops from NaPTAN. These are kept in a local
+        NaptanStore (the extractor's, if it was given one), so are only downloaded once a day.
         '''
 
-        # get list of relevant admin area codes, to target api call
-        # atcos = list(self.service_line_extract_with_stop_level_json['la_code'].unique())
-        # atcos = ",".join(atcos)
+        naptan_store = self.naptan_store if self.naptan_store is not None else NaptanStore()
 
-        # call naptan api
-        # url = f"https://naptan.api.dft.gov.uk/v1/access-nodes?atcoAreaCodes={atcos}&dataFormat=csv"
-        url = "https://naptan.api.dft.gov.uk/v1/access-nodes?&dataFormat=csv"
+        return naptan_store.stops()
 
-        # filter results within call to those needed (just lat and long)
-        r = requests.get(url).content
-        naptan = pd.read_csv(io.StringIO(r.decode('utf-8')),
-                             usecols=['ATCOCode', 'CommonName', 'Longitude', 'Latitude'])
+    def fill_missing_stop_locations(self, stop_objects):
+        '''
+        Gives stops without a Location in their TXC file (which would show as "-" in timetables)
+        the location of the stop in NaPTAN, looking up only the admin areas of those stops.
+        '''
+
+        # stop objects are shared by the rows of a service in each la_code, so each is filled once
+        stop_objects = {id(stop_object): stop_object for stop_object in stop_objects if stop_object is not None}
+        missing = [stop for stop_object in stop_objects.values() for stop in stop_object.AnnotatedStopPointRef
+                   if not stop.Location]
+
+        if not missing:
+            return
 
-        return naptan
+        self.naptan_store.load({stop.StopPointRef[:3] for stop in missing})
+
+        filled = 0
+        for stop in missing:
+            location = self.naptan_store.location(stop.StopPointRef)
+            if location is not None:
+                stop.Location = Location(Longitude=str(location[0]), Latitude=str(location[1]))
+                filled += 1
+
+        print(f'Locations of {filled:,} of {len(missing):,} stops without a location filled from NaPTAN')
 
     def get_user_downloads_folder(self):
         if platform == "win32":
@@ -503,9 +750,98 @@ class TimetableExtractor:
         text arguement.
         '''
 
-        filtered_dict = {k: v for k, v in self.timetable_dict.items() if service_code in k}
+        timetables = self.timetables(service_code)
+        keys = self.timetable_keys(timetables)
+
+        filtered_dict = {}
+        for key, outbound, inbound in zip(keys, timetables['collated_timetable_outbound'],
+                                          timetables['collated_timetable_inbound']):
+            filtered_dict[f'{key}_outbound'] = outbound
+            filtered_dict[f'{key}_inbound'] = inbound
         return filtered_dict
 
+    @staticmethod
+    def timetable_keys(stop_level_extract):
+        """The composite key (DatasetID_ServiceCode_LineName_RevisionNumber) of each row of the stop level extract"""
+
+        return (stop_level_extract['DatasetID'].astype(str) + '_' + stop_level_extract['ServiceCode'].astype(str) + '_'
+                + stop_level_extract['LineName'].astype(str) + '_' + stop_level_extract['RevisionNumber'].astype(str))
+
+    def timetables(self, service_code=None):
+        '''
+        Returns the rows of the stop level extract whose composite key (DatasetID_ServiceCode_LineName_RevisionNumber)
+        contains service_code (all rows if None), with their inbound and outbound timetables. With lazy_stop_level,
+        the timetables of each file are generated the first time they are asked for.
+        '''
+
+        rows = self.stop_level_extract
+
+        if service_code is not None:
+            rows = rows[self.timetable_keys(rows).str.contains(service_code, regex=False)]
+
+        if not self.lazy_stop_level:
+            return rows
+
+        timetables = [self.lazy_timetables(handle) for handle in rows['stop_level_handle']]
+
+        if self.build_stop_times:
+            first_rows = ~rows['stop_level_handle'].duplicated().to_numpy()
+            self.set_stop_times(rows[first_rows], [long for (_, _, long), first in zip(timetables, first_rows)
+                                                   if first])
+
+        rows = rows.drop(columns=['stop_level_handle'])
+        rows['collated_timetable_outbound'] = pd.Series([outbound for outbound, _, _ in timetables],
+                                                        dtype=object).to_numpy()
+        rows['collated_timetable_inbound'] = pd.Series([inbound for _, inbound, _ in timetables],
+                                                       dtype=object).to_numpy()
+
+        return rows
+
+    def lazy_timetables(self, handle):
+        '''
+        The outbound and inbound timetables of a file in lazy mode, and its long format tables (or None), generated
+        from its xml the first time they are asked for and cached, keeping those of the timetable_cache_size files
+        most recently asked for.
+        '''
+
+        if handle in self.timetable_cache:
+            self.timetable_cache.move_to_end(handle)
+            return self.timetable_cache[handle]
+
+        xml = zlib.decompress(self.stop_level_store.get(handle)[0])
+        _, (jps_objects, vj_objects, service_object, stop_objects) = xml_data_extractor(
+            io.BytesIO(xml), self.streaming_threshold, len(xml)).extract_txc_data(stop_level=True,
+                                                                                  service_filter=self.service_filter)
+
+        if self.naptan_store is not None:
+            self.fill_missing_stop_locations([stop_objects])
+
+        indices = TimetableExtractor.map_indicies(self, service_object, stop_objects, jps_objects)
+        outbound, inbound, long, error = build_timetables(
+            (service_object, stop_objects, vj_objects, jps_objects, *indices), self.build_stop_times)
+
+        if error is not None:
+            service = self.stop_level_extract[self.stop_level_extract['stop_level_handle'] == handle].iloc[0]
+            print(f'*****Error generating timetables for {service["ServiceCode"]} in {service["FileName"]}: '
+                  f'{error}*****')
+            TimetableExtractor.error_list.append(service['URL'])
+
+        self.timetable_cache[handle] = (outbound, inbound, long)
+        if len(self.timetable_cache) > self.timetable_cache_size:
+            self.timetable_cache.popitem(last=False)
+
+        return outbound, inbound, long
+
+    def set_stop_times(self, rows, long_tables):
+        '''
+        Combines the long format tables of each file (None where they could not be generated) into the trips, stop
+        times and stops tables, their trips labelled with the DatasetID, ServiceCode and FileName of its row
+        '''
+
+        self.trips, self.stop_times, self.stops = combine_stop_times(
+            ({'DatasetID': row.DatasetID, 'ServiceCode': row.ServiceCode, 'FileName': row.FileName}, long)
+            for row, long in zip(rows.itertuples(index=False), long_tables) if long is not None)
+
     def save_metadata_to_csv(self):
         """
         Save metadata table to csv file
@@ -590,11 +926,44 @@ class TimetableExtractor:
         Save the timetable dataframe to a csv file, seperated into inbound and outbound journeys
         '''
 
-        df = self.stop_level_extract
+        df = self.timetables()
         self.save_dataframe_to_csv(df, 'collated_timetable_outbound', 'outbound_timetable_folder')
         self.save_dataframe_to_csv(df, 'collated_timetable_inbound', 'inbound_timetable_folder')
 
 
+    def parquet_store(self, directory=None):
+        '''
+        The ParquetStore to save tables to, in the given folder or else a parquet folder within today's folder
+        '''
+
+        if directory is None:
+            directory = f'{TimetableExtractor.create_today_folder(self)}/parquet'
+
+        return ParquetStore(directory)
+
+    def save_metadata_to_parquet(self, directory=None):
+        """
+        Save metadata table as Parquet. Unlike csv, localities are saved in full
+        """
+
+        self.parquet_store(directory).save_metadata(self.metadata)
+
+    def save_service_line_extract_to_parquet(self, directory=None):
+        """
+        Save service line table as Parquet, partitioned by NOC and la_code
+        """
+
+        self.parquet_store(directory).save_service_line_extract(self.service_line_extract)
+
+    def save_timetables_to_parquet(self, directory=None):
+        '''
+        Save the inbound and outbound timetables of the stop level extract as Parquet, partitioned by the
+        NOC and la_code of each service
+        '''
+
+        self.parquet_store(directory).save_timetables(self.timetables(),
+                                                      self.service_line_extract_with_stop_level_json)
+
     def save_filtered_timetables_to_csv(self, service_code):
 
         '''
@@ -741,43 +1110,45 @@ class TimetableExtractor:
         '''
         returns count of unique service codes chosen dataset
         '''
-        non_null_service_codes = self.service_line_extract_with_stop_level_json[
-            self.service_line_extract_with_stop_level_json['ServiceCode'] != None]
-        unique_service_codes = len(non_null_service_codes['ServiceCode'].unique())
+        unique_service_codes = self.publishing_mi().service_codes
         print(f'\nNumber of unique service codes in chosen dataset: {unique_service_codes}\n')
         return unique_service_codes
 
+    # the classification of the service codes of an extract, once computed, and the extract it is of
+    _service_code_classification = (None, None)
+
+    def service_code_classification(self):
+        '''
+        returns each distinct service code in the chosen dataset classified as registered, unregistered (UZ)
+        or malformed, with the reason it is malformed. It is computed once, and again only if the extract is replaced.
+        '''
+        extract, classification = self._service_code_classification
+
+        if extract is not self.service_line_extract_with_stop_level_json:
+            extract = self.service_line_extract_with_stop_level_json
+            classification = classify_service_codes(extract['ServiceCode'])
+            self._service_code_classification = (extract, classification)
+
+        return classification
+
     def valid_service_codes(self):
         '''
         returns count of unique and valid service codes chosen dataset, a dataframe with all the records with valid service codes
         and a dataframe with all the invalid service codes.
         '''
-        # left 2 are characters
-        correct_service_code = self.service_line_extract_with_stop_level_json[
-            self.service_line_extract_with_stop_level_json['ServiceCode'].str[:2].str.isalpha() == True]
-        # 10th is colon
-        correct_service_code = correct_service_code[correct_service_code['ServiceCode'].str[9:10] == ':']
-        # > than 10 characters
-        correct_service_code = correct_service_code[correct_service_code['ServiceCode'].str.len() > 10]
-        # unreg must be handled differently
-        correct_service_code_unreg = correct_service_code[correct_service_code['ServiceCode'].str[:2] == 'UZ']
-        correct_service_code_reg = correct_service_code[correct_service_code['ServiceCode'].str[:2] != 'UZ']
-        # next 7 are int unless first two of whole thing are UZ
-        correct_service_code_reg = correct_service_code_reg[
-            correct_service_code_reg['ServiceCode'].str[2:9].str.isnumeric() == True]
-        # right after colon are int, unless first two of whole thing are UZ
-        correct_service_code_reg = correct_service_code_reg[
-            correct_service_code_reg['ServiceCode'].str[10:].str.isnumeric() == True]
-        correct_service_code_final = pd.concat([correct_service_code_reg, correct_service_code_unreg])
-
-        # return the invalid service codes
-        valid_serv = correct_service_code_final[['ServiceCode']]
-        all_serv = self.service_line_extract_with_stop_level_json[['ServiceCode']]
-        invalid_serv = all_serv[~all_serv.apply(tuple, 1).isin(valid_serv.apply(tuple, 1))]
-        invalid_service_codes = invalid_serv.merge(self.service_line_extract_with_stop_level_json, how='left',
-                                                   on='ServiceCode')
-
-        unique_valid_service_codes = len(correct_service_code_final['ServiceCode'].unique())
+        extract = self.service_line_extract_with_stop_level_json
+        status = extract['ServiceCode'].map(self.service_code_classification()['status'])
+
+        # registered service codes, then unregistered
+        correct_service_code_final = pd.concat([extract[status == REGISTERED], extract[status == UNREGISTERED]])
+
+        # return the invalid service codes, those not in the set of valid codes
+        valid_serv = set(correct_service_code_final['ServiceCode'])
+        all_serv = extract[['ServiceCode']]
+        invalid_serv = all_serv[~all_serv['ServiceCode'].isin(valid_serv)]
+        invalid_service_codes = invalid_serv.merge(extract, how='left', on='ServiceCode')
+
+        unique_valid_service_codes = len(valid_serv)
         print(f'\nNumber of unique valid service codes in chosen dataset: {unique_valid_service_codes}\n')
         return correct_service_code_final, invalid_service_codes
 
@@ -786,15 +1157,11 @@ class TimetableExtractor:
         returns percentage of services published in TXC 2.4 schema, and a dataframe of these records, and a dataframe of the records
         that are not published in this schema
         '''
-        count_published_in_2_4_schema = len(self.service_line_extract_with_stop_level_json[
-                                                self.service_line_extract_with_stop_level_json[
-                                                    'SchemaVersion'] == '2.4'])
+        perc_published_in_2_4_schema = self.publishing_mi().percent_services_in_TXC_2_4
         TXC_2_4_schema = self.service_line_extract_with_stop_level_json[
             self.service_line_extract_with_stop_level_json['SchemaVersion'] == '2.4']
         not_TXC_2_4_schema = self.service_line_extract_with_stop_level_json[
             self.service_line_extract_with_stop_level_json['SchemaVersion'] != '2.4']
-        perc_published_in_2_4_schema = (count_published_in_2_4_schema / len(
-            self.service_line_extract_with_stop_level_json)) * 100
         print(f'\nPercentage of services published in TXC 2.4 schema: {perc_published_in_2_4_schema}\n')
         return perc_published_in_2_4_schema, TXC_2_4_schema, not_TXC_2_4_schema
 
@@ -803,11 +1170,7 @@ class TimetableExtractor:
         returns percentage of datasets published in TXC 2.4 schema, and a dataframe of these records, and a dataframe of the records
         that are not published in this schema
         '''
-        datasets_schema_pre = self.service_line_extract_with_stop_level_json.copy()
-        datasets_schema_pre['SchemaVersion'] = datasets_schema_pre['SchemaVersion'].astype('float')
-        datasets_schema = datasets_schema_pre.groupby('DatasetID').agg({'SchemaVersion': 'min'})
-        count_datasets_published_in_2_4_schema = len(datasets_schema[datasets_schema['SchemaVersion'] == 2.4])
-        perc_datasets_published_in_2_4_schema = (count_datasets_published_in_2_4_schema / len(datasets_schema)) * 100
+        perc_datasets_published_in_2_4_schema = self.publishing_mi().percent_datasets_in_TXC_2_4
         TXC_2_4_schema = self.service_line_extract_with_stop_level_json[
             self.service_line_extract_with_stop_level_json['SchemaVersion'] == '2.4']
         not_TXC_2_4_schema = self.service_line_extract_with_stop_level_json[
@@ -815,16 +1178,49 @@ class TimetableExtractor:
         print(f'\nPercentage of datasets published in TXC 2.4 schema: {perc_datasets_published_in_2_4_schema}\n')
         return perc_datasets_published_in_2_4_schema, TXC_2_4_schema, not_TXC_2_4_schema
 
+    # the publishing MI, once computed, and the metadata and extract it is of
+    _publishing_mi = (None, None, None)
+
+    def publishing_mi(self):
+        '''
+        returns the publishing MI of the chosen dataset (operators, service codes, valid service codes and
+        services and datasets published in TXC 2.4), computed together once, and again only if the extract is replaced
+        '''
+        metadata, extract, mi = self._publishing_mi
+
+        if metadata is not self.metadata or extract is not self.service_line_extract_with_stop_level_json:
+            metadata = self.metadata
+            extract = self.service_line_extract_with_stop_level_json
+            mi = publishing_mi(metadata, extract, self.service_code_classification())
+            self._publishing_mi = (metadata, extract, mi)
+
+        return mi
+
     def timetables_publishing_mi(self):
         '''
         returns high level MI for reporting into DFT on progress
         of publishing of timetables data
         '''
-        TimetableExtractor.count_operators(self)
-        TimetableExtractor.count_service_codes(self)
-        TimetableExtractor.valid_service_codes(self)
-        TimetableExtractor.services_published_in_TXC_2_4(self)
-        TimetableExtractor.datasets_published_in_TXC_2_4(self)
+        mi = self.publishing_mi()
+        mi.report()
+        return mi
+
+    # the OTC database, once fetched
+    _otc_db = None
+
+    @property
+    def otc_db(self):
+        """The OTC database, fetched the first time it is used (from the daily cache, if downloaded already
+        today) rather than each time an extractor is created"""
+
+        if self._otc_db is None:
+            self._otc_db = otc_db_download.fetch_otc_db()
+
+        return self._otc_db
+
+    @otc_db.setter
+    def otc_db(self, otc_db):
+        self._otc_db = otc_db
 
     # =============================================================================
     #     ## OTC reporting - to only be run on all published datasets ###
@@ -839,35 +1235,25 @@ class TimetableExtractor:
 
         return registered_licence_from_sc
 
-    def registered_published_services_all(self):
-        """This function returns a dataframe with two columns: Licence number, taken from the service code column of OTC Database (input) and the number of registered services associated to that licence number in the published data (input) """
-
-        # unique licences from service code column in otc_db
-        registered_licence_from_sc = self.otc_db['service_code'].str.split(':', expand=True)
-        unique_registered_licence_from_sc = pd.Series(registered_licence_from_sc[0])
-
-        # a list of licence codes from the published data, derived from the service codes
-        published_licence_from_sc = self.service_line_extract['ServiceCode'].str.split(':', expand=True)
-        published_licence_from_sc = published_licence_from_sc[0]
+    # the reconciliation of OTC and BODS services by service code and licence, once computed
+    _otc_reconciliation = None
 
-        # count of how many published records of each service codes exist in the published data
-        count_of_published_services = dict(Counter(published_licence_from_sc))
+    def otc_reconciliation(self):
+        '''
+        The reconciliation of services in the OTC database and on BODS by service code and by licence,
+        shared by the OTC reports. It is computed once, and again only if the OTC database or extract is replaced.
+        '''
 
-        # new dictionary to count occurances of otcdb licences in the published data
-        number_registered_services_published = {}
+        if self._otc_reconciliation is None or not self._otc_reconciliation.is_for(
+                self.otc_db, self.service_line_extract):
+            self._otc_reconciliation = OTCReconciliation(self.otc_db, self.service_line_extract)
 
-        for x in unique_registered_licence_from_sc:
-            if x in count_of_published_services.keys():
-                number_registered_services_published[x] = count_of_published_services[x]
-            else:
-                number_registered_services_published[x] = 0
+        return self._otc_reconciliation
 
-        all_services = pd.DataFrame(number_registered_services_published.items(),
-                                    columns=['licence', 'published_services'])
-        # published_services = all_services.query('published_services >0')
-        # not_published_services = all_services.query('published_services == 0')
+    def registered_published_services_all(self):
+        """This function returns a dataframe with two columns: Licence number, taken from the service code column of OTC Database (input) and the number of registered services associated to that licence number in the published data (input) """
 
-        return all_services
+        return self.otc_reconciliation().licences()
 
     def count_registered_published_services(self):
         """dataframe of counts of services registered for each otcdb licence"""
@@ -887,7 +1273,7 @@ class TimetableExtractor:
         Note - only to be run on all published datasets'''
 
         all_services = TimetableExtractor.registered_published_services_all(self)
-        published = TimetableExtractor.count_registered_published_services(self)
+        published = all_services.query('published_services >0')
 
         percentage = round(float((len(published) / len(all_services)) * 100), 2)
 
@@ -900,18 +1286,7 @@ class TimetableExtractor:
         '''returns a dataframe of services found in the otc database (input) which are not found in the published data from the api (input)
         Note - only to be run on all published datasets'''
 
-        service_line_lite = self.service_line_extract[
-            ['DatasetID', 'OperatorName', 'bods_compliance', 'NOC', 'TradingName', 'LicenceNumber', 'OperatorShortName',
-             'OperatorCode', 'ServiceCode']]
-
-        full_merge = self.otc_db[['service_code', 'op_name', 'lic_no', 'auth_description']].merge(service_line_lite,
-                                                                                                  how='outer',
-                                                                                                  right_on='ServiceCode',
-                                                                                                  left_on='service_code')
-        not_published_full = full_merge[full_merge['ServiceCode'].isnull()]
-        not_published = not_published_full[['service_code', 'op_name', 'lic_no', 'auth_description']]
-
-        not_published = not_published.drop_duplicates()
+        not_published = self.otc_reconciliation().registered_not_published()
 
         print(f'\nNumber of service codes in OTC database that are not published on BODS: {len(not_published)}')
 
@@ -921,25 +1296,26 @@ class TimetableExtractor:
         '''returns a dataframe of services found in the published data from the api (input) which are not found in the otc database (input)
         Note - only to be run on all published datasets'''
 
-        service_line_lite = self.service_line_extract[
-            ['DatasetID', 'OperatorName', 'bods_compliance', 'NOC', 'TradingName', 'LicenceNumber', 'OperatorShortName',
-             'OperatorCode', 'ServiceCode', ]]
+        not_registered = self.otc_reconciliation().published_not_registered()
 
-        full_merge = self.otc_db[['service_code', 'op_name', 'lic_no', 'auth_description']].merge(service_line_lite,
-                                                                                                  how='outer',
-                                                                                                  right_on='ServiceCode',
-                                                                                                  left_on='service_code')
+        print(f'\nNumber of service codes published on BODS not in OTC database: {len(not_registered)}')
 
-        not_registered_full = full_merge[full_merge['service_code'].isnull()]
-        not_registered = not_registered_full[
-            ['DatasetID', 'OperatorName', 'bods_compliance', 'NOC', 'TradingName', 'LicenceNumber', 'OperatorShortName',
-             'OperatorCode', 'ServiceCode']]
+        return not_registered
 
-        not_registered = not_registered.drop_duplicates()
+    # the reconciliation of OTC and BODS services by admin area, once computed
+    _area_reconciliation = None
 
-        print(f'\nNumber of service codes published on BODS not in OTC database: {len(not_registered)}')
+    def area_reconciliation(self):
+        '''
+        The reconciliation of services in the OTC database and on BODS by admin area, shared by the
+        by area reports. It is computed once, and again only if the OTC database or extract is replaced.
+        '''
 
-        return not_registered
+        if self._area_reconciliation is None or not self._area_reconciliation.is_for(
+                self.otc_db, self.service_line_extract_with_stop_level_json):
+            self._area_reconciliation = AreaReconciliation(self.otc_db, self.service_line_extract_with_stop_level_json)
+
+        return self._area_reconciliation
 
     def services_on_bods_or_otc_by_area(self):
         '''
@@ -949,86 +1325,7 @@ class TimetableExtractor:
         Note - only to be run on all published datasets
         '''
 
-        # read in lookup file from repo that links admin areas to ATCO codes
-
-        # try except ensures that this reads in lookup file whether pip installing the library, or cloning the repo from GitHub
-        try:
-            # import the csv file as a text string from the BODSDataExtractor package
-            atco_lookup_file = importlib.resources.read_text('BODSDataExtractor',
-                                                             'BODSDataExtractor/ATCO_code_to_LA_lookup.csv')
-            # wrap lookup_file string into a stringIO object so it can be read by pandas
-            atco_lookup_string = io.StringIO(atco_lookup_file)
-
-            la_lookup = pd.read_csv(atco_lookup_string, dtype={'ATCO Code': str})
-        except:
-            la_lookup = pd.read_csv('ATCO_code_to_LA_lookup.csv', dtype={'ATCO Code': str})
-
-        # fetch latest version of OTC database
-        otc = self.otc_db.drop_duplicates()
-
-        # enrich OTC data with ATCO code
-        otc_la_merge = otc[['service_code', 'service_number', 'op_name', 'auth_description']].merge(
-            la_lookup[['Auth_Description', 'ATCO Code']], how='left', right_on='Auth_Description',
-            left_on='auth_description').drop_duplicates()
-
-        # call full BODS timetables data extract and enrich with admin area name
-        bods_la_merge = self.service_line_extract_with_stop_level_json[
-            ['ServiceCode', 'LineName', 'la_code', 'OperatorName']].merge(
-            la_lookup[['Admin Area Name associated with ATCO Code', 'ATCO Code']], how='left', right_on='ATCO Code',
-            left_on='la_code').drop_duplicates()
-
-        # add cols to distinguish if in otc and if in bods
-        otc_la_merge['in'] = 1
-        bods_la_merge['in'] = 1
-
-        # ensure linename col is consistent across bods and otc
-        otc_la_merge.rename(columns={'service_number': 'LineName'}, inplace=True)
-
-        # merge OTC service level data with BODS service level data
-        full_service_code_with_atco = otc_la_merge[
-            ['service_code', 'LineName', 'op_name', 'ATCO Code', 'in', 'auth_description']].add_suffix('_otc').merge(
-            bods_la_merge.add_suffix('_bods'), how='outer', right_on=['ServiceCode_bods', 'ATCO Code_bods'],
-            left_on=['service_code_otc', 'ATCO Code_otc']).drop_duplicates()
-
-        # coalesce service code and atco code cols
-        full_service_code_with_atco['service_code'] = full_service_code_with_atco['service_code_otc'].combine_first(
-            full_service_code_with_atco['ServiceCode_bods'])
-        full_service_code_with_atco['atco_code'] = full_service_code_with_atco['ATCO Code_otc'].combine_first(
-            full_service_code_with_atco['ATCO Code_bods'])
-
-        # keep only necessary cols
-        full_service_code_with_atco = full_service_code_with_atco[
-            ['service_code', 'LineName_otc', 'LineName_bods', 'op_name_otc', 'OperatorName_bods', 'atco_code', 'in_otc',
-             'in_bods', 'auth_description_otc']]
-
-        # add admin area name
-        full_service_code_with_atco = full_service_code_with_atco.merge(
-            la_lookup[['Admin Area Name associated with ATCO Code', 'ATCO Code']], how='left', left_on='atco_code',
-            right_on='ATCO Code').drop_duplicates()
-
-        # remove dupicate atco code col
-        del full_service_code_with_atco['ATCO Code']
-
-        # replace nans with 0s (necessary for mi reporting calculations)
-        full_service_code_with_atco['in_otc'] = full_service_code_with_atco['in_otc'].fillna(0)
-        full_service_code_with_atco['in_bods'] = full_service_code_with_atco['in_bods'].fillna(0)
-
-        # format line nos into desired list format, so as to not explode rest of dataframe
-        # replace nulls with string so groupby doesnt omit them
-        full_service_code_with_atco['LineName_bods'] = full_service_code_with_atco['LineName_bods'].fillna('xxxxx')
-        # groupby to concat the bods line nos together
-        full_service_code_with_atco = full_service_code_with_atco.groupby(
-            ['service_code', 'LineName_otc', 'op_name_otc', 'OperatorName_bods', 'atco_code', 'in_otc', 'in_bods',
-             'auth_description_otc', 'Admin Area Name associated with ATCO Code'], as_index=False, dropna=False).agg(
-            {'LineName_bods': lambda x: ','.join(x)})
-        # regenerate the nulls
-        full_service_code_with_atco['LineName_bods'] = full_service_code_with_atco['LineName_bods'].replace('xxxxx',
-                                                                                                            None)
-        # reorder cols
-        full_service_code_with_atco = full_service_code_with_atco[
-            ['service_code', 'LineName_otc', 'LineName_bods', 'op_name_otc', 'OperatorName_bods', 'atco_code', 'in_otc',
-             'in_bods', 'auth_description_otc', 'Admin Area Name associated with ATCO Code']]
-        return full_service_code_with_atco
+        return self.area_reconciliation().services()
 
     def services_on_bods_or_otc_by_area_mi(self):
         '''
@@ -1038,19 +1335,7 @@ class TimetableExtractor:
         Note - only to be run on all published datasets
         '''
 
-        full_service_code_with_atco = TimetableExtractor.services_on_bods_or_otc_by_area(self)
-        service_atco_mi = full_service_code_with_atco.groupby('atco_code').agg({'service_code': 'count'
-                                                                                   ,
-                                                                                'Admin Area Name associated with ATCO Code': 'first'
-                                                                                   , 'in_otc': 'mean'
-                                                                                   , 'in_bods': 'mean'})
-
-        service_atco_mi.rename(columns={'service_code': 'count_services'}, inplace=True)
-
-        # round fractions to 2 decimals
-        service_atco_mi = service_atco_mi.round(2)
-
-        return service_atco_mi
+        return self.area_reconciliation().mi()
 
     def services_on_bods_or_otc_by_area_just_otc(self):
         '''
@@ -1060,92 +1345,7 @@ class TimetableExtractor:
         Note - only to be run on all published datasets
         '''
 
-        # read in lookup file from repo that links admin areas to ATCO codes
-
-        # try except ensures that this reads in lookup file whether pip installing the library, or cloning the repo from GitHub
-        try:
-            # import the csv file as a text string from the BODSDataExtractor package
-            atco_lookup_file = importlib.resources.read_text('BODSDataExtractor',
-                                                             'BODSDataExtractor/ATCO_code_to_LA_lookup.csv')
-            # wrap lookup_file string into a stringIO object so it can be read by pandas
-            atco_lookup_string = io.StringIO(atco_lookup_file)
-
-            la_lookup = pd.read_csv(atco_lookup_string, dtype={'ATCO Code': str})
-
-
-
-        except:
-            la_lookup = pd.read_csv('ATCO_code_to_LA_lookup.csv', dtype={'ATCO Code': str})
-
-        # fetch latest version of OTC database
-        otc = self.otc_db.drop_duplicates()
-
-        # enrich OTC data with ATCO code
-        otc_la_merge = otc[['service_code', 'service_number', 'op_name', 'auth_description']].merge(
-            la_lookup[['Auth_Description', 'ATCO Code']], how='left', right_on='Auth_Description',
-            left_on='auth_description').drop_duplicates()
-
-        # call full BODS timetables data extract and enrich with admin area name
-        bods_la_merge = self.service_line_extract_with_stop_level_json[
-            ['ServiceCode', 'LineName', 'la_code', 'OperatorName']].merge(
-            la_lookup[['Admin Area Name associated with ATCO Code', 'ATCO Code']], how='left', right_on='ATCO Code',
-            left_on='la_code').drop_duplicates()
-
-        # add cols to distinguish if in otc and if in bods
-        otc_la_merge['in'] = 1
-        bods_la_merge['in'] = 1
-
-        # ensure linename col is consistent across bods and otc
-        otc_la_merge.rename(columns={'service_number': 'LineName'}, inplace=True)
-
-        # merge OTC service level data with BODS service level data
-        full_service_code_with_atco = otc_la_merge[
-            ['service_code', 'LineName', 'op_name', 'ATCO Code', 'in', 'auth_description']].add_suffix('_otc').merge(
-            bods_la_merge.add_suffix('_bods'), how='outer', right_on=['ServiceCode_bods', 'ATCO Code_bods'],
-            left_on=['service_code_otc', 'ATCO Code_otc']).drop_duplicates()
-
-        # coalesce service code and atco code cols
-        full_service_code_with_atco['service_code'] = full_service_code_with_atco['service_code_otc'].combine_first(
-            full_service_code_with_atco['ServiceCode_bods'])
-        full_service_code_with_atco['atco_code'] = full_service_code_with_atco['ATCO Code_otc'].combine_first(
-            full_service_code_with_atco['ATCO Code_bods'])
-
-        # keep only necessary cols
-        full_service_code_with_atco = full_service_code_with_atco[
-            ['service_code', 'LineName_otc', 'LineName_bods', 'op_name_otc', 'OperatorName_bods', 'atco_code', 'in_otc',
-             'in_bods', 'auth_description_otc']]
-
-        # add admin area name
-        full_service_code_with_atco = full_service_code_with_atco.merge(
-            la_lookup[['Admin Area Name associated with ATCO Code', 'ATCO Code']], how='left', left_on='atco_code',
-            right_on='ATCO Code').drop_duplicates()
-
-        # remove dupicate atco code col
-        del full_service_code_with_atco['ATCO Code']
-
-        # replace nans with 0s (necessary for mi reporting calculations)
-        full_service_code_with_atco['in_otc'] = full_service_code_with_atco['in_otc'].fillna(0)
-        full_service_code_with_atco['in_bods'] = full_service_code_with_atco['in_bods'].fillna(0)
-
-        # remove services not in otc
-        full_service_code_with_atco = full_service_code_with_atco[full_service_code_with_atco['in_otc'] == 1]
-
-        # format line nos into desired list format, so as to not explode rest of dataframe
-        # replace nulls with string so groupby doesnt omit them
-        full_service_code_with_atco['LineName_bods'] = full_service_code_with_atco['LineName_bods'].fillna('xxxxx')
-        # groupby to concat the bods line nos together
-        full_service_code_with_atco = full_service_code_with_atco.groupby(
-            ['service_code', 'LineName_otc', 'op_name_otc', 'OperatorName_bods', 'atco_code', 'in_otc', 'in_bods',
-             'auth_description_otc', 'Admin Area Name associated with ATCO Code'], as_index=False, dropna=False).agg(
-            {'LineName_bods': lambda x: ','.join(x)})
-        # regenerate the nulls
-        full_service_code_with_atco['LineName_bods'] = full_service_code_with_atco['LineName_bods'].replace('xxxxx',
-                                                                                                            None)
-        # reorder cols
-        full_service_code_with_atco = full_service_code_with_atco[
-            ['service_code', 'LineName_otc', 'LineName_bods', 'op_name_otc', 'OperatorName_bods', 'atco_code', 'in_otc',
-             'in_bods', 'auth_description_otc', 'Admin Area Name associated with ATCO Code']]
-        return full_service_code_with_atco
+        return self.area_reconciliation().services(just_otc=True)
 
     def services_on_bods_or_otc_by_area_mi_just_otc(self):
         '''
@@ -1155,238 +1355,12 @@ class TimetableExtractor:
         Note - only to be run on all published datasets
         '''
 
-        full_service_code_with_atco = TimetableExtractor.services_on_bods_or_otc_by_area_just_otc(self)
-        service_atco_mi = full_service_code_with_atco.groupby('atco_code').agg({'service_code': 'count'
-                                                                                   ,
-                                                                                'Admin Area Name associated with ATCO Code': 'first'
-                                                                                   , 'in_otc': 'mean'
-                                                                                   , 'in_bods': 'mean'})
-
-        service_atco_mi.rename(columns={'service_code': 'count_services'}, inplace=True)
-
-        # round fractions to 2 decimals
-        service_atco_mi = service_atco_mi.round(2)
-
-        return service_atco_mi
+        return self.area_reconciliation().mi(just_otc=True)
 
     def extract_timetable_operating_days(self, days):
         ''' Ensuring the operating days are ordered appropriately '''
 
-        if days is not None:
-            operating_day_list = list(days)
-            if any(day in {"Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"} for day in operating_day_list):
-                pass
-            else:
-                operating_days=', '.join(operating_day_list)
-                return operating_days
-
-        else:
-            operating_days= None
-            return operating_days
-
-
-
-        # adding dictionary variables and values to "day" dictionary
-
-        day = {}
-        day['Monday'] = 1
-        day['Tuesday'] = 2
-        day['Wednesday'] = 3
-        day['Thursday'] = 4
-        day['Friday'] = 5
-        day['Saturday'] = 6
-        day['Sunday'] = 7
-
-        brand_new = {}
-
-        # checking if the day of the week is in the above dictionary so we can sort the days
-        for i in operating_day_list:
-            if i in day:
-                brand_new.update({i: day[i]})
-
-            # sorting the days of operation
-        sortit = sorted(brand_new.items(), key=lambda x: x[1])
-
-        length = len(sortit)
-
-        operating_days = ""
-
-        consecutive = True
-
-        # checking to see if the days in the list are not consective
-
-        for i in range(length - 1):
-            if sortit[i + 1][1] - sortit[i][1] != 1:
-                consecutive = False
-                break
-
-        # if there are no days of operation entered
-        if length == 0:
-            operating_days = "None"
-
-        # if there is only one day of operation
-        elif length == 1:
-            operating_days = sortit[0][0]
-
-            # if the operating days are not consecutive, they're seperated by commas
-        elif consecutive:
-            for i in range(length):
-                operating_days = operating_days + sortit[i][0] + ","
-
-            # if consecutive, operating days are given as a range
-        else:
-            # print(sortit)
-            operating_days = sortit[0][0] + "-" + sortit[-1][0]
-
-        return operating_days
-
-    def extract_runtimes(self, vj, journey_pattern_timing_link, vjtl_index):
-
-        """Extract the runtimes from timing links as a string. If JPTL run time is 0, VJTL will be checked"""
-
-        # extract run times from jptl
-        runtime = journey_pattern_timing_link.RunTime
-
-        # if jptl runtime is 0, find equivalent vehicle journey pattern timing link run time
-        if pd.Timedelta(runtime).value == 0:
-
-            if vj.VehicleJourneyTimingLink is not None:
-                runtime = vj.VehicleJourneyTimingLink[vjtl_index[journey_pattern_timing_link.id]].RunTime
-
-                return runtime
-
-        return runtime
-
-    def extract_common_name(self, stop_object, StopPointRef, stop_point_index):
-        """Extract information about the name of the stop including longitude and latitude"""
-
-        stop_common_name = stop_object.AnnotatedStopPointRef[stop_point_index[StopPointRef]].CommonName
-        stop_location = stop_object.AnnotatedStopPointRef[stop_point_index[StopPointRef]].Location
-
-        if not stop_location:
-            stop_lat = "-"
-            stop_long = "-"
-
-        else:
-            stop_lat = stop_object.AnnotatedStopPointRef[stop_point_index[StopPointRef]].Location.Latitude
-            stop_long = stop_object.AnnotatedStopPointRef[stop_point_index[StopPointRef]].Location.Longitude
-
-        return stop_common_name, stop_lat, stop_long
-
-    def next_jptl_in_sequence(self, jptl, vj_departure_time, vj, vjtl_index, stop_object, stop_point_index,
-                              first_jptl=False):
-        """Returns the sequence number, stop point ref and time for a JPTL to be added to a outboud or inbound df"""
-
-        runtime = self.extract_runtimes(vj, jptl, vjtl_index)
-        common_name, latitude, longitude = self.extract_common_name(stop_object, str(jptl.To.StopPointRef),
-                                                                    stop_point_index)
-
-        to_sequence = [int(jptl.To.sequence_number),
-                       str(jptl.To.StopPointRef),
-                       latitude,
-                       longitude,
-                       str(common_name),
-                       pd.Timedelta(runtime)]
-
-        if first_jptl:
-            common_name, latitude, longitude = self.extract_common_name(stop_object, jptl.From.StopPointRef,
-                                                                        stop_point_index)
-
-            from_sequence = [int(jptl.From.sequence_number),
-                             str(jptl.From.StopPointRef),
-                             latitude,
-                             longitude,
-                             str(common_name),
-                             vj_departure_time]
-
-            return from_sequence, to_sequence
-
-        if not first_jptl:
-            return to_sequence
-
-    def collate_vjs(self, direction_df, collated_timetable):
-        """Combines all vehicle journeys together for inbound or outbound"""
-
-        if direction_df.empty:
-            pass
-        elif collated_timetable.empty:
-            # match stop point ref + sequence number with the initial timetable's stop point ref+sequence number
-            collated_timetable = collated_timetable.merge(direction_df, how='outer', left_index=True, right_index=True)
-
-        else:
-
-            if direction_df["Sequence Number"].equals(collated_timetable["Sequence Number"]) and direction_df['Stop Point Ref'].equals(collated_timetable['Stop Point Ref']) and direction_df["Common Name"].equals(collated_timetable["Common Name"]):
-                last_column = direction_df.iloc[:, -1]
-                collated_timetable=pd.concat([collated_timetable, last_column], axis=1)
-
-            else:
-                # match stop point ref + sequence number with the initial timetable's stop point ref+sequence number
-                collated_timetable = pd.merge(collated_timetable, direction_df, on=["Sequence Number",
-                                                                                'Stop Point Ref',
-                                                                                "Latitude",
-                                                                                "Longitude",
-                                                                                "Common Name"],
-                                              validate='1:m', how='outer').fillna("-")
-
-        return collated_timetable
-
-    def reformat_times(self, timetable, vj, base_time):
-        '''Turns the time deltas into time of day, final column is formatted as string'''
-
-        timetable[f"{vj.VehicleJourneyCode}"] = timetable[f"{vj.VehicleJourneyCode}"].cumsum()
-        timetable[f"{vj.VehicleJourneyCode}"] = timetable[f"{vj.VehicleJourneyCode}"].map(lambda x: x + base_time)
-        timetable[f"{vj.VehicleJourneyCode}"] = timetable[f"{vj.VehicleJourneyCode}"].map(lambda x: x.strftime('%H:%M'))
-
-        return timetable[f"{vj.VehicleJourneyCode}"]
-
-    def add_dataframe_headers(self, direction, operating_days, JourneyPattern_id, RouteRef, lineref, JourneyCode):
-        """Populate headers with information associated to each individual VJ"""
-
-        direction.loc[-1] = ["Operating Days ", "->", "->", "->", "->", operating_days]
-        direction.loc[-2] = ["Journey Pattern ", "->", "->", "->", "->", JourneyPattern_id]
-        direction.loc[-3] = ["Journey Code", "->", "->", "->", "->", JourneyCode]
-        direction.loc[-4] = ["RouteID", "->", "->", "->", "->", RouteRef]
-        direction.loc[-5] = ["Line", "->", "->", "->", "->", lineref]
-        direction.index = direction.index + 1  # shifting index
-        direction.sort_index(inplace=True)
-
-        return direction
-
-    def create_journey_pattern_section_object(self, journey_pattern_json):
-
-        if isinstance(journey_pattern_json['JourneyPatternSection'], dict):
-            journey_pattern_json['JourneyPatternSection'] = [journey_pattern_json['JourneyPatternSection']]
-
-        journey_pattern_section_object = from_dict(data_class=JourneyPatternSections, data=journey_pattern_json)
-
-        return journey_pattern_section_object
-
-    def create_vehicle_journey_object(self, vehicle_journey_json):
-
-        if isinstance(vehicle_journey_json['VehicleJourney'], dict):
-            vehicle_journey_json['VehicleJourney'] = [vehicle_journey_json['VehicleJourney']]
-
-        vehicle_journey = from_dict(data_class=VehicleJourneys, data=vehicle_journey_json)
-
-        return vehicle_journey
-
-    def create_service_object(self, services_json):
-
-        if isinstance(services_json['Lines']['Line'], dict):
-            services_json['Lines']['Line'] = [services_json['Lines']['Line']]
-
-        if isinstance(services_json['StandardService']['JourneyPattern'], dict):
-            services_json['StandardService']['JourneyPattern'] = [services_json['StandardService']['JourneyPattern']]
-
-        service_object = from_dict(data_class=Service, data=services_json)
-
-        return service_object
-
-    def create_stop_object(self, stops_json):
-
-        stop_object = from_dict(data_class=StopPoints, data=stops_json)
-
-        return stop_object
+        return timetable_operating_days(days)
 
     def map_indicies(self, service_object, stop_object, journey_pattern_section_object):
         """Initialise values to be used when generating timetables"""
@@ -1407,290 +1381,272 @@ class TimetableExtractor:
 
     def create_txc_objects(self):
 
-        self.stop_level_extract = self.service_line_extract_with_stop_level_json.copy(deep=True)
+        # the txc objects are built directly from the xml during extraction (see TXCObjectBuilder), and held in the
+        # stop level store, so the rows only need a shallow copy to add the timetables to
+        self.stop_level_extract = self.service_line_extract_with_stop_level_json.copy(deep=False)
 
-        self.stop_level_extract['vj_objects'] = self.stop_level_extract[
-            'vehicle_journey_json'].apply(self.create_vehicle_journey_object)
+        return self.stop_level_store.get_many(self.stop_level_extract['stop_level_handle'])
 
-        self.stop_level_extract['jps_objects'] = self.stop_level_extract[
-            'journey_pattern_json'].apply(self.create_journey_pattern_section_object)
+    def iterate_vjs(self, service_object, stop_object, vehicle_journey, journey_pattern_section_object,
+                    journey_pattern_section_index, journey_pattern_index, journey_pattern_list, stop_point_index):
+        """Collates the vehicle journeys of a service into outbound and inbound timetables"""
 
-        self.stop_level_extract['service_object'] = self.stop_level_extract[
-            'services_json'].apply(self.create_service_object)
+        timetable_builder = TimetableBuilder(service_object, stop_object, vehicle_journey,
+                                             journey_pattern_section_object, journey_pattern_section_index,
+                                             journey_pattern_index, journey_pattern_list, stop_point_index)
 
-        self.stop_level_extract['stop_objects'] = self.stop_level_extract[
-            'stops_json'].apply(self.create_stop_object)
+        return timetable_builder.build()
 
-    def iterate_vjs(self, service_object, stop_object, vehicle_journey, journey_pattern_section_object,
-                    collated_timetable_outbound, collated_timetable_inbound, base_time, journey_pattern_section_index,
-                    journey_pattern_index, journey_pattern_list, stop_point_index):
+    def generate_timetable(self, workers=None):
 
-        for vj in vehicle_journey.VehicleJourney:
+        """Extracts timetable information for a VJ individually and
+        adds to a collated dataframe of vjs, split by outbound and inbound.
+        Services are shared between a pool of processes if workers is more than 1
+        (defaults to the workers the extractor was created with)"""
+        if self.lazy_stop_level:
+            # the timetables of each file are generated as they are asked for, so just return them all
+            return self.timetables()
 
-            # take vehicle journey departure time
-            departure_time = pd.Timedelta(vj.DepartureTime)
+        print('Generating Timetables...')
 
-            vj_columns = ["Sequence Number", "Stop Point Ref", "Latitude", "Longitude", "Common Name",
-                          f"{vj.VehicleJourneyCode}"]
+        if workers is None:
+            workers = self.workers
 
-            # init empty timetable for outbound Vehicle journey
-            outbound = pd.DataFrame(columns=vj_columns)
+        txc_objects = self.create_txc_objects()
 
-            # init empty timetable for inbound Vehicle journey
-            inbound = pd.DataFrame(columns=vj_columns)
+        if self.naptan_store is not None:
+            self.fill_missing_stop_locations(stop_objects for _, _, _, stop_objects in txc_objects)
 
-            if vj.LineRef[-1] == ":":
-                lineref = vj.LineRef.split(':')[-2]
-            else:
-                lineref = vj.LineRef.split(':')[-1]
+        print('Mapping service indexes...')
+        # Map Indicies based on the objects of each row
+        indices = [TimetableExtractor.map_indicies(self, service_object, stop_objects, jps_objects)
+                   for jps_objects, _, service_object, stop_objects in txc_objects]
+        print('Calculating vehicle journeys...')
+        # Create Inbound and Outbound Timetables based on objects and indices
+        timetable_args = [(service_object, stop_objects, vj_objects, jps_objects, *row_indices)
+                          for (jps_objects, vj_objects, service_object, stop_objects), row_indices
+                          in zip(txc_objects, indices)]
+        del txc_objects, indices
+
+        # rows of the same file have the same timetables, so their long format tables are only built for the first
+        if self.build_stop_times:
+            stop_times = list(~self.stop_level_extract['stop_level_handle'].duplicated())
+        else:
+            stop_times = [False] * len(timetable_args)
 
-            vjtl_index = {}
+        if workers is not None and workers > 1 and len(timetable_args) > 1:
+            outbound, inbound, long_tables = self.generate_timetables_in_processes(timetable_args, stop_times, workers)
+        else:
+            outbound, inbound, long_tables = self.collect_timetables(map(build_timetables, timetable_args, stop_times),
+                                                                     len(timetable_args))
 
-            if vj.VehicleJourneyTimingLink is not None:
-                vjtl_index = {key.JourneyPatternTimingLinkRef: value for value, key in
-                              enumerate(vj.VehicleJourneyTimingLink)}
+        if self.build_stop_times:
+            print('Combining stop times...')
+            self.set_stop_times(self.stop_level_extract[stop_times], [long_tables[row] for row, first in
+                                                                      enumerate(stop_times) if first])
 
-            # Create vars for relevant indices of this vehicle journey
-            vehicle_journey_jp_index = journey_pattern_index[vj.JourneyPatternRef]
+        # results are in the same order as the rows of the stop level extract, whichever way they were generated
+        self.stop_level_extract['collated_timetable_outbound'] = pd.Series(outbound, dtype=object).to_numpy()
+        self.stop_level_extract['collated_timetable_inbound'] = pd.Series(inbound, dtype=object).to_numpy()
 
-            direction = service_object.StandardService.JourneyPattern[vehicle_journey_jp_index].Direction
-            RouteRef = service_object.StandardService.JourneyPattern[vehicle_journey_jp_index].RouteRef
-            JourneyPattern_id = service_object.StandardService.JourneyPattern[vehicle_journey_jp_index].id
-            if vj.Operational is None or vj.Operational.TicketMachine is None:
-                JourneyCode=None
-            else:
-                JourneyCode=str(vj.Operational.TicketMachine.JourneyCode)
-
-            # Get the journey pattern sections for this vehicle journey, can be a single string or a list of strings
-            vehicle_journey_jps_list = service_object.StandardService.JourneyPattern[
-                journey_pattern_index[vj.JourneyPatternRef]].JourneyPatternSectionRefs
-
-            # If there are multiple JPS, put them into a single list for later
-            if isinstance(vehicle_journey_jps_list, list):
-                vehicle_journey_jps_index = [journey_pattern_section_index[jpsr] for jpsr in
-                                             journey_pattern_list[vehicle_journey_jp_index].JourneyPatternSectionRefs]
-                all_jptl = [
-                    [jptl for jptl in journey_pattern_section_object.JourneyPatternSection[x].JourneyPatternTimingLink]
-                    for x in vehicle_journey_jps_index]
-                flat_jptl = [jptl for sublist in all_jptl for jptl in sublist]
-
-            # if just one JPS, find the journey pattern section directly for later
-            else:
-                vehicle_journey_jps_index = journey_pattern_section_index[vehicle_journey_jps_list]
-                flat_jptl = journey_pattern_section_object.JourneyPatternSection[
-                    vehicle_journey_jps_index].JourneyPatternTimingLink
-
-            # Mark the first JPTL
-            first = True
-
-            # Loop through relevant timing links
-
-            for JourneyPatternTimingLink in flat_jptl:
-
-                # first JPTL should use 'From' AND 'To' stop data
-                if first:
-
-                    # remaining JPTLs are not the first one
-                    first = False
-
-                    timetable_sequence = self.next_jptl_in_sequence(JourneyPatternTimingLink,
-                                                                    departure_time,
-                                                                    vj,
-                                                                    vjtl_index,
-                                                                    stop_object,
-                                                                    stop_point_index,
-                                                                    first_jptl=True)
-
-                    # Add first sequence, stop ref and departure time
-                    first_timetable_row = pd.DataFrame([timetable_sequence[0]], columns=outbound.columns)
-
-                    # Add To sequence number and stop point ref to the initial timetable
-
-                    if direction == 'outbound':
-                        outbound = pd.concat([outbound, first_timetable_row], ignore_index=True)
-                        outbound.loc[len(outbound)] = timetable_sequence[1]
-
-                    elif direction == 'inbound':
-                        inbound = pd.concat([inbound, first_timetable_row], ignore_index=True)
-                        inbound.loc[len(inbound)] = timetable_sequence[1]
-                    else:
-                        print(f'Unknown Direction in vehicle journey:{vj}: {direction}')
-
-                # if not first JPTL use 'to' sequence only
-                else:
-                    timetable_sequence = self.next_jptl_in_sequence(JourneyPatternTimingLink, departure_time, vj,
-                                                                    vjtl_index,
-                                                                    stop_object, stop_point_index)
-
-                    if direction == 'outbound':
-                        outbound.loc[len(outbound)] = timetable_sequence
-                    elif direction == 'inbound':
-                        inbound.loc[len(inbound)] = timetable_sequence
-                    else:
-                        print(f'Unknown Direction in vehicle journey:{vj}: {direction}')
-
-            # Fetch operating profile from either service object or vehicle journey
-           # if vj.OperatingProfile is None and service_object.OperatingProfile is not None:
-           #     days = service_object.OperatingProfile.RegularDayType.DaysOfWeek
-           # elif vj.OperatingProfile is not None:
-           #     days = vj.OperatingProfile.RegularDayType.DaysOfWeek
-
-            if vj.OperatingProfile is not None:
-                if vj.OperatingProfile.RegularDayType.DaysOfWeek is not None:
-                    days = vj.OperatingProfile.RegularDayType.DaysOfWeek
-                elif vj.OperatingProfile.BankHolidayOperation is not None:
-                    days = vj.OperatingProfile.BankHolidayOperation.DaysOfOperation
-
-                else:
-                    days = "Days Not Found"
-
-            elif service_object.OperatingProfile is not None:
-                if service_object.OperatingProfile.RegularDayType.DaysOfWeek is not None:
-                    days = service_object.OperatingProfile.RegularDayType.DaysOfWeek
-                elif service_object.OperatingProfile.BankHolidayOperation is not None:
-                    days = service_object.OperatingProfile.BankHolidayOperation.DaysOfOperation
-                else:
-                    days = "Days Not Found"
-            else:
-                days = "Days Not Found"
+        # Reduce size of stop level extract
+        self.stop_level_extract = self.stop_level_extract.drop(
+            columns=self.stop_level_dropped_columns + ['stop_level_handle'])
+        print('Timetables Generated!')
 
-            if days is None and (service_object.OperatingProfile is None):
-                operating_days = "Error: Check File"
-            else:
-                operating_days = self.extract_timetable_operating_days(days)
+        #self.stop_level_extract = self.stop_level_extract.to_dict()
 
-            if not outbound.empty:
-                outbound[f"{vj.VehicleJourneyCode}"] = self.reformat_times(outbound, vj, base_time)
-                outbound = self.add_dataframe_headers(outbound, operating_days, JourneyPattern_id, RouteRef, lineref,JourneyCode)
+        return self.stop_level_extract
 
-            if not inbound.empty:
-                inbound[f"{vj.VehicleJourneyCode}"] = self.reformat_times(inbound, vj, base_time)
-                inbound = self.add_dataframe_headers(inbound, operating_days, JourneyPattern_id, RouteRef, lineref,JourneyCode)
+    def generate_timetables_in_processes(self, timetable_args, stop_times, workers):
+        """Generates the timetables for each service across a pool of processes. On Linux, processes are forked and
+        inherit the services' objects, which is much quicker than pickling them to send to each process. Elsewhere
+        they are spawned, as forking a process that has started threads (e.g. to download datasets) is not safe on
+        macOS"""
+
+        if platform.startswith('linux'):
+            timetable_builder.shared_timetable_args = list(zip(timetable_args, stop_times))
+            try:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                            mp_context=multiprocessing.get_context('fork')) as executor:
+                    results = executor.map(timetable_builder.build_shared_timetables, range(len(timetable_args)),
+                                           chunksize=max(1, len(timetable_args) // (workers * 4)))
+                    return self.collect_timetables(results, len(timetable_args))
+            finally:
+                timetable_builder.shared_timetable_args = []
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            # services are sent to the processes in chunks, to limit the overhead of sending them one at a time
+            results = executor.map(build_timetables, timetable_args, stop_times,
+                                   chunksize=max(1, len(timetable_args) // (workers * 4)))
+            return self.collect_timetables(results, len(timetable_args))
+
+    def collect_timetables(self, results, total):
+        """Collects the timetables (and long format tables) generated for each row of the stop level extract, in
+        order, reporting progress and any services whose timetables could not be generated"""
+
+        outbound = []
+        inbound = []
+        long_tables = []
+        report_every = max(1, total // 10)
+
+        for row, (collated_timetable_outbound, collated_timetable_inbound, long, error) in enumerate(results):
+
+            if error is not None:
+                service = self.stop_level_extract.iloc[row]
+                print(f'*****Error generating timetables for {service["ServiceCode"]} in {service["FileName"]}: '
+                      f'{error}*****')
+                TimetableExtractor.error_list.append(service['URL'])
+
+            outbound.append(collated_timetable_outbound)
+            inbound.append(collated_timetable_inbound)
+            long_tables.append(long)
+
+            if (row + 1) % report_every == 0 or row + 1 == total:
+                print(f'Timetables generated for {row + 1:,} of {total:,} services')
+
+        return outbound, inbound, long_tables
 
-            # collect vj information together for outbound
-            collated_timetable_outbound = self.collate_vjs(outbound, collated_timetable_outbound)
+    def organise_timetables(self, service_object, collated_timetable_outbound, collated_timetable_inbound):
+        """Ordering the timetables correctly"""
 
-            # collect vj information together for inbound
-            collated_timetable_inbound = self.collate_vjs(inbound, collated_timetable_inbound)
+        return organise_timetable(collated_timetable_outbound), organise_timetable(collated_timetable_inbound)
 
-        collated_timetable_outbound, collated_timetable_inbound = self.organise_timetables(service_object,
-                                                                                           collated_timetable_outbound,
-                                                                                           collated_timetable_inbound)
 
-        return collated_timetable_outbound, collated_timetable_inbound
+class xmlDataExtractor:
 
-    def generate_timetable(self):
+    def __init__(self, filepath):
+        self.root = ET.parse(filepath).getroot()
+        self.namespace = self.root.nsmap
 
-        """Extracts timetable information for a VJ individually and
-        adds to a collated dataframe of vjs, split by outbound and inbound"""
-        print('Generating Timetables...')
-        # Define a base time to add run times to
-        base_time = datetime.datetime(2000, 1, 1, 0, 0, 0)
+    def qualify(self, tag):
+        """Returns the tag name qualified with the default namespace of the document, as used by lxml"""
 
-        # Dataframe to store all inbound vjs together
-        self.collated_timetable_inbound = pd.DataFrame()
+        default_namespace = self.namespace.get(None)
 
-        # Dataframe to store all outbound vjs together
-        self.collated_timetable_outbound = pd.DataFrame()
+        if default_namespace is None:
+            return tag
 
-        self.create_txc_objects()
+        return f'{{{default_namespace}}}{tag}'
 
-        print('Mapping service indexes...')
-        # Map Indicies based on objects present on dataframe row
-        self.stop_level_extract[
-            ['jps_index', 'jpindex', 'jplist', 'stop_index']] = self.stop_level_extract.apply(
-            lambda x: TimetableExtractor.map_indicies(self, x.service_object, x.stop_objects,
-                                                      x.jps_objects), axis=1).apply(pd.Series)
-        print('Calculating vehicle journeys...')
-        # Create Inbound and Outbound Timetables based on objects and indices
-        self.stop_level_extract[
-            ['collated_timetable_outbound', 'collated_timetable_inbound']] = self.stop_level_extract.apply(
-            lambda x: TimetableExtractor.iterate_vjs(self, x.service_object,
-                                                     x.stop_objects,
-                                                     x.vj_objects,
-                                                     x.jps_objects,
-                                                     self.collated_timetable_outbound,
-                                                     self.collated_timetable_inbound,
-                                                     base_time,
-                                                     x.jps_index,
-                                                     x.jpindex,
-                                                     x.jplist,
-                                                     x.stop_index), axis=1).apply(pd.Series)
-        # Reduce size of stop level extract
-        self.stop_level_extract = self.stop_level_extract.drop(
-            columns=['dq_score', 'OperatorShortName', 'Status', 'services_json', 'NOC', 'PublicUse', 'TradingName',
-                     'SchemaVersion', 'OperatorName', 'LicenceNumber', 'Origin', 'vehicle_journey_json', 'OperatorCode',
-                     'Destination', 'dq_rag', 'Description', 'Comment', 'FileType', 'bods_compliance',
-                     'journey_pattern_json', 'stops_json', 'OperatingPeriodEndDate', 'la_code', 'vj_objects',
-                     'jps_objects', 'service_object', 'stop_objects', 'jps_index', 'jpindex', 'jplist', 'stop_index'])
-        print('Timetables Generated!')
+    def extract_service_level_info(self):
+        return self.extract_txc_data()[0]
 
-        #self.stop_level_extract = self.stop_level_extract.to_dict()
+    def extract_txc_data(self, stop_level=False, service_filter=None):
 
-        return self.stop_level_extract
+        '''
+        Walks the top level sections of the document once, collecting all of the service level
+        fields and, if requested, the stop level objects in the same pass, rather than searching the
+        whole tree once per field and parsing the file a second time for the stop level data.
 
-    def organise_timetables(self, service_object, collated_timetable_outbound, collated_timetable_inbound):
-        """Ordering the timetables correctly"""
+        Returns a tuple of the service level info (in the same order as the extract_ methods) and
+        a list of the JourneyPatternSections, VehicleJourneys, Service and StopPoints objects (None
+        if stop level data is not requested). With a ServiceFilter, the objects are of the services
+        and lines it matches.
+        '''
 
-        service_code = str(service_object.ServiceCode)
+        self.start_service_level_info()
+        sections = {}
 
-        if not collated_timetable_outbound.empty:
+        for section in self.root:
 
-            # ensuring the sequence numbers are sorted in ascending order
-            collated_timetable_outbound.iloc[5:] = collated_timetable_outbound.iloc[5:].sort_values(by="Sequence Number"
-                                                                                                    , ascending=True)
+            # skip comments and processing instructions
+            if not isinstance(section.tag, str):
+                continue
 
-        if not collated_timetable_inbound.empty:
+            sections[ET.QName(section).localname] = section
+            self.collect_section(section)
 
-            collated_timetable_inbound.iloc[5:] = collated_timetable_inbound.iloc[5:].sort_values(by="Sequence Number"
-                                                                                                  , ascending=True)
+        # operating days are only taken from the vehicle journeys if not found at service level
+        if self.service_days == [] and 'VehicleJourneys' in sections:
+            self.service_days = sections['VehicleJourneys'].findall(
+                './/VehicleJourney/OperatingProfile/RegularDayType/DaysOfWeek/', self.namespace)
 
-        return collated_timetable_outbound, collated_timetable_inbound
+        service_level_info = self.service_level_info()
 
+        if not stop_level:
+            return service_level_info, None
 
-class xmlDataExtractor:
+        # build the stop level objects directly from the tree already parsed
+        builder = TXCObjectBuilder(self.namespace.get(None))
 
-    def __init__(self, filepath):
-        self.root = ET.parse(filepath).getroot()
-        self.namespace = self.root.nsmap
+        keep_service = keep_vehicle_journey = None
+        if service_filter is not None:
+            keep_service, keep_vehicle_journey = service_filter.file_filters(sections.get('Services'), self.qualify)
 
-    def extract_service_level_info(self):
-        filename = self.extract_filename()
-        noc = self.extract_noc()
-        trading_name = self.extract_trading_name()
-        licence_number = self.extract_licence_number()
-        operator_short_name = self.extract_operator_short_name()
-        operator_code = self.extract_operator_code()
-        service_code = self.extract_service_code()
-        line_name = self.extract_line_name()
-        public_use = self.extract_public_use()
-        operating_days = self.extract_operating_days()
-        service_origin = self.extract_service_origin()
-        service_destination = self.extract_service_destination()
-        operating_period_start_date = self.extract_operating_period_start_date()
-        operating_period_end_date = self.extract_operating_period_end_date()
-        schema_version = self.extract_schema_version()
-        revision_number = self.extract_revision_number()
-        la_code = self.extract_la_code()
+        stop_level_info = [
+            builder.build_journey_pattern_sections(sections['JourneyPatternSections']),
+            builder.build_vehicle_journeys(sections['VehicleJourneys'], keep_vehicle_journey),
+            builder.build_service(sections['Services'], keep_service),
+            builder.build_stop_points(sections['StopPoints']),
+        ]
+
+        return service_level_info, stop_level_info
+
+    def start_service_level_info(self):
+        """Starts collecting the service level fields, which collect_section adds to from each top level section"""
+
+        self.operator_fields = {self.qualify(tag): [] for tag in ['NationalOperatorCode', 'TradingName',
+                                                                  'LicenceNumber', 'OperatorShortName', 'OperatorCode']}
+        self.service_code = []
+        self.line_name = []
+        self.public_use = []
+        self.service_days = []
+        self.service_origin = []
+        self.service_destination = []
+        self.operating_period_start_date = []
+        self.operating_period_end_date = []
+        self.atco_first_3_letters = set()
+
+    def collect_section(self, section):
+        """Collects the service level fields within a top level section of the document"""
+
+        if section.tag == self.qualify('Operators'):
+            for element in section.iterdescendants(*self.operator_fields):
+                self.operator_fields[element.tag].append(element.text)
+
+        elif section.tag == self.qualify('Services'):
+            for service in section.iterdescendants(self.qualify('Service')):
+                self.service_code.extend(i.text for i in service.iterchildren(self.qualify('ServiceCode')))
+                self.line_name.extend(i.text for i in service.iterfind('Lines/Line/LineName', self.namespace))
+                self.public_use.extend(i.text for i in service.iterchildren(self.qualify('PublicUse')))
+                self.service_days.extend(service.iterfind('OperatingProfile/RegularDayType/DaysOfWeek/',
+                                                          self.namespace))
+                self.service_origin.extend(i.text for i in service.iterfind('StandardService/Origin',
+                                                                            self.namespace))
+                self.service_destination.extend(
+                    i.text for i in service.iterfind('StandardService/Destination', self.namespace))
+                self.operating_period_start_date.extend(
+                    i.text for i in service.iterfind('OperatingPeriod/StartDate', self.namespace))
+                self.operating_period_end_date.extend(
+                    i.text if i.text else 'No Data' for i in service.iterfind('OperatingPeriod/EndDate',
+                                                                              self.namespace))
+
+        elif section.tag == self.qualify('StopPoints'):
+            self.collect_stop_point_refs(section)
+
+    def collect_stop_point_refs(self, element):
+        """Collects the admin areas (first 3 characters of the ATCO code) of the stop point refs within an element"""
+
+        self.atco_first_3_letters.update(i.text[0:3] for i in element.iter(self.qualify('StopPointRef')))
+
+    def service_level_info(self):
+        """The service level fields collected, in the same order as the extract_ methods"""
 
         return [
-            filename,
-            noc,
-            trading_name,
-            licence_number,
-            operator_short_name,
-            operator_code,
-            service_code,
-            line_name,
-            public_use,
-            operating_days,
-            service_origin,
-            service_destination,
-            operating_period_start_date,
-            operating_period_end_date,
-            schema_version,
-            revision_number,
-            la_code,
+            self.extract_filename(),
+            *self.operator_fields.values(),
+            self.service_code,
+            self.line_name,
+            self.public_use,
+            self.format_operating_days(self.service_days),
+            self.service_origin,
+            self.service_destination,
+            self.operating_period_start_date,
+            self.operating_period_end_date,
+            self.extract_schema_version(),
+            self.extract_revision_number(),
+            list(self.atco_first_3_letters),
         ]
 
     def extract_filename(self):
@@ -1842,6 +1798,15 @@ class xmlDataExtractor:
         else:
             pass
 
+        return self.format_operating_days(data)
+
+    def format_operating_days(self, data):
+
+        '''
+        Orders the day of week elements found in an operating profile and formats them as a
+        single string, either as a range of consecutive days or a comma separated list.
+        '''
+
         daysoperating = []
 
         for count, value in enumerate(data):
@@ -2028,3 +1993,280 @@ class xmlDataExtractor:
         unique_atco_first_3_letters = list(set(atco_first_3_letters))
 
         return unique_atco_first_3_letters
+
+
+class StreamingXmlDataExtractor(xmlDataExtractor):
+
+    '''
+    Extracts the same data as xmlDataExtractor, for files too large to hold as a whole tree. The
+    file is read with iterparse, and each vehicle journey, journey pattern section, stop point,
+    route and route section is processed as soon as it has been read and then removed from the
+    tree, so the memory taken by the tree depends on the largest of them rather than on the file.
+    The Operators and Services sections, which are small, are kept whole.
+    '''
+
+    # the sections processed one item at a time, and the class each is built into for the stop level
+    streamed_sections = {'StopPoints': StopPoints, 'JourneyPatternSections': JourneyPatternSections,
+                         'VehicleJourneys': VehicleJourneys}
+
+    # the sections and items iterparse stops at (in C, skipping the elements within them), which includes the routes
+    # so that they are removed from the tree too
+    streamed_tags = ['Operators', 'Services', 'StopPoints', 'AnnotatedStopPointRef', 'StopPoint',
+                     'JourneyPatternSections', 'JourneyPatternSection', 'VehicleJourneys', 'VehicleJourney',
+                     'RouteSections', 'RouteSection', 'Routes', 'Route']
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+        # the root element (without its sections, once they have been read) and its namespaces, once parsing starts
+        self.root = None
+        self.namespace = {}
+
+    def extract_txc_data(self, stop_level=False, service_filter=None):
+
+        '''
+        Extracts the service level info and (if requested) the stop level objects as
+        xmlDataExtractor.extract_txc_data does, in a single streamed pass of the file. With a
+        ServiceFilter, returns None as soon as the Services section has been read if the file does
+        not have the services asked for.
+        '''
+
+        self.stop_level = stop_level
+        self.service_filter = service_filter
+        self.keep_service = self.keep_vehicle_journey = None
+
+        # the values of the objects of the streamed sections, as their items are added
+        self.streamed = {}
+        stop_level_objects = {}
+
+        # the operating days of the vehicle journeys, by day, in case there are none at service level
+        self.vehicle_journey_days = {}
+
+        for _, element in ET.iterparse(self.filepath, events=('end',), tag=[f'{{*}}{tag}' for tag in
+                                                                            self.streamed_tags]):
+            if self.root is None:
+                self.start_streaming(element)
+
+            parent = element.getparent()
+
+            # the end of a top level section
+            if parent is self.root:
+                name = ET.QName(element).localname
+
+                if name in self.streamed_sections:
+                    # any items not streamed (of other types), and the last item, which was only emptied
+                    for item in element:
+                        self.process_item(name, element, item)
+
+                    if stop_level:
+                        stop_level_objects[name] = self.finish_section(name, element)
+
+                    element.clear()
+                    continue
+
+                self.collect_section(element)
+
+                if name == 'Services' and service_filter is not None:
+                    if not service_filter.matching_services(element, self.qualify):
+                        return None
+                    self.keep_service, self.keep_vehicle_journey = service_filter.file_filters(element, self.qualify)
+
+                if name == 'Services' and stop_level:
+                    stop_level_objects[name] = self.builder.build_service(element, self.keep_service)
+
+                continue
+
+            # an item within a top level section, rather than an element of the same name within an item
+            if parent is None or parent.getparent() is not self.root:
+                continue
+
+            name = ET.QName(parent).localname
+
+            if name in self.streamed_sections:
+                self.process_item(name, parent, element)
+
+            # empty the item, and remove those before it from the tree, now it has been processed
+            element.clear()
+            while element.getprevious() is not None:
+                del parent[0]
+
+        # a file without a Services section has none of the services asked for
+        if service_filter is not None and self.keep_service is None:
+            return None
+
+        # operating days are only taken from the vehicle journeys if not found at service level
+        if self.service_days == []:
+            self.service_days = list(self.vehicle_journey_days.values())
+
+        service_level_info = self.service_level_info()
+
+        if not stop_level:
+            return service_level_info, None
+
+        stop_level_info = [
+            stop_level_objects['JourneyPatternSections'],
+            stop_level_objects['VehicleJourneys'],
+            stop_level_objects['Services'],
+            stop_level_objects['StopPoints'],
+        ]
+
+        return service_level_info, stop_level_info
+
+    def start_streaming(self, element):
+        """Finds the root of the document from the first element read, and starts collecting with its namespace"""
+
+        self.root = element
+        while self.root.getparent() is not None:
+            self.root = self.root.getparent()
+
+        self.namespace = self.root.nsmap
+        self.builder = TXCObjectBuilder(self.namespace.get(None))
+        self.start_service_level_info()
+
+    def process_item(self, name, section, item):
+        """Collects the service level fields of an item of a streamed section, and adds it to the section's object"""
+
+        keep = True
+
+        if name == 'StopPoints':
+            self.collect_stop_point_refs(item)
+
+        elif name == 'VehicleJourneys' and item.tag == self.qualify('VehicleJourney'):
+            for day in item.iterfind('OperatingProfile/RegularDayType/DaysOfWeek/', self.namespace):
+                self.vehicle_journey_days.setdefault(day.tag, str(day))
+
+            # vehicle journeys of other services are left out (keep_vehicle_journey is None without a filter)
+            if self.service_filter is not None and self.keep_vehicle_journey is None:
+                self.keep_vehicle_journey = self.service_filter.file_filters(None, self.qualify)[1]
+
+            keep = self.keep_vehicle_journey is None or self.keep_vehicle_journey(item)
+
+        if not self.stop_level:
+            return
+
+        if name not in self.streamed:
+            self.streamed[name] = self.builder.start_build(self.streamed_sections[name], section)
+
+        if keep:
+            self.builder.add_children(self.streamed_sections[name], self.streamed[name], [item])
+
+    def finish_section(self, name, element):
+        """Builds the object of a streamed section from the values its items have been added to, as xmlDataExtractor
+        would have built it from the whole section"""
+
+        values = self.streamed.pop(name, None)
+
+        if name == 'VehicleJourneys' and self.keep_vehicle_journey is not None:
+            return VehicleJourneys(VehicleJourney=[] if values is None else values['VehicleJourney'])
+
+        if values is None:
+            return self.builder.build(self.streamed_sections[name], element)
+
+        return self.builder.finish_build(self.streamed_sections[name], values)
+
+
+def xml_size(xml):
+    """The size in bytes of an xml file object, or None if it can't be told without reading it"""
+
+    if isinstance(xml, io.BytesIO):
+        return xml.getbuffer().nbytes
+
+    try:
+        return os.fstat(xml.fileno()).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+
+def is_streamed(xml, streaming_threshold=None, size=None):
+    """Whether an xml file is larger than streaming_threshold bytes, and so is streamed rather than parsed whole. The
+    size of the file is found from the file object if not given"""
+
+    if streaming_threshold is None:
+        return False
+
+    if size is None:
+        size = xml_size(xml)
+
+    return size is not None and size > streaming_threshold
+
+
+def xml_data_extractor(xml, streaming_threshold=None, size=None):
+    """An xmlDataExtractor for an xml file, or a StreamingXmlDataExtractor if it is larger than streaming_threshold
+    bytes"""
+
+    if is_streamed(xml, streaming_threshold, size):
+        return StreamingXmlDataExtractor(xml)
+
+    return xmlDataExtractor(xml)
+
+
+# extract_xml keeps the compressed xml of a file for its stop level data, rather than its objects
+LAZY = 'lazy'
+
+# the errors of an xml file that cannot be parsed or does not have the data expected, which leave out just that file
+# (anything else is a bug, and stops the extract)
+XML_FILE_ERRORS = (ET.XMLSyntaxError, ValueError, KeyError)
+
+
+def xml_columns(stop_level=False):
+    """The columns of the record extract_xml gives for each xml file"""
+
+    if stop_level == LAZY:
+        return XML_COLUMNS + ['stop_level_xml']
+    elif stop_level:
+        return XML_COLUMNS + STOP_LEVEL_COLUMNS
+
+    return XML_COLUMNS
+
+
+def extract_xml(url, xml, stop_level=False, service_filter=None, streaming_threshold=None, size=None):
+    """Extracts the service level info of an xml file (and if stop_level, its stop level objects, or if LAZY, its
+    compressed xml) into a record with the columns of xml_columns, streaming the file if it is larger than
+    streaming_threshold bytes. Returns None if the file does not have the services of the service_filter"""
+
+    xml_output = [url]
+
+    if stop_level == LAZY:
+        content = xml.read()
+        xml = io.BytesIO(content)
+
+    streamed = is_streamed(xml, streaming_threshold, size)
+
+    # files without the services asked for are skipped once their services have been read (which a streamed file is
+    # as it is extracted)
+    if service_filter is not None and not streamed:
+        if not service_filter.matches(xml):
+            return None
+        xml.seek(0)
+
+    extractor = StreamingXmlDataExtractor(xml) if streamed else xmlDataExtractor(xml)
+
+    # service level info and (if requested) the stop level objects are collected in a single pass of the document
+    txc_data = extractor.extract_txc_data(stop_level=stop_level is True, service_filter=service_filter)
+
+    if txc_data is None:
+        return None
+
+    service_level_info, stop_level_info = txc_data
+    xml_output.extend(service_level_info)
+
+    # if stop level data is requested, then need the additional columns that contain objects of the stop level info
+    if stop_level == LAZY:
+        xml_output.append(zlib.compress(content))
+    elif stop_level:
+        xml_output.extend(stop_level_info)
+
+    return xml_output
+
+
+def extract_txc_file(txc_file):
+    """Extracts a (url, xml content, stop_level, service_filter, streaming_threshold) tuple as downloaded by
+    download_txc_files. Defined at module level so that it can be run in a process pool"""
+
+    url, content, stop_level, service_filter, streaming_threshold = txc_file
+
+    try:
+        return extract_xml(url, io.BytesIO(content), stop_level, service_filter, streaming_threshold)
+    except ET.XMLSyntaxError as e:
+        # lxml's errors cannot be pickled to send back from a process pool, so are sent back as a ValueError
+        raise ValueError(f'XMLSyntaxError: {e}') from None
@@ -0,0 +1,118 @@
+#This file contains the store used to refresh an extract incrementally, keeping the extracted data of each
+#dataset between runs so that only new or changed datasets need to be downloaded and extracted again
+import hashlib
+import os
+
+import pandas as pd
+
+
+# metadata columns identifying the version of each dataset, kept in the snapshot where present
+SNAPSHOT_COLUMNS = ['url', 'id', 'modified', 'revision']
+
+
+class ExtractStore:
+    '''
+    Persists the extracted data of each dataset, with a snapshot of the metadata (id, modified
+    and revision) of the versions they were extracted from.
+
+    Each run compares its metadata with the snapshot: datasets that are new or whose version has
+    changed are extracted again, unchanged datasets are loaded from the store, and datasets no
+    longer in the metadata are removed from it. A store should therefore be used for the same
+    query (nocs, search, atco_code etc.) each run.
+
+    The snapshot also records a fingerprint of the settings each dataset was extracted with (e.g.
+    stop_level and the service filter), as they change what is extracted from each file. Datasets
+    extracted with other settings (or by a version that did not record them) are extracted again.
+
+    Arguments:
+        directory: folder to keep the store in, created if it does not exist
+        settings: the settings that change what is extracted, as a dict of name to value
+    '''
+
+    def __init__(self, directory, settings=None):
+        self.directory = os.path.expanduser(directory)
+        os.makedirs(os.path.join(self.directory, 'datasets'), exist_ok=True)
+        self.snapshot_path = os.path.join(self.directory, 'snapshot.csv')
+        self.settings = settings_fingerprint(settings or {})
+
+    def snapshot(self, all_settings=False):
+        """The metadata of the datasets held with the settings of this store (or with any settings), with the version
+        of each"""
+
+        if not os.path.exists(self.snapshot_path):
+            return pd.DataFrame(columns=SNAPSHOT_COLUMNS + ['version', 'settings'])
+
+        snapshot = pd.read_csv(self.snapshot_path, dtype=str, keep_default_na=False)
+        if 'settings' not in snapshot.columns:
+            snapshot['settings'] = ''
+
+        if all_settings:
+            return snapshot
+
+        return snapshot[snapshot['settings'] == self.settings]
+
+    def dataset_path(self, url):
+        return os.path.join(self.directory, 'datasets', f'{hashlib.sha1(url.encode()).hexdigest()}.pkl')
+
+    def changed(self, urls, versions):
+        """Returns the urls that are new, or whose version differs from the version held (or is unknown)"""
+
+        snapshot = self.snapshot()
+        held = dict(zip(snapshot['url'], snapshot['version']))
+
+        return [url for url in urls
+                if versions.get(url) is None or held.get(url) != versions[url]
+                or not os.path.exists(self.dataset_path(url))]
+
+    def update(self, metadata, versions, extracted):
+        '''
+        Stores the newly extracted data of each dataset (a dict of url to RecordBuilder), removes the
+        datasets no longer in the metadata, and returns the extracted data of every dataset in the
+        metadata: newly extracted, or loaded from the store if unchanged. Datasets that were due to
+        be extracted again but failed keep the version held, so they are tried again next run.
+        '''
+
+        previous = self.snapshot().set_index('url')
+        urls = metadata['url'].to_list()
+        changed = set(self.changed(urls, versions))
+
+        for url, txc_records in extracted.items():
+            pd.to_pickle(txc_records, self.dataset_path(url))
+
+        # the datasets no longer published (or no longer within the query)
+        removed = set(self.snapshot(all_settings=True)['url']) - set(urls)
+        for url in removed:
+            if os.path.exists(self.dataset_path(url)):
+                os.remove(self.dataset_path(url))
+
+        datasets = {}
+        for url in urls:
+            if url in extracted:
+                datasets[url] = extracted[url]
+            elif url not in changed:
+                datasets[url] = pd.read_pickle(self.dataset_path(url))
+
+        snapshot = metadata.filter(SNAPSHOT_COLUMNS).astype(str)
+        snapshot['version'] = snapshot['url'].map(versions).fillna('')
+        snapshot['settings'] = self.settings
+        snapshot = snapshot[snapshot['url'].isin(extracted.keys())]
+
+        # keep the held version of datasets not extracted this run
+        kept = previous[previous.index.isin(set(urls) - set(extracted))].reset_index()
+        snapshot = pd.concat([kept, snapshot])
+        snapshot.to_csv(self.snapshot_path, index=False)
+
+        print(f'Incremental refresh: {len(extracted):,} datasets extracted, '
+              f'{len(datasets) - len(extracted):,} unchanged, {len(removed):,} removed, '
+              f'{len(changed) - len(extracted):,} could not be extracted')
+
+        return datasets
+
+
+def settings_fingerprint(settings):
+    """A short hash of extraction settings, the same whatever order they (or any lists of values in them) are in"""
+
+    normalised = sorted((name, sorted(value) if isinstance(value, (list, tuple, set, frozenset)) else value)
+                        for name, value in settings.items())
+
+    return hashlib.sha1(repr(normalised).encode()).hexdigest()[:16]
@@ -0,0 +1,152 @@
+#This file contains a local store of NaPTAN stops, kept on disk by admin area and refreshed once it is out of date, so
+#that the locations and names of stops can be looked up without downloading the national NaPTAN file every time
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    from BODSDataExtractor.downloader import DatasetDownloader
+except:
+    from downloader import DatasetDownloader
+
+
+NAPTAN_URL = 'https://naptan.api.dft.gov.uk/v1/access-nodes'
+NAPTAN_COLUMNS = ['ATCOCode', 'CommonName', 'Longitude', 'Latitude']
+NAPTAN_DTYPES = {'ATCOCode': str, 'CommonName': str, 'Longitude': 'float64', 'Latitude': 'float64'}
+
+NAPTAN_CACHE_FOLDER = os.path.join(Path.home(), '.BODSDataExtractor', 'naptan')
+NAPTAN_CACHE_MAX_AGE = 24 * 60 * 60
+
+# the admin area (ATCO area code) of a stop is the first three characters of its ATCO code
+ADMIN_AREA_LENGTH = 3
+
+
+class NaptanStore:
+    '''
+    NaPTAN stops (ATCOCode, CommonName, Longitude and Latitude), cached on disk with a file for
+    each admin area. An admin area is downloaded again once its file is older than max_age
+    seconds. Only the admin areas asked for are downloaded, unless all stops are needed, when
+    the national file is downloaded once and split by admin area.
+
+    Stops loaded are indexed by ATCOCode, with their coordinates held as float arrays, so that
+    looking up a stop does not search the table.
+
+    Arguments:
+        directory: folder to keep the stops in, created if it does not exist
+        max_age: seconds before a cached admin area is downloaded again
+        downloader: optional DatasetDownloader to download with
+    '''
+
+    def __init__(self, directory=NAPTAN_CACHE_FOLDER, max_age=NAPTAN_CACHE_MAX_AGE, downloader=None):
+        self.directory = os.path.expanduser(directory)
+        self.max_age = max_age
+        self.downloader = downloader if downloader is not None else DatasetDownloader()
+
+        os.makedirs(os.path.join(self.directory, 'areas'), exist_ok=True)
+        self.national_path = os.path.join(self.directory, 'national')
+
+        self.admin_areas = set()
+        self.atco_codes = np.array([], dtype=object)
+        self.common_names = np.array([], dtype=object)
+        self.longitudes = np.array([], dtype=np.float64)
+        self.latitudes = np.array([], dtype=np.float64)
+        self.index = {}
+
+    def area_path(self, area):
+        return os.path.join(self.directory, 'areas', f'{area}.pkl')
+
+    def is_fresh(self, path):
+        return os.path.exists(path) and time.time() - os.path.getmtime(path) < self.max_age
+
+    def stops(self, admin_areas=None):
+        """Returns a dataframe of the stops in the given admin areas (or all stops if None), downloading any
+        areas not cached or out of date"""
+
+        if admin_areas is None:
+            if not self.is_fresh(self.national_path):
+                self.download()
+            admin_areas = [name[:-len('.pkl')] for name in os.listdir(os.path.join(self.directory, 'areas'))]
+        else:
+            admin_areas = sorted(set(admin_areas))
+            outdated = [area for area in admin_areas if not self.is_fresh(self.area_path(area))]
+            if outdated:
+                self.download(outdated)
+
+        areas = [pd.read_pickle(self.area_path(area)) for area in sorted(admin_areas)
+                 if os.path.exists(self.area_path(area))]
+
+        if not areas:
+            return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in NAPTAN_DTYPES.items()})
+
+        return pd.concat(areas, ignore_index=True)
+
+    def download(self, admin_areas=None):
+        """Downloads the stops of the given admin areas (or all stops if None) and caches them by admin area"""
+
+        if admin_areas is None:
+            print('Downloading NaPTAN stops...')
+            url = f'{NAPTAN_URL}?dataFormat=csv'
+        else:
+            print(f'Downloading NaPTAN stops for admin areas {", ".join(admin_areas)}...')
+            url = f'{NAPTAN_URL}?atcoAreaCodes={",".join(admin_areas)}&dataFormat=csv'
+
+        # streamed to disk and read from there, rather than decoded into one large string
+        response, naptan_file = self.downloader.get_file(url)
+        with naptan_file:
+            naptan = pd.read_csv(naptan_file, usecols=NAPTAN_COLUMNS, dtype=NAPTAN_DTYPES)[NAPTAN_COLUMNS]
+
+        areas = dict(tuple(naptan.groupby(naptan['ATCOCode'].str[:ADMIN_AREA_LENGTH], sort=False)))
+
+        # areas without stops are cached too, so that they are not downloaded again each time
+        for area in (admin_areas or []):
+            areas.setdefault(area, naptan.iloc[0:0])
+
+        for area, stops in areas.items():
+            temporary_path = f'{self.area_path(area)}.{os.getpid()}.tmp'
+            stops.reset_index(drop=True).to_pickle(temporary_path)
+            os.replace(temporary_path, self.area_path(area))
+
+        if admin_areas is None:
+            Path(self.national_path).touch()
+
+    def load(self, admin_areas=None):
+        """Loads the stops of the given admin areas (or all stops if None) into the index, in addition to those
+        loaded already"""
+
+        if admin_areas is not None:
+            admin_areas = set(admin_areas) - self.admin_areas
+            if not admin_areas:
+                return
+
+        stops = self.stops(admin_areas)
+        stops = stops[~stops['ATCOCode'].isin(self.index.keys())]
+
+        offset = len(self.atco_codes)
+        self.atco_codes = np.concatenate([self.atco_codes, stops['ATCOCode'].to_numpy(dtype=object)])
+        self.common_names = np.concatenate([self.common_names, stops['CommonName'].to_numpy(dtype=object)])
+        self.longitudes = np.concatenate([self.longitudes, stops['Longitude'].to_numpy(dtype=np.float64)])
+        self.latitudes = np.concatenate([self.latitudes, stops['Latitude'].to_numpy(dtype=np.float64)])
+        self.index.update(zip(stops['ATCOCode'], range(offset, offset + len(stops))))
+
+        if admin_areas is None:
+            self.admin_areas.update(stops['ATCOCode'].str[:ADMIN_AREA_LENGTH].unique())
+        else:
+            self.admin_areas.update(admin_areas)
+
+    def location(self, atco_code):
+        """Returns the (longitude, latitude) of a stop, or None if it is not loaded or has no location"""
+
+        row = self.index.get(atco_code)
+
+        if row is None or np.isnan(self.longitudes[row]) or np.isnan(self.latitudes[row]):
+            return None
+
+        return self.longitudes[row], self.latitudes[row]
+
+    def common_name(self, atco_code):
+        row = self.index.get(atco_code)
+
+        return None if row is None else self.common_names[row]
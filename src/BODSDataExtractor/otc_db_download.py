@@ -1,12 +1,17 @@
 #This file contains functions to download and save the database of the traffic commissioner to view registered bus services. Currently England only
 import pandas as pd
 from datetime import date
-import requests
 from io import BytesIO
 import os
+import time
 from pathlib import Path
 from sys import platform
 
+try:
+    from BODSDataExtractor.downloader import DatasetDownloader
+except:
+    from downloader import DatasetDownloader
+
 
 OTC_BASE_URL = 'https://content.mgmt.dvsacloud.uk/olcs.prod.dvsa.aws/data-gov-uk-export/'
 OTC_DB_FILES = [
@@ -18,6 +23,16 @@ OTC_DB_FILES = [
     f'{OTC_BASE_URL}Bus_RegisteredOnly_F.csv'  # East England
 ]
 
+# the OTC database is cached here, and downloaded again once the cached copy is older than OTC_CACHE_MAX_AGE seconds
+OTC_CACHE_FOLDER = os.path.join(Path.home(), '.BODSDataExtractor')
+OTC_CACHE_MAX_AGE = 24 * 60 * 60
+
+# columns with few distinct values (e.g. an operator name is repeated for each of its services), stored as categoricals
+OTC_CATEGORICAL_COLUMNS = ['current_traffic_area', 'op_name', 'trading_name', 'auth_description',
+                           'service_type_description', 'service_type_other_details', 'licence_status',
+                           'registration_status', 'short_notice', 'subsidy_detail', 'tao_covered_by_area',
+                           'discs_in_possession', 'authdiscs']
+
 
 def get_user_downloads_folder():
     if platform == "win32":
@@ -60,28 +75,57 @@ def create_today_folder():
 
 def save_otc_db():
     otc_db = fetch_otc_db()
-    create_today_folder()
-    downloads_folder = get_user_downloads_folder()
-    save_loc = downloads_folder + '/' + today + f'/otc_db_{today}.csv'
+    today = str(date.today())
+    today_folder = create_today_folder()
+    save_loc = today_folder + f'/otc_db_{today}.csv'
     otc_db.to_csv(save_loc, index=False)
+    return otc_db
+
+
+def fetch_otc_db(cache_folder=OTC_CACHE_FOLDER, max_age=OTC_CACHE_MAX_AGE, downloader=None):
+    """Returns a pandas dataframe of the OTC database (all regions combined), with low cardinality columns as
+    categoricals. The regions are downloaded concurrently, and the result cached in cache_folder (unless None)
+    for max_age seconds, so that it is downloaded at most once a day by default."""
 
+    cache_path = None if cache_folder is None else os.path.join(os.path.expanduser(cache_folder), 'otc_db.pkl')
+
+    if cache_path is not None and os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < max_age:
+        try:
+            return pd.read_pickle(cache_path)
+        except Exception as e:
+            print(f'Could not read cached OTC database ({e}), downloading it again...')
 
-def fetch_otc_db():
-    """Returns a pandas dataframe of the OTC database (all regions combined)."""
     print('Downloading OTC database...')
+    if downloader is None:
+        downloader = DatasetDownloader(max_in_flight=len(OTC_DB_FILES))
+
     otc_regions = []
 
-    for region in OTC_DB_FILES:
-        text_out = requests.get(region).content
-        df = pd.read_csv(BytesIO(text_out))
-        otc_regions.append(df)
+    for region, response, error in downloader.map(downloader.get, OTC_DB_FILES, threaded=True):
+        if error is not None:
+            raise error
+        # every column is read as strings, rather than inferred (which can differ between regions)
+        otc_regions.append(pd.read_csv(BytesIO(response.content), dtype=str))
 
     print('Merging OTC files...')
-    otc_db = pd.concat(otc_regions)
+    otc_db = pd.concat(otc_regions, ignore_index=True)
     otc_db['service_code'] = otc_db['Reg_No'].str.replace('/', ':')
     # postgresql does not like uppercase or spaces
     otc_db.columns = [c.lower().replace(" ", "_") for c in otc_db.columns]
-    return otc_db.drop_duplicates()
+
+    # categoricals are converted once all regions are combined, as concatenating differing categories gives objects
+    categorical_columns = [c for c in OTC_CATEGORICAL_COLUMNS if c in otc_db.columns]
+    otc_db[categorical_columns] = otc_db[categorical_columns].astype('category')
+
+    otc_db = otc_db.drop_duplicates()
+
+    if cache_path is not None:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+        otc_db.to_pickle(temporary_path)
+        os.replace(temporary_path, cache_path)
+
+    return otc_db
 
 
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+#This file contains the reconciliation of services registered in the OTC database with services published on BODS,
+#merged once on service code and counted once by licence, so that the coverage reports share them
+import pandas as pd
+
+
+OTC_COLUMNS = ['service_code', 'op_name', 'lic_no', 'auth_description']
+
+BODS_COLUMNS = ['DatasetID', 'OperatorName', 'bods_compliance', 'NOC', 'TradingName', 'LicenceNumber',
+                'OperatorShortName', 'OperatorCode', 'ServiceCode']
+
+
+def licence_from_service_code(service_codes):
+    """The licence number of each service code, the part before the colon"""
+
+    return service_codes.str.split(':', n=1).str[0]
+
+
+class OTCReconciliation:
+    '''
+    The services registered in the OTC database and published on BODS, matched by service code.
+    The outer merge of the two on service code is made once, when first needed, and the reports
+    that compare them are filtered from it, and licences are counted with value_counts.
+
+    The reports are the same as when each made its own merge, index and null handling included:
+    records are matched on missing service codes as merge matches them, and the report of each
+    side keeps the rows of the merge with no service code from the other side.
+    '''
+
+    def __init__(self, otc_db, service_line_extract):
+        self.otc_db = otc_db
+        self.service_line_extract = service_line_extract
+        self.views = {}
+
+    def is_for(self, otc_db, service_line_extract):
+        """Whether this reconciliation is of the given OTC database and extract"""
+
+        return self.otc_db is otc_db and self.service_line_extract is service_line_extract
+
+    def licences(self):
+        '''
+        Each licence in the OTC database (from its service codes), in order of first appearance,
+        with the number of records published on BODS with a service code of that licence.
+        '''
+
+        if 'licences' not in self.views:
+            registered = pd.unique(licence_from_service_code(self.otc_db['service_code']))
+            published = licence_from_service_code(self.service_line_extract['ServiceCode']).value_counts(dropna=False)
+
+            published_services = pd.Series(registered, dtype=object).map(published).fillna(0).astype('int64')
+
+            self.views['licences'] = pd.DataFrame({'licence': registered, 'published_services': published_services})
+
+        return self.views['licences'].copy()
+
+    def full_merge(self):
+        """The outer merge of the OTC database and the extract on service code"""
+
+        if 'full_merge' not in self.views:
+            self.views['full_merge'] = self.otc_db[OTC_COLUMNS].merge(self.service_line_extract[BODS_COLUMNS],
+                                                                      how='outer', right_on='ServiceCode',
+                                                                      left_on='service_code')
+
+        return self.views['full_merge']
+
+    def registered_not_published(self):
+        """Services in the OTC database whose service code is not published on BODS"""
+
+        if 'registered_not_published' not in self.views:
+            full_merge = self.full_merge()
+            not_published = full_merge.loc[full_merge['ServiceCode'].isnull(), OTC_COLUMNS]
+
+            self.views['registered_not_published'] = not_published.drop_duplicates()
+
+        return self.views['registered_not_published'].copy()
+
+    def published_not_registered(self):
+        """Services published on BODS whose service code is not in the OTC database"""
+
+        if 'published_not_registered' not in self.views:
+            full_merge = self.full_merge()
+            not_registered = full_merge.loc[full_merge['service_code'].isnull(), BODS_COLUMNS]
+
+            self.views['published_not_registered'] = not_registered.drop_duplicates()
+
+        return self.views['published_not_registered'].copy()
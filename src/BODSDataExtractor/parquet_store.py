@@ -0,0 +1,213 @@
+#This file contains a columnar store for saving an extract as Parquet, partitioned by NOC and la_code, so that
+#a saved run can be loaded again (in part, and with its dtypes) without extracting it again
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+
+# columns each table is partitioned by, where present
+PARTITION_COLUMNS = ['NOC', 'la_code']
+
+# columns of the stop level extract identifying each timetable
+TIMETABLE_KEY_COLUMNS = ['URL', 'RevisionNumber', 'LineName', 'ServiceCode', 'FileName', 'OperatingDays',
+                         'OperatingPeriodStartDate', 'DatasetID']
+
+DIRECTIONS = {'outbound': 'collated_timetable_outbound', 'inbound': 'collated_timetable_inbound'}
+
+
+class ParquetStore:
+    '''
+    Saves the tables of an extract as Parquet datasets in a folder, and loads them again.
+
+    metadata is saved as a single file. service_line_extract and timetables are partitioned by
+    NOC and la_code (a folder for each value, e.g. service_line_extract/NOC=ABCD/la_code=010),
+    so loading with a filter on either only reads the matching folders. Timetables are saved
+    in long format, with a row for each cell of each timetable, and rebuilt when loaded.
+
+    Loading reads only the columns asked for, skips row groups and partitions that cannot match
+    the filters, and memory maps the files rather than reading them into buffers first.
+
+    Filters are given as for pandas.read_parquet, e.g. [('NOC', '=', 'ABCD'), ('la_code', 'in', ['010', '450'])]
+    '''
+
+    def __init__(self, directory):
+        if pa is None:
+            raise ImportError('pyarrow is required to save extracts as Parquet: pip install pyarrow')
+
+        self.directory = os.path.expanduser(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, table):
+        return os.path.join(self.directory, table)
+
+    def tables(self):
+        """The names of the tables saved"""
+
+        return sorted(name.replace('.parquet', '') for name in os.listdir(self.directory))
+
+    def save(self, table, df, partition_cols=None):
+        """Saves a dataframe as a table, replacing any previous version of it"""
+
+        self.remove(table)
+
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+
+        if not partition_cols:
+            pq.write_table(arrow_table, f'{self.path(table)}.parquet')
+            return
+
+        # partition values are folder names, so are kept as strings (e.g. la_code 010 is not 10)
+        for column in partition_cols:
+            arrow_table = arrow_table.set_column(arrow_table.schema.get_field_index(column), column,
+                                                 arrow_table[column].cast(pa.string()))
+
+        pq.write_to_dataset(arrow_table, self.path(table), partition_cols=partition_cols)
+
+    def remove(self, table):
+        if os.path.isdir(self.path(table)):
+            shutil.rmtree(self.path(table))
+        elif os.path.exists(f'{self.path(table)}.parquet'):
+            os.remove(f'{self.path(table)}.parquet')
+
+    def load(self, table, columns=None, filters=None):
+        """Loads a table, or just the given columns of the rows matching the filters"""
+
+        if os.path.isdir(self.path(table)):
+            source = self.path(table)
+            partitioning = ds.partitioning(pa.schema([(column, pa.string()) for column in
+                                                      self.partition_columns(table)]), flavor='hive')
+        else:
+            source = f'{self.path(table)}.parquet'
+            partitioning = None
+
+        arrow_table = pq.read_table(source, columns=columns, filters=filters, memory_map=True,
+                                    partitioning=partitioning)
+        df = arrow_table.to_pandas()
+
+        # partition columns are read last, so put the columns back in the order they were saved in
+        if columns is None:
+            columns = [column['name'] for column in arrow_table.schema.pandas_metadata['columns']]
+
+        return df[[column for column in columns if column in df.columns]]
+
+    def partition_columns(self, table):
+        """The columns a table is partitioned by, from the names of its folders (e.g. NOC=ABCD)"""
+
+        columns = []
+        folder = self.path(table)
+
+        while True:
+            partitions = [name for name in os.listdir(folder) if '=' in name]
+            if not partitions:
+                return columns
+            columns.append(partitions[0].split('=', 1)[0])
+            folder = os.path.join(folder, partitions[0])
+
+    # =============================================================================
+    #       TABLES OF THE EXTRACT
+    # =============================================================================
+
+    def save_metadata(self, metadata):
+        self.save('metadata', metadata)
+
+    def load_metadata(self, columns=None, filters=None):
+        return self.load('metadata', columns, filters)
+
+    def save_service_line_extract(self, service_line_extract):
+        self.save('service_line_extract', service_line_extract,
+                  [column for column in PARTITION_COLUMNS if column in service_line_extract.columns])
+
+    def load_service_line_extract(self, columns=None, filters=None):
+        return self.load('service_line_extract', columns, filters)
+
+    def save_timetables(self, stop_level_extract, partitions=None):
+        '''
+        Saves the timetables of a stop level extract, with a row for each cell of each timetable
+        (so services without any timetables are not saved).
+        partitions is a dataframe with the NOC and la_code of each row of the stop level extract
+        (on the same index), which the stop level extract no longer holds.
+        '''
+
+        keys = stop_level_extract[[column for column in TIMETABLE_KEY_COLUMNS if column in stop_level_extract.columns]]
+        if partitions is not None:
+            keys = keys.join(partitions[[column for column in PARTITION_COLUMNS if column in partitions.columns]])
+
+        cells = []
+        for number, (_, row) in enumerate(stop_level_extract.iterrows()):
+            for direction, column in DIRECTIONS.items():
+                cells.append(self.timetable_cells(row[column], number, direction))
+
+        cells = pd.concat(cells, ignore_index=True)
+        keys = keys.reset_index(drop=True)
+        timetables = pd.concat([keys.iloc[cells['timetable']].reset_index(drop=True), cells], axis=1)
+
+        self.save('timetables', timetables, [column for column in PARTITION_COLUMNS if column in timetables.columns])
+
+    @staticmethod
+    def timetable_cells(timetable, number, direction):
+        """A timetable in long format, with the row and column of each cell"""
+
+        rows, columns = timetable.shape
+        values = pd.Series(timetable.to_numpy(dtype=object).ravel(), dtype=object)
+        missing = values.isna().to_numpy()
+        values = values.astype(str)
+        values[missing] = None
+
+        return pd.DataFrame({'timetable': np.full(rows * columns, number, dtype=np.int32),
+                             'direction': direction,
+                             'row': np.repeat(timetable.index.to_numpy(dtype=np.int32), columns),
+                             'column_number': np.tile(np.arange(columns, dtype=np.int32), rows),
+                             'column': np.tile(timetable.columns.to_numpy(dtype=object), rows),
+                             'value': values})
+
+    def load_timetables(self, columns=None, filters=None):
+        '''
+        Loads the timetables saved, as a stop level extract with a row for each timetable and its
+        outbound and inbound timetables. columns are the columns identifying each timetable to load
+        (all if None), and filters may be on any of these.
+        '''
+
+        cells = self.load('timetables', filters=filters)
+        keys = [column for column in cells.columns
+                if column not in ('timetable', 'direction', 'row', 'column_number', 'column', 'value')]
+        if columns is not None:
+            keys = [column for column in keys if column in columns]
+
+        extract = []
+        for number, timetable_cells in cells.groupby('timetable', sort=True):
+            row = timetable_cells.iloc[0][keys].to_dict()
+            for direction, column in DIRECTIONS.items():
+                row[column] = self.rebuild_timetable(timetable_cells[timetable_cells['direction'] == direction])
+            extract.append(row)
+
+        return pd.DataFrame(extract, columns=keys + list(DIRECTIONS.values()))
+
+    @staticmethod
+    def rebuild_timetable(cells):
+        """A timetable from its cells in long format"""
+
+        if cells.empty:
+            return pd.DataFrame()
+
+        names = cells.drop_duplicates('column_number').sort_values('column_number')['column'].to_list()
+        timetable = cells.pivot(index='row', columns='column_number', values='value')
+        timetable = timetable.astype(object).where(timetable.notna(), None)
+        timetable.columns = names
+        timetable.index = timetable.index.astype(np.int64)
+        timetable.index.name = None
+
+        # stop sequence numbers are numbers, below the header rows
+        if 'Sequence Number' in timetable.columns:
+            timetable['Sequence Number'] = [int(value) if isinstance(value, str) and value.isdigit() else value
+                                            for value in timetable['Sequence Number']]
+
+        return timetable
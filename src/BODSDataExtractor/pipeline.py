@@ -0,0 +1,132 @@
+#This file contains the pipeline that downloads datasets and parses their xml files in overlapping stages,
+#so that network time and the CPU time of parsing are spent at the same time rather than one after the other
+import concurrent.futures
+import queue
+import threading
+
+
+# marks the end of the downloaded payloads
+DONE = object()
+
+
+class DatasetPipeline:
+    '''
+    Downloads datasets and parses the payloads (e.g. xml files) within them in two stages.
+
+    The download stage runs the downloader's concurrent downloads in a background thread. Each
+    download puts its payloads into a bounded queue, blocking while the queue is full, so that
+    downloads only get ahead of parsing by queue_size payloads. The parse stage takes payloads
+    from the queue and parses them in a pool of parse_workers processes (or in the calling
+    thread if parse_workers is not set), keeping at most two payloads per process outstanding.
+
+    Arguments:
+        downloader: the DatasetDownloader to download with
+        download: function taking a url and returning (or yielding) the payloads to parse
+        parse: function taking a payload and returning its result. Must be picklable (i.e.
+               defined at module level) if parse_workers is set
+        parse_workers: the number of processes to parse in, or None to parse in the calling thread
+        queue_size: the most downloaded payloads to hold waiting to be parsed
+    '''
+
+    def __init__(self, downloader, download, parse, parse_workers=None, queue_size=16):
+        self.downloader = downloader
+        self.download = download
+        self.parse = parse
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+
+    def run(self, urls, threaded=True):
+        '''
+        Downloads and parses each url. Returns a list with (url, results, error) for each url in
+        the order given, where results is a list with the result of parsing each of its payloads
+        in order (or the exception raised parsing it), and error is the exception raised
+        downloading it.
+        '''
+
+        payloads = queue.Queue(maxsize=self.queue_size)
+        stopping = threading.Event()
+        download_errors = [None] * len(urls)
+        results = [{} for _ in urls]
+        payload_counts = [0] * len(urls)
+
+        def download(item):
+            number, url = item
+            if stopping.is_set():
+                return
+            for position, payload in enumerate(self.download(url)):
+                payload_counts[number] += 1
+                put((number, position, payload))
+
+        def put(item):
+            # wait for space in the queue, unless the pipeline is being stopped
+            while not stopping.is_set():
+                try:
+                    payloads.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def download_all():
+            try:
+                for (number, _), _, error in self.downloader.map(download, list(enumerate(urls)), threaded=threaded):
+                    download_errors[number] = error
+            finally:
+                put(DONE)
+
+        executor = None
+        if self.parse_workers:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.parse_workers)
+            # start the processes before the download threads, rather than forking while they run
+            list(executor.map(int, range(self.parse_workers)))
+
+        downloads = threading.Thread(target=download_all, daemon=True)
+        downloads.start()
+
+        try:
+            pending = {}
+
+            while True:
+                item = payloads.get()
+                if item is DONE:
+                    break
+
+                number, position, payload = item
+
+                if executor is None:
+                    results[number][position] = self.call(self.parse, payload)
+                    continue
+
+                pending[executor.submit(self.parse, payload)] = (number, position)
+
+                # backpressure on the queue: wait for parsing to catch up before taking more payloads
+                if len(pending) >= 2 * self.parse_workers:
+                    done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    self.collect(done, pending, results)
+
+            self.collect(concurrent.futures.wait(pending)[0], pending, results)
+
+        finally:
+            stopping.set()
+            downloads.join()
+            if executor is not None:
+                executor.shutdown()
+
+        return [(url, [results[number][position] for position in range(payload_counts[number])],
+                 download_errors[number])
+                for number, url in enumerate(urls)]
+
+    @staticmethod
+    def call(function, argument):
+        try:
+            return function(argument)
+        except Exception as e:
+            return e
+
+    @staticmethod
+    def collect(done, pending, results):
+        for future in done:
+            number, position = pending.pop(future)
+            try:
+                results[number][position] = future.result()
+            except Exception as e:
+                results[number][position] = e
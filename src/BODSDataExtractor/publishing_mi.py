@@ -0,0 +1,58 @@
+#This file contains the MI reported to DFT on the progress of publishing timetables data, computed together in one
+#pass over an extract rather than by each report scanning it again
+from dataclasses import dataclass
+
+try:
+    from BODSDataExtractor.service_codes import MALFORMED
+except:
+    from service_codes import MALFORMED
+
+
+@dataclass
+class PublishingMI:
+    operators: int
+    service_codes: int
+    valid_service_codes: int
+    services: int
+    services_in_TXC_2_4: int
+    datasets: int
+    datasets_in_TXC_2_4: int
+
+    @property
+    def percent_services_in_TXC_2_4(self):
+        return (self.services_in_TXC_2_4 / self.services) * 100
+
+    @property
+    def percent_datasets_in_TXC_2_4(self):
+        return (self.datasets_in_TXC_2_4 / self.datasets) * 100
+
+    def report(self):
+        """Prints the MI, as each report does"""
+
+        print(f'\nNumber of distinct operator names in chosen dataset: {self.operators}\n')
+        print(f'\nNumber of unique service codes in chosen dataset: {self.service_codes}\n')
+        print(f'\nNumber of unique valid service codes in chosen dataset: {self.valid_service_codes}\n')
+        print(f'\nPercentage of services published in TXC 2.4 schema: {self.percent_services_in_TXC_2_4}\n')
+        print(f'\nPercentage of datasets published in TXC 2.4 schema: {self.percent_datasets_in_TXC_2_4}\n')
+
+
+def publishing_mi(metadata, service_line_extract, service_code_classification):
+    '''
+    Computes the publishing MI of an extract: distinct operators (from the metadata), service codes
+    and valid service codes (from their classification), and the services and datasets published
+    in TXC 2.4. A dataset is counted as published in TXC 2.4 if the lowest schema version of its
+    files is 2.4.
+    '''
+
+    schema_version = service_line_extract['SchemaVersion']
+
+    # the lowest schema version of each dataset, converting just the column rather than copying the extract
+    dataset_schema_version = schema_version.astype('float').groupby(service_line_extract['DatasetID']).min()
+
+    return PublishingMI(operators=len(metadata['operator_name'].unique()),
+                        service_codes=len(service_line_extract['ServiceCode'].unique()),
+                        valid_service_codes=int((service_code_classification['status'] != MALFORMED).sum()),
+                        services=len(service_line_extract),
+                        services_in_TXC_2_4=int((schema_version == '2.4').sum()),
+                        datasets=len(dataset_schema_version),
+                        datasets_in_TXC_2_4=int((dataset_schema_version == 2.4).sum()))
@@ -0,0 +1,81 @@
+#This file contains the columnar builder that the extracted data of each xml file is appended to, so that an extract
+#is made into a single dataframe at the end rather than a one row dataframe per file, concatenated per dataset and again
+#across datasets
+import time
+
+import pandas as pd
+
+
+# the service level info of each xml file, in the order extract_xml gives it
+XML_COLUMNS = ['URL', 'FileName', 'NOC', 'TradingName', 'LicenceNumber', 'OperatorShortName', 'OperatorCode',
+               'ServiceCode', 'LineName', 'PublicUse', 'OperatingDays', 'Origin', 'Destination',
+               'OperatingPeriodStartDate', 'OperatingPeriodEndDate', 'SchemaVersion', 'RevisionNumber', 'la_code']
+
+
+class RecordBuilder:
+    '''
+    Accumulates records with a fixed set of columns (each a list of values in the order of the
+    columns) into a list per column, so that they are made into a dataframe once, when all have
+    been added. The records of each dataset can be added to those of the whole extract with extend.
+
+    Arguments:
+        columns: the names of the values of each record, in order
+    '''
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.values = [[] for _ in self.columns]
+
+    def __len__(self):
+        return len(self.values[0]) if self.values else 0
+
+    def append(self, record):
+        """Adds a record, which must have a value for each column"""
+
+        if len(record) != len(self.columns):
+            raise ValueError(f'Record has {len(record)} values, expected {len(self.columns)}: {self.columns}')
+
+        for values, value in zip(self.values, record):
+            values.append(value)
+
+    def extend(self, records):
+        """Adds the records of another RecordBuilder (or the rows of a dataframe), by column name. Raises a ValueError
+        if they do not have all of this builder's columns, e.g. if they were extracted with other settings"""
+
+        missing = [column for column in self.columns if column not in records.columns]
+        if missing:
+            raise ValueError(f'Records are missing columns {missing}, expected {self.columns}')
+
+        if isinstance(records, pd.DataFrame):
+            other = {column: records[column].tolist() for column in self.columns}
+        else:
+            other = dict(zip(records.columns, records.values))
+
+        for column, values in zip(self.columns, self.values):
+            values.extend(other[column])
+
+    def to_frame(self):
+        """The records as a dataframe, with a column of objects for each column"""
+
+        return pd.DataFrame(dict(zip(self.columns, self.values)), columns=self.columns, dtype=object)
+
+
+class StageTimer:
+    '''
+    Times the stages of an extract, each stage taking from the end of the stage before (or from
+    when the timer was made) to when it is marked done.
+    '''
+
+    def __init__(self):
+        self.timings = {}
+        self.last = time.perf_counter()
+
+    def done(self, stage):
+        """Marks a stage as done, adding the time since the last stage to it"""
+
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0) + now - self.last
+        self.last = now
+
+    def report(self, title):
+        print(f'{title}: ' + ', '.join(f'{stage} {seconds:.2f}s' for stage, seconds in self.timings.items()))
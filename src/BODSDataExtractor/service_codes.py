@@ -0,0 +1,50 @@
+#This file contains the classification of service codes as registered, unregistered (UZ) or malformed, done in one
+#regular expression pass over the distinct codes of an extract
+import re
+
+import numpy as np
+import pandas as pd
+
+
+REGISTERED = 'registered'
+UNREGISTERED = 'unregistered'
+MALFORMED = 'malformed'
+
+# a registered service code is two letters, the seven digit licence number, a colon and the service number (e.g.
+# PB0000001:1). Unregistered service codes start with UZ, and only need to have the same shape
+SERVICE_CODE_PATTERN = re.compile(r'^(?:(?P<unregistered>UZ.{7}:.+)|(?P<registered>[^\W\d_]{2}\d{7}:\d+))\Z', re.S)
+
+
+def classify_service_codes(service_codes):
+    '''
+    Classifies each distinct service code as registered, unregistered or malformed. Returns a
+    dataframe indexed by service code, with its status, and for malformed codes the reason
+    (the first of the checks below that fails). Missing service codes are left out.
+    '''
+
+    codes = pd.Series(pd.unique(service_codes.dropna()), dtype=object)
+    codes = codes[codes.map(type) == str]
+
+    matches = codes.str.extract(SERVICE_CODE_PATTERN)
+    status = np.select([matches['registered'].notna(), matches['unregistered'].notna()],
+                       [REGISTERED, UNREGISTERED], MALFORMED)
+
+    reason = np.full(len(codes), None, dtype=object)
+    malformed = status == MALFORMED
+
+    if malformed.any():
+        bad = codes[malformed]
+        prefix = bad.str[:2]
+        checks = [~prefix.str.isalpha(),
+                  bad.str[9:10] != ':',
+                  bad.str.len() <= 10,
+                  ~bad.str[2:9].str.isnumeric(),
+                  ~bad.str[10:].str.isnumeric()]
+        reasons = ['does not start with two letters',
+                   'no colon after the licence number',
+                   'no service number after the colon',
+                   'licence number is not seven digits',
+                   'service number is not a number']
+        reason[malformed] = np.select(checks, reasons, 'malformed')
+
+    return pd.DataFrame({'status': status, 'reason': reason}, index=pd.Index(codes, name='ServiceCode'))
@@ -0,0 +1,121 @@
+#This file contains the filter on service codes and line names applied while xml files are extracted, so that files
+#without the services asked for are skipped after reading their Services, and other vehicle journeys are never built
+import lxml.etree as ET
+
+try:
+    from BODSDataExtractor.txc_builder import element_text
+except:
+    from txc_builder import element_text
+
+
+class ServiceFilter:
+    '''
+    The service codes and/or line names to extract (either may be None, to not filter on it, or
+    a single string).
+
+    A file is extracted if it has a service with one of the service codes that has a line with
+    one of the line names. Its stop level objects are then built from the first such service,
+    and only the vehicle journeys of the services and lines matched.
+    '''
+
+    def __init__(self, service_codes=None, line_names=None):
+        self.service_codes = filter_values(service_codes)
+        self.line_names = filter_values(line_names)
+
+    def matching_services(self, services, qualify):
+        '''
+        Returns a dict of the service code of each matching Service within a Services element to
+        the ids of its matching lines. qualify qualifies a tag with the document's namespace.
+        '''
+
+        matching = {}
+
+        if services is None:
+            return matching
+
+        for service in services.iterchildren(qualify('Service')):
+            service_code = child_text(service, qualify('ServiceCode'))
+            if self.service_codes is not None and service_code not in self.service_codes:
+                continue
+
+            lines = service.find(qualify('Lines'))
+            line_ids = {line.get('id') for line in ([] if lines is None else lines.iterchildren(qualify('Line')))
+                        if self.line_names is None or child_text(line, qualify('LineName')) in self.line_names}
+            if self.line_names is not None and not line_ids:
+                continue
+
+            matching.setdefault(service_code, set()).update(line_ids)
+
+        return matching
+
+    def file_filters(self, services, qualify):
+        '''
+        Returns whether each Service, and each VehicleJourney, of a file matches (as functions taking
+        its element), given its Services element
+        '''
+
+        matching = self.matching_services(services, qualify)
+
+        def keep_service(service):
+            return child_text(service, qualify('ServiceCode')) in matching
+
+        def keep_vehicle_journey(vehicle_journey):
+            line_ids = matching.get(child_text(vehicle_journey, qualify('ServiceRef')))
+
+            if line_ids is None:
+                return False
+
+            # with line names, only the vehicle journeys of the lines matched
+            return self.line_names is None or bool(line_ref_ids(child_text(vehicle_journey, qualify('LineRef')))
+                                                   & line_ids)
+
+        return keep_service, keep_vehicle_journey
+
+    def matches(self, xml):
+        '''
+        Whether an xml file has any of the services asked for, reading the file only as far as the
+        end of its Services element (which comes before its vehicle journeys)
+        '''
+
+        for _, services in ET.iterparse(xml, events=('end',), tag='{*}Services'):
+            # only the Services element at the top level of the document
+            if services.getparent() is not None and services.getparent().getparent() is None:
+                namespace = services.nsmap.get(None)
+                return bool(self.matching_services(services, lambda tag: tag if namespace is None
+                                                   else f'{{{namespace}}}{tag}'))
+
+        return False
+
+
+def filter_values(values):
+    """The values to filter on as a frozenset (None to not filter), a single string being one value rather than its
+    characters"""
+
+    if values is None:
+        return None
+
+    if isinstance(values, str):
+        return frozenset([values])
+
+    return frozenset(values)
+
+
+def line_ref_ids(line_ref):
+    '''
+    The line ids a LineRef may refer to: the ref itself, and the part after its last colon, as BODS line refs are
+    often the line id prefixed with the NOC and service code (e.g. ABCD:PB0000001:1:L1 for L1, sometimes with a
+    trailing colon)
+    '''
+
+    if line_ref is None:
+        return set()
+
+    return {line_ref, line_ref.rstrip(':').rsplit(':', 1)[-1]}
+
+
+def child_text(element, tag):
+    """The stripped text of the first child of an element with a tag, or None if it has none"""
+
+    child = element.find(tag)
+
+    return None if child is None else element_text(child)
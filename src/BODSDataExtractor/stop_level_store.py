@@ -0,0 +1,106 @@
+#This file contains the store of stop level objects (journey pattern sections, vehicle journeys, service and stops) of
+#each file extracted, or in lazy mode its compressed xml, so that the service line dataframes only hold a handle to them
+#rather than the objects themselves
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+
+
+# the columns of an extracted file that hold its stop level objects, in the order they are stored in
+STOP_LEVEL_COLUMNS = ['jps_objects', 'vj_objects', 'service_object', 'stop_objects']
+
+
+class StopLevelStore:
+    '''
+    Holds the stop level objects of each file extracted (or, with lazy_stop_level, its compressed
+    xml), by an integer handle given when they are added. They are kept in memory, or if a
+    directory is given, pickled to a file for each handle in a folder of this store's own within
+    it and loaded again when asked for, so they do not take up memory between extraction and
+    generating timetables. The store's folder is removed when the store is no longer used (or
+    when Python exits), so stores sharing a directory never see each other's files.
+
+    Arguments:
+        directory: optional folder to spill the objects to, created if it does not exist
+    '''
+
+    def __init__(self, directory=None):
+        self.payloads = {}
+        self.next_handle = 0
+        self.directory = None
+
+        if directory is not None:
+            directory = os.path.expanduser(directory)
+            os.makedirs(directory, exist_ok=True)
+            self.directory = tempfile.mkdtemp(prefix='stop_level_', dir=directory)
+            self.remove_directory = weakref.finalize(self, remove_directory, self.directory, os.getpid())
+
+    def __len__(self):
+        return self.next_handle
+
+    def path(self, handle):
+        return os.path.join(self.directory, f'{handle}.pkl')
+
+    def add(self, payloads):
+        """Stores each (jps_objects, vj_objects, service_object, stop_objects) tuple (or (compressed xml,) in lazy
+        mode), returning their handles"""
+
+        handles = []
+
+        for payload in payloads:
+            handle = self.next_handle
+            self.next_handle += 1
+
+            if self.directory is None:
+                self.payloads[handle] = tuple(payload)
+            else:
+                # written under another name first, so that a file is only ever complete
+                with tempfile.NamedTemporaryFile('wb', dir=self.directory, suffix='.tmp', delete=False) as file:
+                    pickle.dump(tuple(payload), file, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(file.name, self.path(handle))
+
+            handles.append(handle)
+
+        return handles
+
+    def get(self, handle):
+        """The tuple stored for a handle. Objects spilled to disk are loaded again each time, so changes to them are
+        not kept"""
+
+        if self.directory is None:
+            return self.payloads[handle]
+
+        with open(self.path(handle), 'rb') as file:
+            return pickle.load(file)
+
+    def get_many(self, handles):
+        """The objects of each handle, loading those shared by more than one handle (e.g. the rows of a service in
+        each la_code) once"""
+
+        loaded = {}
+
+        for handle in handles:
+            if handle not in loaded:
+                loaded[handle] = self.get(handle)
+
+        return [loaded[handle] for handle in handles]
+
+    def clear(self):
+        """Removes all of the objects held (the store can still be added to)"""
+
+        self.payloads = {}
+
+        if self.directory is not None:
+            for handle in range(self.next_handle):
+                try:
+                    os.remove(self.path(handle))
+                except OSError:
+                    pass
+
+
+def remove_directory(directory, pid):
+    """Removes a store's folder, only from the process that made it (not processes forked from it)"""
+
+    if os.getpid() == pid:
+        shutil.rmtree(directory, ignore_errors=True)
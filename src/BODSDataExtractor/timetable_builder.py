@@ -0,0 +1,650 @@
+#This file contains the engine that generates the collated inbound and outbound timetables for a service.
+#Stop and time data for each vehicle journey is built into arrays, and each timetable is created as a
+#dataframe once per service, rather than row by row per vehicle journey
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+TIMETABLE_KEY_COLUMNS = ["Sequence Number", "Stop Point Ref", "Latitude", "Longitude", "Common Name"]
+
+# header rows, in the order they appear at the top of each timetable
+HEADER_LABELS = ["Line", "RouteID", "Journey Code", "Journey Pattern ", "Operating Days "]
+HEADER_KEYS = [(label, "->", "->", "->", "->") for label in HEADER_LABELS]
+
+# times of day for every minute, so times can be formatted by indexing rather than strftime per stop
+MINUTE_LABELS = np.array([f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(24 * 60)], dtype=object)
+
+DAYS_OF_WEEK = {"Monday": 1, "Tuesday": 2, "Wednesday": 3, "Thursday": 4, "Friday": 5, "Saturday": 6, "Sunday": 7}
+
+# the operating days bitmask of each TXC day of week element, Monday being the lowest bit and Sunday the highest
+DAY_MASKS = {day: 1 << (number - 1) for day, number in DAYS_OF_WEEK.items()}
+DAY_MASKS.update({f'Not{day}': 0b1111111 & ~mask for day, mask in list(DAY_MASKS.items())})
+DAY_MASKS.update({'MondayToFriday': 0b0011111, 'MondayToSaturday': 0b0111111, 'MondayToSunday': 0b1111111,
+                  'Weekend': 0b1100000})
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# the columns of the long format tables of each service, see StopTimes
+TRIP_COLUMNS = ["trip", "VehicleJourneyCode", "Direction", "JourneyPattern", "RouteRef", "Line", "JourneyCode",
+                "OperatingDays"]
+STOP_TIME_COLUMNS = ["trip", "stop_sequence", "SequenceNumber", "stop", "arrival", "departure", "day_shift"]
+STOP_TIME_DTYPES = [np.int32, np.int16, np.int32, np.int32, np.int32, np.int32, np.int8]
+STOP_COLUMNS = ["stop", "StopPointRef", "CommonName", "Latitude", "Longitude"]
+
+
+def timetable_operating_days(days):
+    ''' Ensuring the operating days are ordered appropriately '''
+
+    if days is not None:
+        operating_day_list = list(days)
+        if any(day in DAYS_OF_WEEK for day in operating_day_list):
+            pass
+        else:
+            operating_days = ', '.join(operating_day_list)
+            return operating_days
+
+    else:
+        operating_days = None
+        return operating_days
+
+    # sorting the days of operation
+    sortit = sorted(((day, DAYS_OF_WEEK[day]) for day in set(operating_day_list) if day in DAYS_OF_WEEK),
+                    key=lambda x: x[1])
+
+    length = len(sortit)
+
+    consecutive = True
+
+    # checking to see if the days in the list are not consective
+    for i in range(length - 1):
+        if sortit[i + 1][1] - sortit[i][1] != 1:
+            consecutive = False
+            break
+
+    # if there are no days of operation entered
+    if length == 0:
+        operating_days = "None"
+
+    # if there is only one day of operation
+    elif length == 1:
+        operating_days = sortit[0][0]
+
+    # if the operating days are not consecutive, they're seperated by commas
+    elif consecutive:
+        operating_days = "".join(day + "," for day, _ in sortit)
+
+    # if consecutive, operating days are given as a range
+    else:
+        operating_days = sortit[0][0] + "-" + sortit[-1][0]
+
+    return operating_days
+
+
+def operating_days_mask(days):
+    """The operating days as a bitmask of the days of the week (Monday is 1, Sunday 64), 0 if there are none"""
+
+    if days is None or isinstance(days, str):
+        return 0
+
+    mask = 0
+    for day in days:
+        mask |= DAY_MASKS.get(day, 0)
+
+    return mask
+
+
+def organise_timetable(collated_timetable):
+    """Ordering the timetable correctly"""
+
+    if not collated_timetable.empty:
+
+        # ensuring the sequence numbers are sorted in ascending order
+        collated_timetable.iloc[5:] = collated_timetable.iloc[5:].sort_values(by="Sequence Number", ascending=True)
+
+    return collated_timetable
+
+
+@lru_cache(maxsize=100_000)
+def runtime_seconds(runtime):
+    """Converts a TXC run time or departure time to whole seconds (cached, as the same values recur throughout a file)"""
+
+    duration = pd.Timedelta(runtime)
+
+    if duration is pd.NaT:
+        raise ValueError(f'Invalid run time: {runtime}')
+
+    return duration.value // 1_000_000_000
+
+
+class StopAlignment:
+    '''
+    The ordered stop rows of one direction of a service, and the row of each stop key.
+
+    Stops are added in the order they are first used by a vehicle journey, after the rows already
+    present, as they would be by an outer merge. The rows of each journey pattern are found once,
+    then reused by all of its vehicle journeys.
+    '''
+
+    def __init__(self, keys=()):
+        self.keys = []
+        self.rows = {}
+        self.pattern_rows = {}
+
+        for key in keys:
+            self.rows.setdefault(key, len(self.keys))
+            self.keys.append(key)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def unique(self):
+        return len(self.rows) == len(self.keys)
+
+    def align(self, keys, pattern=None):
+        """Returns the row of each of a vehicle journey's (distinct) stop keys, adding rows for new stops"""
+
+        if pattern is not None and pattern in self.pattern_rows:
+            return self.pattern_rows[pattern]
+
+        positions = np.empty(len(keys), dtype=np.int64)
+
+        for i, key in enumerate(keys):
+            position = self.rows.get(key)
+            if position is None:
+                position = len(self.keys)
+                self.rows[key] = position
+                self.keys.append(key)
+            positions[i] = position
+
+        if pattern is not None:
+            self.pattern_rows[pattern] = positions
+
+        return positions
+
+
+class CollatedTimetable:
+    '''
+    Collates the vehicle journeys for one direction of a service.
+
+    Vehicle journeys are added as columns, with their values scattered into the rows given by a
+    StopAlignment. This gives the same result as successively outer merging each vehicle journey's
+    timetable into the collated timetable on the key columns: rows for stops not yet in the
+    timetable are added at the end, and gaps are filled with "-". Vehicle journeys matching the
+    stops of the first are added directly until the first merge. The dataframe is only created once
+    all vehicle journeys have been added.
+    '''
+
+    def __init__(self):
+        self.alignment = StopAlignment()
+        self.column_names = []
+        self.columns = []
+        self.merged = False
+        self.pattern_matches = {}
+
+    def add(self, vehicle_journey_code, keys, values, pattern=None):
+        """Adds a vehicle journey's values for its stop keys, optionally identifying the journey pattern they are from"""
+
+        if not len(self.alignment):
+            self.alignment = StopAlignment(keys)
+            positions = np.arange(len(keys))
+
+        elif not self.merged and self.matches(keys, pattern):
+            positions = np.arange(len(keys))
+
+        else:
+            positions = self.merge(keys, pattern)
+            if vehicle_journey_code in self.column_names:
+                # as in a merge, clashing column names are suffixed
+                self.column_names = [f'{name}_x' if name == vehicle_journey_code else name
+                                     for name in self.column_names]
+                vehicle_journey_code = f'{vehicle_journey_code}_y'
+
+        self.column_names.append(vehicle_journey_code)
+        self.columns.append((positions, values))
+
+    def matches(self, keys, pattern=None):
+        """Whether the sequence numbers, stop point refs and common names match the timetable so far"""
+
+        if pattern is not None and pattern in self.pattern_matches:
+            return self.pattern_matches[pattern]
+
+        existing_keys = self.alignment.keys
+        matches = len(keys) == len(existing_keys) and all(
+            key[0] == existing[0] and key[1] == existing[1] and key[4] == existing[4]
+            for key, existing in zip(keys, existing_keys))
+
+        if pattern is not None:
+            self.pattern_matches[pattern] = matches
+
+        return matches
+
+    def merge(self, keys, pattern=None):
+        """Adds any new stop rows to the end of the timetable, returning the row position of each key"""
+
+        if not self.alignment.unique:
+            raise pd.errors.MergeError('Merge keys are not unique in left dataset; not a one-to-many merge')
+
+        self.merged = True
+
+        if pattern is None or pattern not in self.alignment.pattern_rows:
+            if len(set(keys)) != len(keys):
+                return self.merge_repeated(keys)
+
+        return self.alignment.align(keys, pattern)
+
+    def merge_repeated(self, keys):
+        '''
+        Merges keys that repeat within the vehicle journey. Each existing row matching a repeated
+        key is repeated once per match, as it would be in a one to many merge, so existing rows
+        are renumbered.
+        '''
+
+        matches = {}
+        for i, key in enumerate(keys):
+            matches.setdefault(key, []).append(i)
+
+        new_keys = []
+        old_to_new = []
+        positions = np.empty(len(keys), dtype=np.int64)
+
+        for key in self.alignment.keys:
+            rows = []
+            for i in matches.pop(key, [None]):
+                if i is not None:
+                    positions[i] = len(new_keys)
+                rows.append(len(new_keys))
+                new_keys.append(key)
+            old_to_new.append(rows)
+
+        for i, key in enumerate(keys):
+            if key in matches:
+                positions[i] = len(new_keys)
+                new_keys.append(key)
+
+        # repeat the existing columns' values for repeated rows
+        columns = []
+        for column_positions, values in self.columns:
+            new_positions = []
+            new_values = []
+            for position, value in zip(column_positions, values):
+                for new_position in old_to_new[position]:
+                    new_positions.append(new_position)
+                    new_values.append(value)
+            columns.append((np.array(new_positions, dtype=np.int64), new_values))
+
+        self.columns = columns
+        self.alignment = StopAlignment(new_keys)
+
+        return positions
+
+    def to_dataframe(self):
+
+        keys = self.alignment.keys
+
+        if not keys:
+            return pd.DataFrame()
+
+        data = np.empty((len(keys), len(TIMETABLE_KEY_COLUMNS) + len(self.columns)), dtype=object)
+
+        data[:, :len(TIMETABLE_KEY_COLUMNS)] = keys
+
+        if self.merged:
+            data[:, len(TIMETABLE_KEY_COLUMNS):] = "-"
+
+        for column, (positions, values) in enumerate(self.columns, start=len(TIMETABLE_KEY_COLUMNS)):
+            data[positions, column] = values
+
+        if self.merged:
+            # merged timetables have their gaps (and any missing header values) filled with "-"
+            data[pd.isna(data)] = "-"
+            index = np.arange(len(keys))
+        else:
+            index = np.arange(-len(HEADER_KEYS) + 1, len(keys) - len(HEADER_KEYS) + 1)
+
+        return pd.DataFrame(data, columns=TIMETABLE_KEY_COLUMNS + self.column_names, index=index)
+
+
+class JourneyPatternTemplate:
+    '''
+    The parts of a timetable shared by every vehicle journey of a journey pattern: its stop rows,
+    timing link run times and the cumulative time at each stop, in seconds from departure.
+    '''
+
+    def __init__(self, journey_pattern, timing_links, keys):
+        self.journey_pattern = journey_pattern
+        self.direction = journey_pattern.Direction
+        self.keys = HEADER_KEYS + keys
+        self.link_ids = [jptl.id for jptl in timing_links]
+        self.runtimes = np.fromiter((runtime_seconds(jptl.RunTime) for jptl in timing_links), dtype=np.int64,
+                                    count=len(timing_links))
+        self.offsets = np.concatenate(([0], np.cumsum(self.runtimes)))
+
+        # links with no run time take the run time of the vehicle journey's equivalent timing link
+        self.zero_runtime_links = np.flatnonzero(self.runtimes == 0)
+
+    def stop_seconds(self, vj):
+        """Returns the time at each stop of a vehicle journey, in seconds from midnight"""
+
+        departure = runtime_seconds(vj.DepartureTime)
+
+        if len(self.zero_runtime_links) == 0 or vj.VehicleJourneyTimingLink is None:
+            return self.offsets + departure
+
+        vjtl_index = {key.JourneyPatternTimingLinkRef: value for value, key in
+                      enumerate(vj.VehicleJourneyTimingLink)}
+
+        runtimes = self.runtimes.copy()
+        for link in self.zero_runtime_links:
+            runtimes[link] = runtime_seconds(vj.VehicleJourneyTimingLink[vjtl_index[self.link_ids[link]]].RunTime)
+
+        return np.concatenate(([0], np.cumsum(runtimes))) + departure
+
+
+class StopTimes:
+    '''
+    The vehicle journeys of a service in long format, alongside its collated timetables: a trips
+    table with a row per vehicle journey (its journey pattern, route, line, journey code and
+    operating days as a bitmask), a stop times table with a row per stop of each vehicle journey,
+    and a stops table. Trips and stops are keyed by integers from 0, and times are integer
+    seconds since midnight, with the number of days after the departure day in day_shift.
+
+    There is one time at each stop, as in the collated timetables, so arrival and departure are
+    the same.
+    '''
+
+    def __init__(self):
+        self.trips = []
+        self.stop_numbers = {}
+        self.stops = []
+        self.pattern_stops = {}
+        self.stop_times = []
+
+    def add(self, vj, template, header_values, seconds, days_mask):
+        """Adds a vehicle journey, with the header values of its timetable column and its time at each stop"""
+
+        trip = len(self.trips)
+        line, route, journey_code, journey_pattern, _ = header_values
+        self.trips.append((trip, vj.VehicleJourneyCode, template.direction, journey_pattern, route, line,
+                           journey_code, days_mask))
+
+        stops, sequence_numbers = self.template_stops(template)
+        self.stop_times.append((trip, stops, sequence_numbers, seconds))
+
+    def template_stops(self, template):
+        """The stop number and sequence number of each stop of a journey pattern's template, numbering new stops"""
+
+        if id(template) not in self.pattern_stops:
+            keys = template.keys[len(HEADER_KEYS):]
+            for sequence_number, stop_point_ref, latitude, longitude, common_name in keys:
+                if stop_point_ref not in self.stop_numbers:
+                    self.stop_numbers[stop_point_ref] = len(self.stops)
+                    self.stops.append((len(self.stops), stop_point_ref, common_name, latitude, longitude))
+
+            self.pattern_stops[id(template)] = (
+                np.array([self.stop_numbers[key[1]] for key in keys], dtype=np.int32),
+                np.array([key[0] for key in keys], dtype=np.int32))
+
+        return self.pattern_stops[id(template)]
+
+    def to_dataframes(self):
+        """Returns the trips, stop times and stops tables"""
+
+        trips = pd.DataFrame(self.trips, columns=TRIP_COLUMNS)
+        trips = trips.astype({"trip": np.int32, "OperatingDays": np.uint8})
+
+        stops = pd.DataFrame(self.stops, columns=STOP_COLUMNS).astype({"stop": np.int32})
+
+        if not self.stop_times:
+            return trips, pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in
+                                        zip(STOP_TIME_COLUMNS, STOP_TIME_DTYPES)}), stops
+
+        lengths = [len(seconds) for _, _, _, seconds in self.stop_times]
+        seconds = np.concatenate([seconds for _, _, _, seconds in self.stop_times])
+        times = (seconds % SECONDS_PER_DAY).astype(np.int32)
+
+        stop_times = pd.DataFrame({
+            "trip": np.repeat(np.array([trip for trip, _, _, _ in self.stop_times], dtype=np.int32), lengths),
+            "stop_sequence": np.concatenate([np.arange(length, dtype=np.int16) for length in lengths]),
+            "SequenceNumber": np.concatenate([sequence_numbers for _, _, sequence_numbers, _ in self.stop_times]),
+            "stop": np.concatenate([stops for _, stops, _, _ in self.stop_times]),
+            "arrival": times,
+            "departure": times,
+            "day_shift": (seconds // SECONDS_PER_DAY).astype(np.int8),
+        })
+
+        return trips, stop_times, stops
+
+
+class TimetableBuilder:
+    '''
+    Generates the collated outbound and inbound timetables for the vehicle journeys of a service.
+
+    The stops and run times of each journey pattern are resolved once, into a template shared by
+    all of its vehicle journeys, so each vehicle journey only adds its departure time (and any
+    vehicle journey run times) to the template's times before being collated into one table per
+    direction.
+    '''
+
+    def __init__(self, service_object, stop_object, vehicle_journey, journey_pattern_section_object,
+                 journey_pattern_section_index, journey_pattern_index, journey_pattern_list, stop_point_index):
+        self.service_object = service_object
+        self.stop_object = stop_object
+        self.vehicle_journey = vehicle_journey
+        self.journey_pattern_section_object = journey_pattern_section_object
+        self.journey_pattern_section_index = journey_pattern_section_index
+        self.journey_pattern_index = journey_pattern_index
+        self.journey_pattern_list = journey_pattern_list
+        self.stop_point_index = stop_point_index
+        self.templates = {}
+
+    def build(self, stop_times=False):
+        """Returns the collated outbound and inbound timetables, and if stop_times, the trips, stop times and stops
+        tables of the service (see StopTimes)"""
+
+        collated = {'outbound': CollatedTimetable(), 'inbound': CollatedTimetable()}
+        long_format = StopTimes() if stop_times else None
+
+        for vj in self.vehicle_journey.VehicleJourney:
+
+            template = self.template(vj.JourneyPatternRef)
+
+            if template is None:
+                continue
+
+            if template.direction not in collated:
+                print(f'Unknown Direction in vehicle journey:{vj}: {template.direction}')
+                continue
+
+            seconds = template.stop_seconds(vj)
+            times = MINUTE_LABELS[(seconds // 60) % len(MINUTE_LABELS)]
+            header_values = self.header_values(vj, template.journey_pattern)
+
+            collated[template.direction].add(f"{vj.VehicleJourneyCode}", template.keys, header_values + list(times),
+                                             pattern=vj.JourneyPatternRef)
+
+            if long_format is not None:
+                long_format.add(vj, template, header_values, seconds,
+                                operating_days_mask(self.operating_profile_days(vj)))
+
+        timetables = (organise_timetable(collated['outbound'].to_dataframe()),
+                      organise_timetable(collated['inbound'].to_dataframe()))
+
+        if long_format is None:
+            return timetables
+
+        return timetables + (long_format.to_dataframes(),)
+
+    def template(self, journey_pattern_ref):
+        """Returns the (cached) template for a journey pattern, or None if it has no timing links"""
+
+        try:
+            return self.templates[journey_pattern_ref]
+        except KeyError:
+            pass
+
+        journey_pattern = self.journey_pattern_list[self.journey_pattern_index[journey_pattern_ref]]
+        flat_jptl = self.timing_links(journey_pattern)
+
+        if flat_jptl:
+            keys = [self.stop_key(flat_jptl[0].From)] + [self.stop_key(jptl.To) for jptl in flat_jptl]
+            template = JourneyPatternTemplate(journey_pattern, flat_jptl, keys)
+        else:
+            template = None
+
+        self.templates[journey_pattern_ref] = template
+
+        return template
+
+    def timing_links(self, journey_pattern):
+        """Returns the journey pattern timing links of all journey pattern sections of a journey pattern"""
+
+        section_refs = journey_pattern.JourneyPatternSectionRefs
+
+        # can be a single string or a list of strings
+        if not isinstance(section_refs, list):
+            section_refs = [section_refs]
+
+        return [jptl for section_ref in section_refs
+                for jptl in self.journey_pattern_section_object.JourneyPatternSection[
+                    self.journey_pattern_section_index[section_ref]].JourneyPatternTimingLink]
+
+    def stop_key(self, stop):
+        """Returns the sequence number, stop point ref, latitude, longitude and common name of a timing link stop"""
+
+        annotated_stop = self.stop_object.AnnotatedStopPointRef[self.stop_point_index[stop.StopPointRef]]
+
+        if not annotated_stop.Location:
+            latitude = "-"
+            longitude = "-"
+        else:
+            latitude = annotated_stop.Location.Latitude
+            longitude = annotated_stop.Location.Longitude
+
+        return (int(stop.sequence_number), str(stop.StopPointRef), latitude, longitude,
+                str(annotated_stop.CommonName))
+
+    def header_values(self, vj, journey_pattern):
+        """Returns the line, route, journey code, journey pattern and operating days of a vehicle journey"""
+
+        if vj.LineRef[-1] == ":":
+            lineref = vj.LineRef.split(':')[-2]
+        else:
+            lineref = vj.LineRef.split(':')[-1]
+
+        if vj.Operational is None or vj.Operational.TicketMachine is None:
+            journey_code = None
+        else:
+            journey_code = str(vj.Operational.TicketMachine.JourneyCode)
+
+        return [lineref, journey_pattern.RouteRef, journey_code, journey_pattern.id, self.operating_days(vj)]
+
+    def operating_days(self, vj):
+        """Fetch operating profile from either the vehicle journey or service object"""
+
+        days = self.operating_profile_days(vj)
+
+        if days is None and (self.service_object.OperatingProfile is None):
+            return "Error: Check File"
+
+        return timetable_operating_days(days)
+
+    def operating_profile_days(self, vj):
+        """The days of the week (or of bank holiday operation) of the operating profile of the vehicle journey, or
+        else of the service"""
+
+        if vj.OperatingProfile is not None:
+            if vj.OperatingProfile.RegularDayType.DaysOfWeek is not None:
+                days = vj.OperatingProfile.RegularDayType.DaysOfWeek
+            elif vj.OperatingProfile.BankHolidayOperation is not None:
+                days = vj.OperatingProfile.BankHolidayOperation.DaysOfOperation
+            else:
+                days = "Days Not Found"
+
+        elif self.service_object.OperatingProfile is not None:
+            if self.service_object.OperatingProfile.RegularDayType.DaysOfWeek is not None:
+                days = self.service_object.OperatingProfile.RegularDayType.DaysOfWeek
+            elif self.service_object.OperatingProfile.BankHolidayOperation is not None:
+                days = self.service_object.OperatingProfile.BankHolidayOperation.DaysOfOperation
+            else:
+                days = "Days Not Found"
+        else:
+            days = "Days Not Found"
+
+        return days
+
+
+def build_timetables(timetable_args, stop_times=False):
+    '''
+    Builds the collated outbound and inbound timetables for one service, from the arguments of a
+    TimetableBuilder, and if stop_times its long format tables. Returns the timetables, the
+    (trips, stop times, stops) tables or None, and None, or empty timetables, None and the error
+    if they could not be built, so that one service cannot stop the timetables of the others
+    being generated. Defined at module level so it can be run in a process pool.
+    '''
+
+    try:
+        timetables = TimetableBuilder(*timetable_args).build(stop_times)
+    except Exception as e:
+        return pd.DataFrame(), pd.DataFrame(), None, repr(e)
+
+    if not stop_times:
+        return timetables + (None, None)
+
+    return timetables + (None,)
+
+
+def combine_stop_times(services):
+    '''
+    Combines the long format tables of each service, given as (fields, (trips, stop times, stops))
+    where fields are the columns (e.g. ServiceCode) to add to its trips. Trips are numbered across
+    all services, and stops by their StopPointRef, keeping the first name and location found. The
+    text columns of the trips are categorical, as their values repeat for each vehicle journey.
+    '''
+
+    trips = []
+    stop_times = []
+    stops = []
+    stop_numbers = {}
+    trip_offset = 0
+
+    for fields, (service_trips, service_stop_times, service_stops) in services:
+        numbers = np.empty(len(service_stops), dtype=np.int32)
+        new_stops = np.zeros(len(service_stops), dtype=bool)
+
+        for i, stop_point_ref in enumerate(service_stops['StopPointRef']):
+            if stop_point_ref not in stop_numbers:
+                stop_numbers[stop_point_ref] = len(stop_numbers)
+                new_stops[i] = True
+            numbers[i] = stop_numbers[stop_point_ref]
+
+        stops.append(service_stops[new_stops].assign(stop=numbers[new_stops]))
+        trips.append(service_trips.assign(trip=service_trips['trip'] + trip_offset, **fields))
+        stop_times.append(service_stop_times.assign(trip=service_stop_times['trip'] + trip_offset,
+                                                    stop=numbers[service_stop_times['stop'].to_numpy()]))
+        trip_offset += len(service_trips)
+
+    if not trips:
+        return StopTimes().to_dataframes()
+
+    trips = pd.concat(trips, ignore_index=True)
+    trips = trips[[column for column in trips.columns if column not in TRIP_COLUMNS[1:]] + TRIP_COLUMNS[1:]]
+    categories = trips.select_dtypes(object).columns
+    trips[categories] = trips[categories].astype("category")
+
+    return (trips,
+            pd.concat(stop_times, ignore_index=True).astype(dict(zip(STOP_TIME_COLUMNS, STOP_TIME_DTYPES))),
+            pd.concat(stops, ignore_index=True).astype({"stop": np.int32}))
+
+
+# the arguments for each service (and whether to build its long format tables), set before forking a process pool so
+# that the worker processes inherit them rather than each service's objects being pickled and sent to them
+shared_timetable_args = []
+
+
+def build_shared_timetables(row):
+    """Builds the timetables for a row of the shared arguments (see build_timetables)"""
+
+    return build_timetables(*shared_timetable_args[row])
@@ -0,0 +1,252 @@
+#This file contains a builder that populates the TXC dataclasses directly from a parsed xml tree,
+#without first converting the xml into nested dicts and type checking them with dacite
+import typing
+from dataclasses import fields, is_dataclass
+
+try:
+    from BODSDataExtractor.classes import *
+except:
+    from classes import *
+
+
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+
+
+def element_to_dict(element, force_list=()):
+    '''
+    Converts an element into nested dicts, in the same form as xmltodict would (attributes
+    prefixed with "_", text alongside attributes or children under "#text", repeated
+    elements collected into lists, and elements named in force_list always in lists).
+    '''
+
+    item = None
+
+    if element.attrib:
+        item = {f'_{prefixed_name(key, element)}': value for key, value in element.attrib.items()}
+
+    text = [element.text] if element.text else []
+
+    for child in element:
+        if child.tail:
+            text.append(child.tail)
+
+        # skip comments and processing instructions
+        if not isinstance(child.tag, str):
+            continue
+
+        key = prefixed_name(child.tag, child)
+        value = element_to_dict(child, force_list)
+
+        if item is None:
+            item = {}
+
+        if key in item:
+            if isinstance(item[key], list):
+                item[key].append(value)
+            else:
+                item[key] = [item[key], value]
+        elif key in force_list:
+            item[key] = [value]
+        else:
+            item[key] = value
+
+    text = ''.join(text).strip() or None
+
+    if item is None:
+        return text
+
+    if text:
+        item['#text'] = text
+
+    return item
+
+
+def prefixed_name(name, element):
+    """Returns a namespaced tag or attribute name with its prefix as written in the document, rather than its uri"""
+
+    if not name.startswith('{'):
+        return name
+
+    uri, localname = name[1:].split('}', 1)
+
+    if uri == XML_NAMESPACE:
+        return f'xml:{localname}'
+
+    for prefix, namespace in element.nsmap.items():
+        if namespace == uri and prefix is not None:
+            return f'{prefix}:{localname}'
+
+    return localname
+
+
+def element_text(element):
+    """Returns the stripped text of an element, or None if it has none (as xmltodict would)"""
+
+    if element.text is None:
+        return None
+
+    return element.text.strip() or None
+
+
+def is_empty(element):
+    return len(element) == 0 and not element.attrib and element_text(element) is None
+
+
+class TXCObjectBuilder:
+    '''
+    Builds the dataclasses in classes.py directly from lxml elements.
+
+    The fields of each dataclass are read once to make a plan of which child element (or
+    attribute, for fields starting with an underscore) populates which field, and how. Each
+    element is then built by a single pass over its children, with no intermediate dicts.
+    Missing optional fields are set to None, as dacite would.
+    '''
+
+    def __init__(self, namespace=None):
+        self.namespace = namespace
+        self.plans = {}
+
+    def qualify(self, tag):
+        if self.namespace is None:
+            return tag
+
+        return f'{{{self.namespace}}}{tag}'
+
+    def plan(self, data_class):
+        """Returns the (cached) plan of how to populate each field of a dataclass"""
+
+        try:
+            return self.plans[data_class]
+        except KeyError:
+            pass
+
+        type_hints = typing.get_type_hints(data_class)
+        attributes = []
+        children = {}
+        list_fields = []
+
+        for field in fields(data_class):
+            field_type = type_hints[field.name]
+            optional = False
+
+            # unwrap Optional[x]
+            if typing.get_origin(field_type) is typing.Union and type(None) in typing.get_args(field_type):
+                optional = True
+                field_type = [arg for arg in typing.get_args(field_type) if arg is not type(None)][0]
+
+            if field.name.startswith('_'):
+                attributes.append((field.name[1:], field.name))
+                continue
+
+            if field_type is str:
+                kind, item_class = 'text', None
+            elif typing.get_origin(field_type) is typing.Union:
+                # e.g. JourneyPatternSectionRefs, which is a string if it appears once or a list if repeated
+                kind, item_class = 'text_or_list', None
+            elif field_type is dict or typing.get_origin(field_type) is dict:
+                kind, item_class = 'dict', None
+            elif typing.get_origin(field_type) is list:
+                kind, item_class = 'list', typing.get_args(field_type)[0]
+                list_fields.append((field.name, optional))
+            elif is_dataclass(field_type):
+                kind, item_class = 'object', field_type
+            else:
+                kind, item_class = 'text', None
+
+            children[self.qualify(field.name)] = (field.name, kind, item_class)
+
+        plan = ([field.name for field in fields(data_class)], attributes, children, list_fields)
+        self.plans[data_class] = plan
+
+        return plan
+
+    def build(self, data_class, element):
+        """Populates a dataclass from an element, returning None for an empty element"""
+
+        if element is None or is_empty(element):
+            return None
+
+        values = self.start_build(data_class, element)
+        self.add_children(data_class, values, element)
+
+        return self.finish_build(data_class, values)
+
+    def start_build(self, data_class, element):
+        """Starts populating a dataclass from the attributes of an element, returning the values of its fields for its
+        children to be added to with add_children (all at once, or as they are read when a file is streamed)"""
+
+        field_names, attributes, _, list_fields = self.plan(data_class)
+
+        values = dict.fromkeys(field_names)
+
+        for name, _ in list_fields:
+            values[name] = []
+
+        for attribute, name in attributes:
+            values[name] = element.get(attribute)
+
+        return values
+
+    def add_children(self, data_class, values, elements):
+        """Populates the fields of a dataclass that each child element belongs to"""
+
+        children = self.plan(data_class)[2]
+
+        for child in elements:
+            try:
+                name, kind, item_class = children[child.tag]
+            except KeyError:
+                continue
+
+            if kind == 'text':
+                values[name] = element_text(child)
+            elif kind == 'list':
+                item = self.build(item_class, child)
+                if item is not None:
+                    values[name].append(item)
+            elif kind == 'object':
+                values[name] = self.build(item_class, child)
+            elif kind == 'dict':
+                values[name] = element_to_dict(child)
+            elif values[name] is None:
+                values[name] = element_text(child)
+            elif isinstance(values[name], list):
+                values[name].append(element_text(child))
+            else:
+                values[name] = [values[name], element_text(child)]
+
+    def finish_build(self, data_class, values):
+        """Makes the dataclass from the values of its fields"""
+
+        # optional lists are None rather than empty, as they would be from dacite
+        for name, optional in self.plan(data_class)[3]:
+            if optional and not values[name]:
+                values[name] = None
+
+        return data_class(**values)
+
+    def build_journey_pattern_sections(self, element):
+        return self.build(JourneyPatternSections, element)
+
+    def build_vehicle_journeys(self, element, keep=None):
+        """Builds the vehicle journeys, or only those whose element keep returns True for"""
+
+        if keep is None:
+            return self.build(VehicleJourneys, element)
+
+        vehicle_journeys = [self.build(VehicleJourney, vehicle_journey) for vehicle_journey in
+                            element.iterchildren(self.qualify('VehicleJourney')) if keep(vehicle_journey)]
+
+        return VehicleJourneys(VehicleJourney=[vehicle_journey for vehicle_journey in vehicle_journeys
+                                               if vehicle_journey is not None])
+
+    def build_service(self, element, keep=None):
+        """Builds the (first) service within a Services element, or the first whose element keep returns True for"""
+
+        if keep is None:
+            return self.build(Service, element.find(self.qualify('Service')))
+
+        return self.build(Service, next(filter(keep, element.iterchildren(self.qualify('Service'))), None))
+
+    def build_stop_points(self, element):
+        return self.build(StopPoints, element)